@@ -7,10 +7,13 @@ with open(os.path.join(ABOUT_DIR,"version.txt")) as f:
     __version__ = f.read().strip()
 
 # Load the module contents from the python file txt_to_html
-from .txt_to_html import parse_txt, DOC_STRING
+from .txt_to_html import parse_txt, parse_string, parse_bytes, extract_metadata, RenderCache, Trace, MemoryReport, Renderer, RENDERERS, DOC_STRING
+from .txt_to_html import parse_txt_async, parse_string_async, convert_many
 
 # Assign the documentation for this package from that file.
 __doc__ = DOC_STRING
 
-# Only encourage usage of the "parse_txt" function from outside this package.
-__all__ = [parse_txt]
+# Only encourage usage of the conversion functions from outside this package.
+__all__ = ["parse_txt", "parse_string", "parse_bytes", "extract_metadata", "RenderCache",
+           "Trace", "MemoryReport", "Renderer", "parse_txt_async", "parse_string_async",
+           "convert_many"]
@@ -6,7 +6,7 @@ def print_help_message():
     print('''
 
 USAGE:
-  python -m txt_to_html <source text file> [--online] [--no-appendix] [--no-show] [--no-justify] [output folder]
+  python -m txt_to_html <source text file> [--online] [--no-appendix] [--no-show] [--no-justify] [--recover] [--metadata] [--trace] [--minify] [--gzip[=<level>]] [--memory-report] [--toc] [--targets=<target>,...] [--pages[=<bytes>]] [output folder]
 
 This outputs a <source text file>.html ready to be viewed in a browser.
 
@@ -20,6 +20,24 @@ If the `--no-show` argument is given, the resulting HTML file is *not* opened in
 
 If the `--no-justify` argument is given, the resulting HTML file has body text which will *not* be justified (layout that normalizes line width).
 
+If the `--recover` argument is given, syntax that is never closed is kept as plain text and all such errors are reported (instead of stopping at the first).
+
+If the `--metadata` argument is given, no HTML is produced. Instead the title, description, authors, headers, and citation keys of the document are printed as JSON.
+
+If the `--trace` argument is given, a timeline of the conversion is saved next to the output as <source text file>.trace.json (Chrome Trace Event format, viewable in Perfetto).
+
+If the `--minify` argument is given, comments and indentation are removed from the resulting HTML file (preformatted text, scripts, and math are kept intact).
+
+If the `--gzip` argument is given, a compressed copy of the HTML file is also saved as <source text file>.html.gz, at the given compression level (1 through 9, default 9) for `--gzip=<level>`.
+
+If the `--memory-report` argument is given, the peak memory, net memory allocated, and top allocating lines of every stage of the conversion are printed, and saved as <source text file>.memory.json next to the output.
+
+If the `--toc` argument is given, a table of contents linking every title and header is placed at the beginning of the document.
+
+If the `--targets=<target>,...` argument is given, the document is parsed once and saved for every target, any of "html", "text" (plain text, saved as <source text file>.text), and "json" (the front matter, headers, and tree of the body, saved as <source text file>.json).
+
+If the `--pages` argument is given, the HTML document is split into linked pages at every top-level title and new page, saved as <source text file>.html, <source text file>.2.html, and so on. For `--pages=<bytes>`, pages are instead split at headers to hold about that many bytes of HTML each (new pages still start a page).
+
 If the `[output directory]` argument is given, output file is saved in that directory, which *must* already exist.
     ''')
 
@@ -34,6 +52,16 @@ use_local = True
 no_appendix = False
 no_show = False
 no_justify = False
+recover = False
+metadata = False
+trace = False
+minify = False
+compress_level = None
+memory_report = False
+toc = False
+targets = None
+pages = False
+page_size = None
 output_folder = ""
 # Get (if given) the command line arguments (output folder, online)
 if (len(sys.argv) >= 3):
@@ -49,6 +77,37 @@ if (len(sys.argv) >= 3):
     # Check for "justify"
     no_justify = "--no-justify" in sys.argv
     if no_justify: sys.argv.remove("--no-justify")
+    # Check for "recover"
+    recover = "--recover" in sys.argv
+    if recover: sys.argv.remove("--recover")
+    # Check for "metadata"
+    metadata = "--metadata" in sys.argv
+    if metadata: sys.argv.remove("--metadata")
+    # Check for "trace"
+    trace = "--trace" in sys.argv
+    if trace: sys.argv.remove("--trace")
+    # Check for "minify"
+    minify = "--minify" in sys.argv
+    if minify: sys.argv.remove("--minify")
+    # Check for "gzip" (with an optional compression level)
+    for arg in [a for a in sys.argv if (a == "--gzip") or a.startswith("--gzip=")]:
+        compress_level = int(arg.partition("=")[2] or 9)
+        sys.argv.remove(arg)
+    # Check for "memory report"
+    memory_report = "--memory-report" in sys.argv
+    if memory_report: sys.argv.remove("--memory-report")
+    # Check for "table of contents"
+    toc = "--toc" in sys.argv
+    if toc: sys.argv.remove("--toc")
+    # Check for "targets" (a comma separated list)
+    for arg in [a for a in sys.argv if a.startswith("--targets=")]:
+        targets = arg.partition("=")[2].split(",")
+        sys.argv.remove(arg)
+    # Check for "pages" (with an optional number of bytes per page)
+    for arg in [a for a in sys.argv if (a == "--pages") or a.startswith("--pages=")]:
+        pages = True
+        page_size = int(arg.partition("=")[2]) if ("=" in arg) else None
+        sys.argv.remove(arg)
     # Check for an output folder
     if len(sys.argv) >= 3:
         output_folder = sys.argv[-1]
@@ -58,10 +117,32 @@ path = os.path.abspath(sys.argv[1])
 
 
 
-from txt_to_html import parse_txt
+# Only print the metadata of the file if that was requested.
+if metadata:
+    import json
+    from txt_to_html import extract_metadata
+    print(json.dumps(extract_metadata(path), indent=2))
+    exit()
+
+from txt_to_html import parse_txt, Trace, MemoryReport
+timeline = Trace() if trace else None
+memory = MemoryReport() if memory_report else None
 parse_txt(path, output_folder, use_local=use_local,
           justify=(not no_justify), show=(not no_show),
-          appendix=(not no_appendix))
+          appendix=(not no_appendix), errors=([] if recover else None),
+          trace=timeline, minify=minify, compress_level=compress_level,
+          memory=memory, toc=toc, targets=targets, pages=pages, page_size=page_size)
+if trace:
+    trace_path = os.path.join(os.path.abspath(output_folder), os.path.basename(path) + ".trace.json")
+    timeline.save(trace_path)
+    print(f"Saved trace in '{trace_path}'.")
+if memory_report:
+    memory_path = os.path.join(os.path.abspath(output_folder), os.path.basename(path) + ".memory.json")
+    memory.save(memory_path)
+    print()
+    print(memory.table())
+    print()
+    print(f"Saved memory report in '{memory_path}'.")
 
 
 # import pprofile
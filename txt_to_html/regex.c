@@ -26,7 +26,19 @@
 //                      If there is no match this value is -1.
 //     (int *) end -- The (pass by reference) end (noninclusive) of the
 //                    first match. If *start is -1, contains error code.
-// 
+//
+//  All nonoverlapping matches (leftmost, then longest) are found by:
+//
+//   void matcha(regex, string, n, starts, ends, lines)
+//   void fmatcha(regex, path, n, starts, ends, lines, min_ascii_ratio)
+//     (long *) n -- The (pass by reference) number of matches found, or
+//                   -1 for a regex error (code in "(*ends)[0]"), -2 for
+//                   an empty string (or unreadable file), -3 for a file
+//                   with fewer than "min_ascii_ratio" ASCII characters.
+//     (long **) starts, ends, lines -- The (pass by reference) arrays of
+//                   starts, ends, and (1-indexed) lines of the ends of
+//                   all matches. These must be freed with `free_matches`.
+//
 // 
 // ERROR CODES
 //  These codes are returned in "end" when "start<0".
@@ -880,48 +892,194 @@ void match(const char * regex, const char * string, int * start, int * end) {
   return;
 } 
 
-// Find all nonoverlapping matches of a regular expression in a string.
-// Return arrays of the starts and ends of matches.
-void matcha(const char * regex, const char * string,
-            int * n, int ** starts, int ** ends) {
+// ___________________________________________________________________
+//                  Finding all matches
+//
+// `matcha`, `fmatcha`, and `pfmatcha` find all nonoverlapping matches
+// of a regular expression, leftmost first and then longest (the same
+// matches as most regular expression libraries). They share one search
+// (`_search`) that simulates all active tokens together (as `match`
+// does) and tracks the start of the match that led to each token. The
+// first match found becomes a candidate, tokens of matches that start
+// after the candidate are dropped, and the candidate is extended for as
+// long as a token of a match with the same (or an earlier) start is
+// active. The candidate is then recorded and the search starts over at
+// its end (reading those characters again), so a token of an earlier
+// match can never hide the start of a later one. Only regular
+// expressions that begin with ".*" start over (others find at most one
+// match), and an empty match can not follow an empty match at the same
+// position. All indices are "long", so files larger than 2GB work.
+//
+// `pfmatcha` splits a file into one chunk per thread, and each thread
+// searches its chunk as if a match had just ended at its beginning. It
+// only records matches that start inside its chunk, and it reads past
+// the end of the chunk (for at least "overlap" bytes) until no match
+// that starts inside the chunk can still be found. If the serial search
+// has no match that starts in one chunk and ends in the next, it finds
+// the same matches in the next chunk as the thread that searched it
+// (the tokens it holds that started earlier never finish a match). The
+// chunks are merged in order, and a chunk that does begin inside the
+// last merged match is used from the match of that chunk that ends
+// where the merged one does (both searches start over there), or it is
+// searched again (serially) starting from that end. The result is
+// always the same as `fmatcha`. Only regular expressions that begin
+// with ".*" are split, and files smaller than two MIN_CHUNK_SIZE chunks
+// are not split.
+//
+// The ratio of ASCII characters is checked for every prefix of a file
+// with at least MIN_SAMPLE_SIZE bytes (a file is rejected when any
+// prefix has too few), with "min_ascii_ratio" rounded to a multiple of
+// 1 / ASCII_RATIO_SCALE so that the chunks of `pfmatcha` are checked
+// with exact integer arithmetic.
+//
+//   void matcha(regex, string, n, starts, ends, lines)
+//   void fmatcha(regex, path, n, starts, ends, lines, min_ascii_ratio)
+//   void pfmatcha(regex, path, n, starts, ends, lines, min_ascii_ratio,
+//                 n_threads, overlap)
+//     (long *) n -- The (pass by reference) number of matches found
+//                   (see the description at the top of this file).
+//     (long **) starts, ends, lines -- The (pass by reference) arrays
+//                   of matches, where "lines" holds the (1-indexed)
+//                   line that each match ends on (one more than the
+//                   number of new lines before its end).
+//     (int) n_threads -- The number of threads used by `pfmatcha`.
+//     (long) overlap -- The minimum number of bytes each thread reads
+//                   past the end of its chunk.
+//
+//   void utf8_char_offsets(buffer, n, offsets)
+//     Convert "n" byte offsets (in increasing order) into the UTF-8
+//     text in "buffer" to character offsets, in place.
+//
+//   void utf8_char_map(buffer, n_bytes, offsets)
+//     Set "offsets[b]" (for b in [0, n_bytes]) to the number of
+//     characters that start before byte "b".
+//
+//   void utf8_byte_map(buffer, n_bytes, offsets)
+//     Set "offsets[k]" to the byte offset of character "k" (the last
+//     element, after all characters, is "n_bytes").
 
-  // Check for an empty string.
-  if (string[0] == '\0') {
-    (*n) = -2;
-    return;
+#include <string.h>  // memset, strlen, memcpy
+#include <limits.h>  // LONG_MAX
+#include <pthread.h> // pthread_t, pthread_mutex_t
+
+#define SEARCH_END 256
+//      ^^ character value used for the end of the string (not a char)
+#define CHUNK_BUFFER_SIZE 1048576
+//      ^^ 2^20 = 1MB = 1048576 bytes read at a time by each thread
+#define MIN_CHUNK_SIZE 65536
+//      ^^ minimum number of bytes in a chunk (smaller files are not split)
+#define ASCII_RATIO_SCALE 65536
+//      ^^ "min_ascii_ratio" is used as a multiple of 1 / ASCII_RATIO_SCALE
+
+// The work and results of one search for all matches.
+typedef struct {
+  const char * regex; // regular expression
+  const char * string; // string to search (NULL to read the file at "path")
+  const char * path; // path to the file
+  long size; // number of bytes in the string (or file)
+  long buffer_size; // number of bytes read from the file at a time
+  long begin; // index where the search begins (as if a match ended there)
+  int empty_ok; // 1 if an empty match can be found at "begin"
+  long split; // only matches that start before "split" are recorded
+  long window; // index that is always read before stopping
+  long min_ascii; // minimum ratio of ASCII bytes (times ASCII_RATIO_SCALE)
+  int checked; // 1 if "min_ascii" can be checked while reading ("begin" is 0)
+  long n; // number of matches (negative for errors, as in `fmatcha`)
+  long * starts; long * ends; long * lines; // matches ("lines" holds the
+                                            // new lines in [begin, end))
+  long s_found; // allocated size of the match arrays
+  long newlines; // number of new lines in [begin, split)
+  long ascii; // number of ASCII bytes in [begin, split)
+  long ascii_low; // lowest "ascii * ASCII_RATIO_SCALE - min_ascii * bytes"
+                  // of a prefix that ends in [begin, split)
+} Search;
+
+// Append a match to arrays of matches (of allocated size "s_found").
+// The three arrays share one allocation that begins at "starts".
+static void _append_match(long ** starts, long ** ends, long ** lines, long n_found,
+                          long * s_found, long start, long end, long line) {
+  if (n_found >= (*s_found)) {
+    if ((*s_found) == 0) (*s_found) = INITIAL_FOUND_SIZE;
+    else (*s_found) = 2*(*s_found);
+    long * new_starts = malloc(3 * (*s_found) * sizeof(long));
+    long * new_ends = new_starts + (*s_found);
+    long * new_lines = new_ends + (*s_found);
+    for (long index = 0; index < n_found; index++) {
+      new_starts[index] = (*starts)[index];
+      new_ends[index] = (*ends)[index];
+      new_lines[index] = (*lines)[index];
+    }
+    if ((*starts) != NULL) free(*starts);
+    (*starts) = new_starts;
+    (*ends) = new_ends;
+    (*lines) = new_lines;
   }
+  (*starts)[n_found] = start;
+  (*ends)[n_found] = end;
+  (*lines)[n_found] = line;
+}
+
+// Find all nonoverlapping matches that start in [begin, split) (the
+// thread function for `pfmatcha`, also used by `matcha` and `fmatcha`).
+static void * _search(void * arg) {
+  Search * s = (Search *) arg;
+  s->n = 0;
+  s->starts = NULL;
+  s->ends = NULL;
+  s->lines = NULL;
+  s->s_found = 0;
+  s->newlines = 0;
+  s->ascii = 0;
+  s->ascii_low = LONG_MAX;
 
   // Count the number of tokens and groups in this regular expression.
-  (*n) = -1;
   int n_tokens, n_groups;
-  _count(regex, &n_tokens, &n_groups);
+  _count(s->regex, &n_tokens, &n_groups);
   // Error mode, fewer than one token (no possible match).
   if (n_tokens <= 0) {
-    (*starts) = malloc(2 * sizeof(int));
-    (*ends) = (*starts) + 1;
+    s->n = -1;
+    s->starts = malloc(2 * sizeof(long));
+    s->ends = s->starts + 1;
     // Set the error flag and return.
     if (n_tokens == 0) {
-      (*starts)[0] = EXIT_TOKEN;
-      (*ends)[0] = REGEX_NO_TOKENS_ERROR;
+      s->starts[0] = EXIT_TOKEN;
+      s->ends[0] = REGEX_NO_TOKENS_ERROR;
     } else {
-      (*starts)[0] = n_tokens;
-      (*ends)[0] = n_groups;
+      s->starts[0] = n_tokens;
+      s->ends[0] = n_groups;
     }
-    // WARNING: returning pointers to allocated memory for two integers!
-    return;
+    return NULL;
+  }
+
+  // Open the file (a string is used directly as the buffer).
+  FILE * file = NULL;
+  char * file_buff = NULL;
+  const char * buffer = s->string; // characters [buffer_begin, buffer_begin+buffered)
+  long buffer_begin = 0; // index of the first character in the buffer
+  long buffered = s->size; // number of characters in the buffer
+  if (s->string == NULL) {
+    file = fopen(s->path, "r");
+    if (file == NULL) {
+      s->n = -2;
+      return NULL;
+    }
+    file_buff = malloc(sizeof(char)*s->buffer_size);
+    buffer = file_buff;
+    buffered = 0;
   }
 
-  // Set there to be 0 matches, initially.
-  (*n) = 0;
   // Initialize storage for tracking the current active tokens and
   // where to jump based on the string being parsed.
-  const int mem_bytes = ((5*n_tokens+1)*sizeof(int) + (4*n_tokens+2)*sizeof(char));
-  int * jumps = malloc(mem_bytes); // jump-to location after success
+  const int mem_bytes = (2*n_tokens*sizeof(long) + (4*n_tokens+1)*sizeof(int) +
+                         (4*n_tokens+2)*sizeof(char));
+  long * memory = malloc(mem_bytes); // all memory for the tables below
+  long * acs = memory; // match start index of tokens in current stack
+  long * ans = acs + n_tokens; // match start index of tokens in next stack
+  int * jumps = (int*) (ans + n_tokens); // jump-to location after success
   int * jumpf = jumps + n_tokens; // jump-to location after failure
-  int * active = jumpf + n_tokens; // presently active tokens in regex
-  int * cstack = active + n_tokens + 1; // current stack of active tokens
+  int * cstack = jumpf + n_tokens; // current stack of active tokens
   int * nstack = cstack + n_tokens; // next stack of active tokens
-  char * tokens = (char*) (nstack + n_tokens); // regex index of each token (character)
+  char * tokens = (char*) (nstack + n_tokens + 1); // regex index of each token (character)
   char * jumpi = tokens + n_tokens + 1; // immediately check next on failure
   char * incs = jumpi + n_tokens; // token flags for "in current stack"
   char * inns = incs + n_tokens; // token flags for "in next stack"
@@ -931,71 +1089,111 @@ void matcha(const char * regex, const char * string,
 
   // Determine the jump-to tokens upon successful match and failed
   // match at each token in the regular expression.
-  _set_jump(regex, n_tokens, n_groups, tokens, jumps, jumpf, jumpi);
+  _set_jump(s->regex, n_tokens, n_groups, tokens, jumps, jumpf, jumpi);
   // Set all tokens to be inactive, convert ? to * for simplicity.
-  active[n_tokens] = EXIT_TOKEN;
   for (int j = 0; j < n_tokens; j++) {
     // convert both "special tokens" to * for speed, exclude all
     // tokens with jumpi = 1 because those are inside token sets
     if ((! jumpi[j]) && ((tokens[j] == '?') || (tokens[j] == '|')))
       tokens[j] = '*';
-    active[j] = EXIT_TOKEN; // token is inactive
+    acs[j] = EXIT_TOKEN; // token is inactive
+    ans[j] = EXIT_TOKEN; // token is inactive
     incs[j] = 0; // token is not in current stack
     inns[j] = 0; // token is not in next stack
   }
+  // The first token is a leading repetition (its start moves forward).
+  const int leading = (tokens[0] == '*') && (! jumpi[0]);
+  // The search starts over after every match (the regex begins with ".*").
+  const int restarts = (s->regex[0] == '.') && (s->regex[1] == '*');
 
   // Set the current index in the file.
-  int i = 0; // current index in file
-  int c = string[i]; // get current character in file
+  long i = s->begin; // current index in file
+  int c; // current character in file
+  long newlines = 0; // number of new lines in [begin, i)
+  long read_to = s->begin; // index of the first character not read yet
+  long ascii = 0; // number of ASCII characters in [begin, read_to)
+  long restart = s->begin; // index where the search last started over
+  int empty_ok = s->empty_ok; // 1 if an empty match can be found at "restart"
   int ics = 0; // index in current stack
   int ins = -1; // index in next stack
   int dest; // index of next token (for jump)
   void * temp; // temporary pointer (used for transferring nstack to cstack)
   cstack[ics] = 0; // set the first element in stack to '0'
-  active[0] = 0; // set the start index of the first token
+  acs[0] = i; // set the start index of the first token
   incs[0] = 1; // the first token is in the current stack
+  long found_start = EXIT_TOKEN; // start of the candidate match
+  long found_end = EXIT_TOKEN; // end of the candidate match
+  long found_newlines = 0; // number of new lines in [begin, found_end)
 
-  // Initialize to "no match".
-  (*starts) = NULL;
-  (*ends) = NULL;
-  int n_found = 0; // number found
-  int s_found = 0; // size of "found" arrays
+  // Get the character at index "i" (reading the file where needed).
+  #define SEARCH_CHARACTER \
+    if (i >= s->size) { \
+      c = SEARCH_END; \
+    } else { \
+      if ((i < buffer_begin) || (i >= buffer_begin + buffered)) { \
+        buffer_begin = i; \
+        fseek(file, buffer_begin, SEEK_SET); \
+        buffered = fread(file_buff, sizeof(char), s->buffer_size, file); \
+      } \
+      c = (i < buffer_begin + buffered) ? buffer[i - buffer_begin] : SEARCH_END; \
+    }
 
   // Define an in-line substitution that will be used repeatedly in
-  // a following while loop.
-  #define MATCHA_STACK_NEXT_TOKEN(stack, si, in_stack) \
-    if ((dest >= 0) && (val >= active[dest])) { \
+  // a following while loop. A match becomes the candidate when it
+  // starts earlier than the candidate, or starts with it and is longer.
+  #define SEARCH_STACK_NEXT_TOKEN(stack, si, in_stack, act) \
+    if (dest >= 0) { \
       if (dest == n_tokens) { \
-        (*n)++; \
-        if (n_found >= s_found) { \
-          if (s_found == 0) s_found = INITIAL_FOUND_SIZE; \
-          else s_found = 2*s_found; \
-          int * new_starts = malloc(3 * s_found * sizeof(int)); \
-          int * new_ends = new_starts + s_found; \
-          for (int index = 0; index < n_found; index++)      { \
-            new_starts[index] = (*starts)[index]; \
-            new_ends[index] = (*ends)[index]; \
-          } \
-          if ((*starts) != NULL) free(*starts); \
-          (*starts) = new_starts; \
-          (*ends) = new_ends; \
+        const long end = (((jumpi[j]) || (ct != '*')) ? i+1 : i); \
+        if (((end > val) || (val > restart) || (empty_ok)) && \
+            ((found_start == EXIT_TOKEN) || (val < found_start) || \
+             ((val == found_start) && (end > found_end)))) { \
+          found_start = val; \
+          found_end = end; \
+          found_newlines = newlines + ((end > i) && (c == '\n')); \
         } \
-        (*starts)[n_found] = val; \
-        (*ends)[n_found] = (((jumpi[j]) || (ct != '*')) ? i+1 : i); \
-        n_found++; \
-      } else { \
-        if (in_stack[dest] == 0) { \
-          si++; \
-          stack[si] = dest; \
-          in_stack[dest] = 1; \
-        } \
-        active[dest] = val; \
+      } else if (in_stack[dest] == 0) { \
+        si++; \
+        stack[si] = dest; \
+        in_stack[dest] = 1; \
+        act[dest] = val; \
+      } else if (val < act[dest]) { \
+        act[dest] = val; \
       } \
-    }                                
+    }
 
-  // Start searching for a regular expression match. (the character
-  // 'c' is checked for null value at the end of the loop.
-  do {
+  // Start searching for a regular expression match.
+  while (1) {
+    if (i == s->split) {
+      s->newlines = newlines;
+      if (read_to == i) s->ascii = ascii;
+    }
+    // After the window, stop once no match that starts before "split"
+    // can still be found.
+    if ((i >= s->window) && ((found_start == EXIT_TOKEN) || (found_start >= s->split))) {
+      int active = 0;
+      for (int k = 0; k <= ics; k++)
+        if (((cstack[k] != 0) || (! leading)) && (acs[cstack[k]] < s->split)) {
+          active = 1;
+          break;
+        }
+      if (! active) break;
+    }
+    SEARCH_CHARACTER;
+    // Count the ASCII characters of every prefix the first time it is read.
+    if ((i >= read_to) && (c != SEARCH_END)) {
+      read_to = i+1;
+      if ((c > 0) && (c < 128)) ascii++;
+      if ((s->min_ascii > 0) && (i < s->split) && (read_to >= MIN_SAMPLE_SIZE)) {
+        const long low = ascii*ASCII_RATIO_SCALE - s->min_ascii*read_to;
+        if (low < s->ascii_low) s->ascii_low = low;
+        // Stop reading a file that is not ASCII.
+        if ((s->checked) && (low < 0)) {
+          s->n = -3;
+          break;
+        }
+      }
+    }
     // Continue popping active elements from the current stack and
     // checking them for a match and jump conditions, add next tokens
     // to the next stack.
@@ -1006,28 +1204,31 @@ void matcha(const char * regex, const char * string,
       incs[j] = 0;
       // Get the token and the "match start index" for the match that led here.
       const char ct = tokens[j];
-      int val = active[j];
+      long val = acs[j];
+      // Ignore leading tokens where possible.
+      if ((j == 0) && (leading)) val = i;
+      // Drop tokens of matches that start after the candidate.
+      if ((found_start != EXIT_TOKEN) && (val > found_start)) continue;
       // If this is a special character, add its tokens immediately to
       // the current stack (to be checked before next charactrer).
       if ((ct == '*') && (! jumpi[j])) {
-        if (j == 0) val = i; // ignore leading tokens where possible
       dest = jumps[j];
-      MATCHA_STACK_NEXT_TOKEN(cstack, ics, incs);
+      SEARCH_STACK_NEXT_TOKEN(cstack, ics, incs, acs);
       dest = jumpf[j];
-      MATCHA_STACK_NEXT_TOKEN(cstack, ics, incs);
+      SEARCH_STACK_NEXT_TOKEN(cstack, ics, incs, acs);
       // Check to see if this token matches the current character.
-      } else if ((c == ct) || ((ct == '.') && (! jumpi[j]) && (c != '\0'))) {
+      } else if ((c == ct) || ((ct == '.') && (! jumpi[j]) && (c != SEARCH_END))) {
       dest = jumps[j];
-      MATCHA_STACK_NEXT_TOKEN(nstack, ins, inns);
+      SEARCH_STACK_NEXT_TOKEN(nstack, ins, inns, ans);
       // This token did not match, trigger a jump fail.
       } else {
       dest = jumpf[j];
       // jump immediately on fail if this is not the last token in a token set
-      if (jumpi[j] == 1) { 
-        MATCHA_STACK_NEXT_TOKEN(cstack, ics, incs);
+      if (jumpi[j] == 1) {
+        SEARCH_STACK_NEXT_TOKEN(cstack, ics, incs, acs);
       // otherwise, put into the "next" stack
-      } else { 
-        MATCHA_STACK_NEXT_TOKEN(nstack, ins, inns);
+      } else {
+        SEARCH_STACK_NEXT_TOKEN(nstack, ins, inns, ans);
       }
       }
     }
@@ -1041,280 +1242,590 @@ void matcha(const char * regex, const char * string,
     temp = (void*) incs; // store "in current stack"
     incs = inns; // set "in current stack"
     inns = (char*) temp; // set "in next stack"
+    //   switch match start indices of tokens in the stacks
+    temp = (void*) acs; // store "current starts"
+    acs = ans; // set "current starts"
+    ans = (long*) temp; // set "next starts"
     ins = -1; // reset the count of elements in "next stack"
 
-    // If the just-parsed character was the end of the string, then break.
-    if (c == '\0') {
-      break;
-    // Get the next character in the string (assuming it's null terminated).
-    } else {
-      i++;
-      c = string[i];
-    }
-  } while (ics >= 0) ; // loop until the active stack is empty
-  free(jumps); // free all memory that was allocated
-  // Check for errors, deallocate 'ends', 'starts', and 'lines' if there are errors.
-  if ((*n) < 0) {
-    if ((*starts) != NULL) free(*starts);
-  // Re-allocate the output arrays to be the exact size of the number of matches.
-  } else {
-    if (n_found < s_found) {
-      s_found = n_found;
-      int * new_starts = malloc(3 * s_found * sizeof(int));
-      int * new_ends = new_starts + s_found;
-      for (int index = 0; index < n_found; index++) {
-        new_starts[index] = (*starts)[index];
-        new_ends[index] = (*ends)[index];
+    // Record the candidate once no token of a match that starts with
+    // (or before) it is active, then start over at its end.
+    if (found_start != EXIT_TOKEN) {
+      int active = 0;
+      if (c != SEARCH_END)
+        for (int k = 0; k <= ics; k++)
+          if (((cstack[k] != 0) || (! leading)) && (acs[cstack[k]] <= found_start)) {
+            active = 1;
+            break;
+          }
+      if (! active) {
+        if (found_start < s->split) {
+          _append_match(&(s->starts), &(s->ends), &(s->lines), s->n,
+                        &(s->s_found), found_start, found_end, found_newlines);
+          s->n++;
+        }
+        empty_ok = (found_end > found_start);
+        restart = found_end;
+        i = found_end;
+        newlines = found_newlines;
+        found_start = EXIT_TOKEN;
+        for (int k = 0; k <= ics; k++) incs[cstack[k]] = 0;
+        ics = -1;
+        if (! restarts) break;
+        ics = 0;
+        cstack[ics] = 0;
+        acs[0] = i;
+        incs[0] = 1;
+        continue;
       }
-      if ((*starts) != NULL) free(*starts);
-      (*starts) = new_starts;
-      (*ends) = new_ends;
     }
+    // If the just-parsed character was the end of the string (or no
+    // token is active), then break.
+    if ((c == SEARCH_END) || (ics < 0)) break;
+    // Get the next character in the string.
+    if (c == '\n') newlines++;
+    i++;
   }
-  return;
+  free(memory); // free all memory that was allocated
+  if (file != NULL) {
+    if (ferror(file)) s->n = -2; // check for error while reading file
+    fclose(file);
+    free(file_buff);
+  }
+  // Deallocate the matches if there are errors.
+  if ((s->n < 0) && (s->starts != NULL)) {
+    free(s->starts);
+    s->starts = NULL;
+  }
+  return NULL;
+}
+
+// Copy the results of a whole search into the output arguments (lines
+// are converted from new line counts to 1-indexed line numbers).
+static void _search_results(Search * s, long * n, long ** starts,
+                            long ** ends, long ** lines) {
+  (*n) = s->n;
+  (*starts) = s->starts;
+  (*ends) = s->ends;
+  (*lines) = s->lines;
+  for (long k = 0; k < s->n; k++) (*lines)[k]++;
 }
 
+// Find all nonoverlapping matches of a regular expression in a string.
+// Return arrays of the starts, ends, and lines of matches.
+void matcha(const char * regex, const char * string,
+            long * n, long ** starts, long ** ends, long ** lines) {
+  // Check for an empty string.
+  if (string[0] == '\0') {
+    (*n) = -2;
+    return;
+  }
+  Search s;
+  memset(&s, 0, sizeof(Search));
+  s.regex = regex;
+  s.string = string;
+  s.size = strlen(string);
+  s.empty_ok = 1;
+  s.split = LONG_MAX;
+  s.window = LONG_MAX;
+  s.checked = 1;
+  _search((void *) &s);
+  _search_results(&s, n, starts, ends, lines);
+}
 
+// Get the size of a file in bytes (-1 if it can not be opened).
+static long _file_size(const char * path) {
+  FILE * file = fopen(path, "r");
+  if (file == NULL) return -1;
+  fseek(file, 0, SEEK_END);
+  const long file_size = ftell(file);
+  fclose(file);
+  return file_size;
+}
 
 // Find all nonoverlapping matches of a regular expression in a file
-// at a given path. Return arrays of the starts and ends of matches.
+// at a given path. Return arrays of the starts, ends, and lines of matches.
 void fmatcha(const char * regex, const char * path,
-             int * n, int ** starts, int ** ends, int ** lines,
+             long * n, long ** starts, long ** ends, long ** lines,
              float min_ascii_ratio) {
-
-  // Open the file and handle any errors.
-  FILE * file = fopen(path, "r");
-  if (file == NULL) {
+  const long file_size = _file_size(path);
+  if (file_size < 0) {
     (*n) = -2;
     return;
   }
+  Search s;
+  memset(&s, 0, sizeof(Search));
+  s.regex = regex;
+  s.path = path;
+  s.size = file_size;
+  s.buffer_size = (file_size < FILE_BUFFER_SIZE) ? file_size+1 : FILE_BUFFER_SIZE;
+  s.empty_ok = 1;
+  s.split = LONG_MAX;
+  s.window = LONG_MAX;
+  s.min_ascii = (long) (min_ascii_ratio * ASCII_RATIO_SCALE + 0.5);
+  s.checked = 1;
+  _search((void *) &s);
+  _search_results(&s, n, starts, ends, lines);
+}
 
-  // Count the number of tokens and groups in this regular expression.
-  (*n) = -1;
+// Free the arrays of matches returned by `matcha` or `fmatcha` (the
+// starts, ends, and lines share one allocation that begins at "starts").
+void free_matches(long * starts) {
+  if (starts != NULL) free(starts);
+}
+
+// Find all nonoverlapping matches of a regular expression in a file
+// at a given path using multiple threads (same results as `fmatcha`).
+void pfmatcha(const char * regex, const char * path,
+              long * n, long ** starts, long ** ends, long ** lines,
+              float min_ascii_ratio, int n_threads, long overlap) {
+  // Get the size of the file.
+  const long file_size = _file_size(path);
+  if (file_size < 0) {
+    (*n) = -2;
+    return;
+  }
+  // Use `fmatcha` when the file will not be split, or when the regular
+  // expression is not valid (to get the error codes).
   int n_tokens, n_groups;
   _count(regex, &n_tokens, &n_groups);
-  // Error mode, fewer than one token (no possible match).
-  if (n_tokens <= 0) {
-    (*starts) = malloc(2 * sizeof(int));
-    (*ends) = (*starts) + 1;
-    // Set the error flag and return.
-    if (n_tokens == 0) {
-      (*starts)[0] = EXIT_TOKEN;
-      (*ends)[0] = REGEX_NO_TOKENS_ERROR;
-    } else {
-      (*starts)[0] = n_tokens;
-      (*ends)[0] = n_groups;
-    }
+  if (n_threads > file_size / MIN_CHUNK_SIZE) n_threads = file_size / MIN_CHUNK_SIZE;
+  if ((n_threads <= 1) || (n_tokens <= 0) || (regex[0] != '.') || (regex[1] != '*')) {
+    fmatcha(regex, path, n, starts, ends, lines, min_ascii_ratio);
     return;
   }
-
-  // Set there to be 0 matches, initially.
+  if (overlap < 0) overlap = 0;
+  // Find the matches in all chunks in parallel.
+  Search * chunks = malloc(n_threads * sizeof(Search));
+  pthread_t * threads = malloc(n_threads * sizeof(pthread_t));
+  memset(chunks, 0, n_threads * sizeof(Search));
+  for (int k = 0; k < n_threads; k++) {
+    chunks[k].regex = regex;
+    chunks[k].path = path;
+    chunks[k].size = file_size;
+    chunks[k].buffer_size = CHUNK_BUFFER_SIZE;
+    chunks[k].begin = (k * file_size) / n_threads;
+    chunks[k].empty_ok = 1;
+    chunks[k].split = (k+1 < n_threads) ? ((k+1) * file_size) / n_threads : LONG_MAX;
+    chunks[k].window = (k+1 < n_threads) ? chunks[k].split + overlap : LONG_MAX;
+    chunks[k].min_ascii = (long) (min_ascii_ratio * ASCII_RATIO_SCALE + 0.5);
+    chunks[k].checked = (k == 0);
+    pthread_create(threads+k, NULL, _search, (void *) (chunks+k));
+  }
+  for (int k = 0; k < n_threads; k++) pthread_join(threads[k], NULL);
+  // Merge the matches of all chunks in order.
   (*n) = 0;
-  // Initialize storage for tracking the current active tokens and
-  // where to jump based on the string being parsed.
-  const int mem_bytes = ((5*n_tokens+1)*sizeof(int) + (4*n_tokens+2)*sizeof(char));
-  int * jumps = malloc(mem_bytes); // jump-to location after success
-  int * jumpf = jumps + n_tokens; // jump-to location after failure
-  int * active = jumpf + n_tokens; // presently active tokens in regex
-  int * cstack = active + n_tokens + 1; // current stack of active tokens
-  int * nstack = cstack + n_tokens; // next stack of active tokens
-  char * tokens = (char*) (nstack + n_tokens); // regex index of each token (character)
-  char * jumpi = tokens + n_tokens + 1; // immediately check next on failure
-  char * incs = jumpi + n_tokens; // token flags for "in current stack"
-  char * inns = incs + n_tokens; // token flags for "in next stack"
-  // Terminate the two character arrays with the null character.
-  tokens[n_tokens] = '\0';
-  jumpi[n_tokens] = '\0';
+  (*starts) = NULL;
+  (*ends) = NULL;
+  (*lines) = NULL;
+  long n_found = 0; // number found
+  long s_found = 0; // size of "found" arrays
+  long last_end = 0; // end of the last merged match
+  int last_empty = 0; // 1 if the last merged match was empty
+  long last_newlines = 0; // number of new lines before "last_end"
+  long newlines = 0; // number of new lines before the current chunk
+  long ascii = 0; // number of ASCII characters before the current chunk
+  for (int k = 0; k < n_threads; k++) {
+    Search * chunk = chunks + k;
+    // Stop at the first error.
+    if (chunk->n < 0) {
+      (*n) = chunk->n;
+      break;
+    }
+    // Check the ASCII ratio of all prefixes that end in this chunk.
+    if ((chunk->ascii_low != LONG_MAX) &&
+        (ascii*ASCII_RATIO_SCALE + chunk->ascii_low < 0)) {
+      (*n) = -3;
+      break;
+    }
+    const long chunk_newlines = chunk->newlines;
+    const long chunk_ascii = chunk->ascii;
+    long offset = newlines; // number of new lines before the search of this chunk
+    long j = 0; // index of the first match of this chunk to use
+    // When the last merged match ends inside this chunk, continue from
+    // the match of this chunk that ends at the same place, or search
+    // this chunk again from there.
+    if (last_end > chunk->begin) {
+      j = -1;
+      for (long m = 0; m < chunk->n; m++)
+        if ((chunk->ends[m] == last_end) &&
+            ((chunk->ends[m] == chunk->starts[m]) == last_empty)) {
+          j = m+1;
+          break;
+        }
+      if (j < 0) {
+        if (chunk->starts != NULL) free(chunk->starts);
+        chunk->begin = last_end;
+        chunk->empty_ok = ! last_empty;
+        chunk->checked = 0;
+        _search((void *) chunk);
+        offset = last_newlines;
+        j = 0;
+        if (chunk->n < 0) {
+          (*n) = chunk->n;
+          break;
+        }
+      }
+    }
+    for (; j < chunk->n; j++) {
+      _append_match(starts, ends, lines, n_found, &s_found, chunk->starts[j],
+                    chunk->ends[j], 1 + offset + chunk->lines[j]);
+      n_found++;
+      last_end = chunk->ends[j];
+      last_empty = (chunk->ends[j] == chunk->starts[j]);
+      last_newlines = offset + chunk->lines[j];
+    }
+    newlines += chunk_newlines;
+    ascii += chunk_ascii;
+  }
+  for (int k = 0; k < n_threads; k++)
+    if (chunks[k].starts != NULL) free(chunks[k].starts);
+  free(chunks);
+  free(threads);
+  // Check for errors, deallocate the arrays if there are errors.
+  if ((*n) < 0) {
+    if ((*starts) != NULL) free(*starts);
+    (*starts) = NULL;
+  } else {
+    (*n) = n_found;
+  }
+  return;
+}
 
-  // Create a character buffer for reading data from the file.
-  size_t buffer_size = FILE_BUFFER_SIZE;
-  fseek(file, 0, SEEK_END); // go to the end of the file
-  size_t file_size = ftell(file); // size of file in bytes
-  rewind(file); // go back to the beginning of the file
-  if (file_size < buffer_size)
-    buffer_size = file_size+1; // set the buffer size smaller if appropriate
-  char * file_buff = malloc(sizeof(char)*buffer_size); // storage for the file contents
-  int bytes_buffered = fread(file_buff, sizeof(char), buffer_size, file);
-  int ib = 0; // index in buffer.
-  if (bytes_buffered < buffer_size) file_buff[bytes_buffered] = EOF;
+// Convert "n" byte offsets (in increasing order) into the UTF-8 text
+// in "buffer" to character offsets, in place.
+void utf8_char_offsets(const char * buffer, long n, long * offsets) {
+  long b = 0; // current byte
+  long chars = 0; // number of characters that start before byte "b"
+  for (long k = 0; k < n; k++) {
+    for (; b < offsets[k]; b++) chars += ((buffer[b] & 0xC0) != 0x80);
+    offsets[k] = chars;
+  }
+}
 
-  // Determine the jump-to tokens upon successful match and failed
-  // match at each token in the regular expression.
-  _set_jump(regex, n_tokens, n_groups, tokens, jumps, jumpf, jumpi);
-  // Set all tokens to be inactive, convert ? to * for simplicity.
-  active[n_tokens] = EXIT_TOKEN;
-  for (int j = 0; j < n_tokens; j++) {
-    // convert both "special tokens" to * for speed, exclude all
-    // tokens with jumpi = 1 because those are inside token sets
-    if ((! jumpi[j]) && ((tokens[j] == '?') || (tokens[j] == '|')))
-      tokens[j] = '*';
-    active[j] = EXIT_TOKEN; // token is inactive
-    incs[j] = 0; // token is not in current stack
-    inns[j] = 0; // token is not in next stack
+// Set "offsets[b]" to the number of characters of the UTF-8 text in
+// "buffer" that start before byte "b" (for all b in [0, n_bytes]).
+void utf8_char_map(const char * buffer, long n_bytes, long * offsets) {
+  long chars = 0;
+  for (long b = 0; b < n_bytes; b++) {
+    offsets[b] = chars;
+    chars += ((buffer[b] & 0xC0) != 0x80);
   }
+  offsets[n_bytes] = chars;
+}
 
-  // Set the current index in the file.
-  int i = 0; // current index in file
-  int c = file_buff[ib]; // get current character in file
-  int ics = 0; // index in current stack
-  int ins = -1; // index in next stack
-  int dest; // index of next token (for jump)
-  void * temp; // temporary pointer (used for transferring nstack to cstack)
-  cstack[ics] = 0; // set the first element in stack to '0'
-  active[0] = 0; // set the start index of the first token
-  incs[0] = 1; // the first token is in the current stack
+// Set "offsets[k]" to the byte offset of character "k" of the UTF-8
+// text in "buffer" (followed by "n_bytes", the end of the last one).
+void utf8_byte_map(const char * buffer, long n_bytes, long * offsets) {
+  long k = 0;
+  for (long b = 0; b < n_bytes; b++)
+    if ((buffer[b] & 0xC0) != 0x80) offsets[k++] = b;
+  offsets[k] = n_bytes;
+}
 
-  // Initialize to "no match".
-  (*starts) = NULL;
-  (*ends) = NULL;
-  (*lines) = NULL;
-  int n_found = 0; // number found
-  int s_found = 0; // size of "found" arrays
-  int lines_read = 1;
-  // Track some file statistics for early exit conditions.
-  float ascii_count = 0.0;
-  float bytes_read = 0.0;
 
-  // Define an in-line substitution that will be used repeatedly in
-  // a following while loop.
-  #define FMATCHA_STACK_NEXT_TOKEN(stack, si, in_stack) \
-    if ((dest >= 0) && (val >= active[dest])) { \
+// ___________________________________________________________________
+//                  Compiled regular expressions (lazy DFA)
+//
+// A regular expression can be compiled once with `rcompile` and then
+// matched many times with `rmatch`. The token and jump tables are
+// computed once at compile time, and a deterministic finite automaton
+// (DFA) is built lazily from them while matching. Every DFA state is
+// the (ordered) stack of active tokens that `match` would hold before
+// reading a character, and a transition is computed by running one
+// step of the `match` simulation the first time it is needed. All
+// later matches reuse the transition, so each character of a string
+// costs a single table lookup and a match takes time linear in the
+// length of the string.
+//
+// Regular expressions that begin with a repetition (the start of a
+// match can move while searching) and matches that would need more
+// than MAX_DFA_STATES states are handed to `match` instead.
+//
+//   void * rcompile(regex, start, end)
+//     (const char *) regex -- A null-terminated simple regular expression.
+//     (int *) start, end -- Error codes (as for `match`) if compilation
+//                           fails, in which case NULL is returned.
+//
+//   void rmatch(compiled, string, start, end)
+//     Same behavior as `match`, for a compiled regular expression.
+//
+//   void rmatchn(compiled, buffer, offset, limit, start, end)
+//     Same behavior as `rmatch` for the string of (at most) "limit"
+//     bytes that begins at "buffer + offset", without requiring that
+//     string to be null-terminated (or copied). The returned "start"
+//     and "end" are relative to "buffer + offset".
+//
+//   void rfree(compiled)
+//     Free all memory held by a compiled regular expression.
+
+#define MAX_DFA_STATES 1024
+//      ^^ maximum number of states built for one regular expression
+#define DFA_UNBUILT -1
+#define DFA_DEAD -2
+#define DFA_MATCH_BEFORE -3
+#define DFA_MATCH_AFTER -4
+#define DFA_FULL -5
+
+typedef struct {
+  char * regex; // copy of the regular expression (for the fallback)
+  int n_tokens; // number of tokens
+  char * tokens; int * jumps; int * jumpf; char * jumpi; // token tables
+  int use_dfa; // 1 if the DFA can be used for this regular expression
+  int n_states; // number of DFA states built
+  int ** rows; // transition row (one per character) for each state
+  int * offsets; // offset of the members of each state in "members"
+  int * sizes; // number of members (active tokens) in each state
+  int * members; // ordered token stacks of all states
+  int s_members; // allocated size of "members"
+  int * table; // hash table from state members to state index
+  int * cstack; int * nstack; char * incs; char * inns; // step workspace
+  pthread_mutex_t lock; // held while building new states
+} Regex;
+
+// Hash an ordered stack of tokens.
+static unsigned int _dfa_hash(const int * stack, int n) {
+  unsigned int h = 2166136261u;
+  for (int k = 0; k < n; k++) h = (h ^ (unsigned int) stack[k]) * 16777619u;
+  return h;
+}
+
+// Get the index of the state with the given ordered stack of tokens,
+// adding a new state if it does not exist yet. Returns DFA_FULL if
+// there is no room left for a new state.
+static int _dfa_state(Regex * r, const int * stack, int n) {
+  const int table_size = 2*MAX_DFA_STATES;
+  unsigned int h = _dfa_hash(stack, n) % table_size;
+  // Search the (open addressing) hash table for this state.
+  while (r->table[h] >= 0) {
+    const int s = r->table[h];
+    if ((r->sizes[s] == n) &&
+        (memcmp(r->members + r->offsets[s], stack, n*sizeof(int)) == 0))
+      return s;
+    h = (h + 1) % table_size;
+  }
+  if (r->n_states >= MAX_DFA_STATES) return DFA_FULL;
+  // Store the members of this new state.
+  if (r->offsets[r->n_states] + n > r->s_members) {
+    r->s_members = 2*(r->offsets[r->n_states] + n);
+    r->members = realloc(r->members, r->s_members*sizeof(int));
+  }
+  const int s = r->n_states;
+  memcpy(r->members + r->offsets[s], stack, n*sizeof(int));
+  r->sizes[s] = n;
+  if (s+1 < MAX_DFA_STATES) r->offsets[s+1] = r->offsets[s] + n;
+  // Initialize all transitions out of this state as "unbuilt".
+  int * row = malloc(256*sizeof(int));
+  for (int c = 0; c < 256; c++) row[c] = DFA_UNBUILT;
+  r->rows[s] = row;
+  r->table[h] = s;
+  r->n_states++;
+  return s;
+}
+
+// Compute the transition out of state "s" on character "c" by running
+// one step of the `match` simulation. Returns the next state, or one
+// of DFA_DEAD, DFA_MATCH_BEFORE, DFA_MATCH_AFTER, DFA_FULL.
+static int _dfa_build(Regex * r, int s, char c) {
+  pthread_mutex_lock(&(r->lock));
+  // Another thread may have built this transition already.
+  int result = __atomic_load_n(r->rows[s] + (unsigned char) c, __ATOMIC_ACQUIRE);
+  if (result != DFA_UNBUILT) {
+    pthread_mutex_unlock(&(r->lock));
+    return result;
+  }
+  const int n_tokens = r->n_tokens;
+  const char * tokens = r->tokens;
+  const char * jumpi = r->jumpi;
+  int * cstack = r->cstack;
+  int * nstack = r->nstack;
+  char * incs = r->incs;
+  char * inns = r->inns;
+  memset(incs, 0, n_tokens);
+  memset(inns, 0, n_tokens);
+  // Load the members of this state into the current stack.
+  int ics = -1;
+  int ins = -1;
+  int dest;
+  for (int k = 0; k < r->sizes[s]; k++) {
+    ics++;
+    cstack[ics] = r->members[r->offsets[s] + k];
+    incs[cstack[ics]] = 1;
+  }
+  // Push a token onto a stack (as in `match`), or finish with a match
+  // if the destination is the end of the regular expression.
+  #define DFA_STACK_NEXT_TOKEN(stack, si, in_stack) \
+    if (dest >= 0) { \
       if (dest == n_tokens) { \
-        (*n)++; \
-        if (n_found >= s_found) { \
-          if (s_found == 0) s_found = INITIAL_FOUND_SIZE; \
-          else s_found = 2*s_found; \
-          int * new_starts = malloc(3 * s_found * sizeof(int)); \
-          int * new_ends = new_starts + s_found; \
-          int * new_lines = new_ends + s_found;  \
-          for (int index = 0; index < n_found; index++)      { \
-            new_starts[index] = (*starts)[index]; \
-            new_ends[index] = (*ends)[index]; \
-            new_lines[index] = (*lines)[index]; \
-          } \
-          if ((*starts) != NULL) free(*starts); \
-          (*starts) = new_starts; \
-          (*ends) = new_ends; \
-          (*lines) = new_lines; \
-        } \
-        (*starts)[n_found] = val; \
-        (*ends)[n_found] = (((jumpi[j]) || (ct != '*')) ? i+1 : i); \
-        (*lines)[n_found] = lines_read; \
-        n_found++; \
-      } else { \
-        if (in_stack[dest] == 0) { \
-          si++; \
-          stack[si] = dest; \
-          in_stack[dest] = 1; \
-        } \
-        active[dest] = val; \
+        result = ((jumpi[j]) || (ct != '*')) ? DFA_MATCH_AFTER : DFA_MATCH_BEFORE; \
+        break; \
+      } else if (in_stack[dest] == 0) { \
+        si++; \
+        stack[si] = dest; \
+        in_stack[dest] = 1; \
       } \
-    }                                
-
-  // Start searching for a regular expression match. (the character
-  // 'c' is checked for null value at the end of the loop.
-  do {
-    // Continue popping active elements from the current stack and
-    // checking them for a match and jump conditions, add next tokens
-    // to the next stack.
-    while (ics >= 0) {
-      // Record the ASCII fraction, exit if file is too non-ASCII.
-      if ((c < 128) && (c != '\0')) {
-        ascii_count++;
-      } else if ((i >= MIN_SAMPLE_SIZE) &&
-                 ((ascii_count / i) < min_ascii_ratio)) {
-        (*n) = -3;
-        break;
-      }
-      // Pop next token to check from the stack.
-      const int j = cstack[ics];
-      ics--;
-      incs[j] = 0;
-      // Get the token and the "match start index" for the match that led here.
-      const char ct = tokens[j];
-      int val = active[j];
-      // If this is a special character, add its tokens immediately to
-      // the current stack (to be checked before next charactrer).
-      if ((ct == '*') && (! jumpi[j])) {
-        if (j == 0) val = i; // ignore leading tokens where possible
-      dest = jumps[j];
-      FMATCHA_STACK_NEXT_TOKEN(cstack, ics, incs);
-      dest = jumpf[j];
-      FMATCHA_STACK_NEXT_TOKEN(cstack, ics, incs);
-      // Check to see if this token matches the current character.
-      } else if ((c == ct) || ((ct == '.') && (! jumpi[j]) && (c != EOF))) {
-      dest = jumps[j];
-      FMATCHA_STACK_NEXT_TOKEN(nstack, ins, inns);
-      // This token did not match, trigger a jump fail.
+    }
+  // Process all tokens in the current stack (see `match`).
+  while (ics >= 0) {
+    const int j = cstack[ics];
+    ics--;
+    incs[j] = 0;
+    const char ct = tokens[j];
+    if ((ct == '*') && (! jumpi[j])) {
+      dest = r->jumps[j];
+      DFA_STACK_NEXT_TOKEN(cstack, ics, incs);
+      dest = r->jumpf[j];
+      DFA_STACK_NEXT_TOKEN(cstack, ics, incs);
+    } else if ((c == ct) || ((ct == '.') && (! jumpi[j]) && (c != '\0'))) {
+      dest = r->jumps[j];
+      DFA_STACK_NEXT_TOKEN(nstack, ins, inns);
+    } else {
+      dest = r->jumpf[j];
+      if (jumpi[j] == SET_TOKEN_BODY) {
+        DFA_STACK_NEXT_TOKEN(cstack, ics, incs);
       } else {
-      dest = jumpf[j];
-      // jump immediately on fail if this is not the last token in a token set
-      if (jumpi[j] == 1) { 
-        FMATCHA_STACK_NEXT_TOKEN(cstack, ics, incs);
-      // otherwise, put into the "next" stack
-      } else { 
-        FMATCHA_STACK_NEXT_TOKEN(nstack, ins, inns);
-      }
+        DFA_STACK_NEXT_TOKEN(nstack, ins, inns);
       }
     }
-    // Switch out the current stack with the next stack.
-    //   switch stack of token indices
-    temp = (void*) cstack; // store "current stack"
-    cstack = nstack; // set "current stack"
-    ics = ins; // set "index in current stack"
-    nstack = (int*) temp; // set "next stack"
-    //   switch flag arrays of "token in stack"
-    temp = (void*) incs; // store "in current stack"
-    incs = inns; // set "in current stack"
-    inns = (char*) temp; // set "in next stack"
-    ins = -1; // reset the count of elements in "next stack"
+  }
+  // Without a match, transition to the state holding the next stack
+  // (the end of the string never transitions to another state).
+  if (result == DFA_UNBUILT) {
+    if ((ins < 0) || (c == '\0')) result = DFA_DEAD;
+    else result = _dfa_state(r, nstack, ins+1);
+  }
+  if (result != DFA_FULL)
+    __atomic_store_n(r->rows[s] + (unsigned char) c, result, __ATOMIC_RELEASE);
+  pthread_mutex_unlock(&(r->lock));
+  return result;
+}
 
-    // If the just-parsed character was the end of the string, then break.
-    if (c == EOF) {
-      break;
-    // Get the next character in the string (assuming it's null terminated).
-    } else {
-      i++;
-      ib++;
-      // Read another chunk of the file.
-      if (ib >= buffer_size) {
-        // Reset the index in the buffer and read next character set.
-        ib = 0;
-        bytes_buffered = fread(file_buff, sizeof(char), buffer_size, file);
-        if (bytes_buffered < buffer_size) file_buff[bytes_buffered] = EOF;
-      }
-      c = file_buff[ib];
-      // Increment the number of lines read.
-      if (c == '\n') lines_read++;
+// Free all memory held by a compiled regular expression.
+void rfree(void * compiled) {
+  Regex * r = (Regex *) compiled;
+  if (r == NULL) return;
+  for (int s = 0; s < r->n_states; s++) free(r->rows[s]);
+  pthread_mutex_destroy(&(r->lock));
+  free(r->rows);
+  free(r->members);
+  free(r->jumps);
+  free(r->regex);
+  free(r);
+}
 
+// Compile a regular expression for repeated matching with `rmatch`.
+void * rcompile(const char * regex, int * start, int * end) {
+  // Count the number of tokens and groups in this regular expression.
+  int n_tokens, n_groups;
+  _count(regex, &n_tokens, &n_groups);
+  // Error mode, fewer than one token (no possible match).
+  if (n_tokens <= 0) {
+    if (n_tokens == 0) {
+      (*start) = EXIT_TOKEN;
+      (*end) = REGEX_NO_TOKENS_ERROR;
+    } else {
+      (*start) = n_tokens;
+      (*end) = n_groups;
     }
-  } while (ics >= 0) ; // loop until the active stack is empty
-  free(file_buff); // free the file buffer
-  free(jumps); // free all memory that was allocated
-  if (ferror(file)) (*n) = -2; // check for error while reading file
-  fclose(file); // close the file
-  // Check for errors, deallocate 'ends', 'starts', and 'lines' if there are errors.
-  if ((*n) < 0) {
-    if ((*starts) != NULL) free(*starts);
-  } else {
-    // Re-allocate the output arrays to be the exact size of the number of matches.
-    if (n_found < s_found) {
-      s_found = n_found;
-      int * new_starts = malloc(3 * s_found * sizeof(int));
-      int * new_ends = new_starts + s_found;
-      int * new_lines = new_ends + s_found;
-      for (int index = 0; index < n_found; index++) {
-        new_starts[index] = (*starts)[index];
-        new_ends[index] = (*ends)[index];
-        new_lines[index] = (*lines)[index];
+    return NULL;
+  }
+  (*start) = 0;
+  (*end) = 0;
+  Regex * r = malloc(sizeof(Regex));
+  r->n_tokens = n_tokens;
+  r->regex = malloc(strlen(regex)+1);
+  memcpy(r->regex, regex, strlen(regex)+1);
+  // Allocate all the token tables and workspace (as in `match`).
+  const int mem_bytes = ((5*n_tokens+1)*sizeof(int) + (4*n_tokens+2)*sizeof(char));
+  r->jumps = malloc(mem_bytes);
+  r->jumpf = r->jumps + n_tokens;
+  r->cstack = r->jumpf + n_tokens;
+  r->nstack = r->cstack + n_tokens+1;
+  r->tokens = (char*) (r->nstack + 2*n_tokens);
+  r->jumpi = r->tokens + n_tokens+1;
+  r->incs = r->jumpi + n_tokens+1;
+  r->inns = r->incs + n_tokens;
+  r->tokens[n_tokens] = '\0';
+  r->jumpi[n_tokens] = '\0';
+  _set_jump(regex, n_tokens, n_groups, r->tokens, r->jumps, r->jumpf, r->jumpi);
+  for (int j = 0; j < n_tokens; j++)
+    if ((! r->jumpi[j]) && ((r->tokens[j] == '?') || (r->tokens[j] == '|')))
+      r->tokens[j] = '*';
+  // A leading repetition moves the start of matches, which is not
+  // captured by the DFA states, so those are matched with `match`.
+  r->use_dfa = (r->tokens[0] != '*') || (r->jumpi[0]);
+  // Allocate the DFA storage, with only the initial state.
+  r->n_states = 0;
+  r->s_members = 4*n_tokens;
+  r->rows = malloc(MAX_DFA_STATES*sizeof(int*) + 4*MAX_DFA_STATES*sizeof(int));
+  r->offsets = (int*) (r->rows + MAX_DFA_STATES);
+  r->sizes = r->offsets + MAX_DFA_STATES;
+  r->table = r->sizes + MAX_DFA_STATES;
+  for (int h = 0; h < 2*MAX_DFA_STATES; h++) r->table[h] = -1;
+  r->offsets[0] = 0;
+  r->members = malloc(r->s_members*sizeof(int));
+  pthread_mutex_init(&(r->lock), NULL);
+  const int initial = 0;
+  _dfa_state(r, &initial, 1);
+  return (void *) r;
+}
+
+// Do a simple regular expression match with a compiled regular
+// expression against at most "limit" bytes of "string" (the string
+// ends at its first null character if "limit" is negative).
+static void _rmatch(Regex * r, const char * string, int limit, int * start, int * end) {
+  // Check for an empty string.
+  if ((limit == 0) || (string[0] == '\0')) {
+    (*start) = EXIT_TOKEN;
+    (*end) = STRING_EMPTY_ERROR;
+    return;
+  }
+  // Initialize to "no match".
+  (*start) = EXIT_TOKEN;
+  (*end) = 0;
+  // Follow (and build where needed) the transitions of the DFA.
+  int s = 0;
+  if (r->use_dfa) {
+    for (int i = 0; ; i++) {
+      const char c = (i == limit) ? '\0' : string[i];
+      int t = __atomic_load_n(r->rows[s] + (unsigned char) c, __ATOMIC_ACQUIRE);
+      if (t == DFA_UNBUILT) t = _dfa_build(r, s, c);
+      if (t >= 0) {
+        if (c == '\0') return;
+        s = t;
+      } else if (t == DFA_DEAD) {
+        return;
+      } else if (t == DFA_FULL) {
+        break;
+      } else {
+        (*start) = 0;
+        (*end) = (t == DFA_MATCH_AFTER) ? i+1 : i;
+        return;
       }
-      if ((*starts) != NULL) free(*starts);
-      (*starts) = new_starts;
-      (*ends) = new_ends;
-      (*lines) = new_lines;
     }
   }
-  return;
+  // Otherwise use `match` (on a null-terminated copy of the string).
+  if (limit < 0) {
+    match(r->regex, string, start, end);
+  } else {
+    char * copy = malloc(limit+1);
+    memcpy(copy, string, limit);
+    copy[limit] = '\0';
+    match(r->regex, copy, start, end);
+    free(copy);
+  }
+}
+
+// Do a simple regular expression match with a compiled regular expression.
+void rmatch(void * compiled, const char * string, int * start, int * end) {
+  _rmatch((Regex *) compiled, string, -1, start, end);
+}
+
+// Do a simple regular expression match with a compiled regular
+// expression against the "limit" bytes at "buffer + offset".
+void rmatchn(void * compiled, const char * buffer, long offset, int limit,
+             int * start, int * end) {
+  _rmatch((Regex *) compiled, buffer + offset, limit, start, end);
 }
 
 
@@ -0,0 +1,49 @@
+# Time the regular expression matching of the grammar on pathological
+# inputs (long runs of "$", "*" and new lines), comparing the original
+# `match` engine with the compiled (lazy DFA) `rmatch` engine. The time
+# per character should stay flat as the input grows for `rmatch`.
+import time, ctypes
+from txt_to_html.txt_to_html import REGEX_CLIB, translate_regex, regex_match
+from txt_to_html.txt_to_html import Math, Emphasis, NewLine, ON_NEW_LINE
+
+PATTERNS = [
+    ("Math start", Math.start, "$"),
+    ("Math end", Math.end, "$"),
+    ("Emphasis start", Emphasis.start, "*"),
+    ("NewLine start", NewLine.start, "\n"),
+    ("NEWLINE", ON_NEW_LINE, "\r\n"),
+    ("Unanchored", "$$*{$}x", "$"),
+]
+SIZES = [10**2, 10**3, 10**4, 10**5]
+REPEATS = 5
+
+# Time the best of a few runs of a matching function.
+def best_time(function):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# Time the original engine, which builds its tables on every call.
+def time_match(regex, string):
+    regex = translate_regex(regex).encode("utf-8")
+    start, end = ctypes.c_int(), ctypes.c_int()
+    return best_time(lambda: REGEX_CLIB.match(
+        regex, string, ctypes.byref(start), ctypes.byref(end)))
+
+# Time the compiled engine (after a first call builds the DFA).
+def time_rmatch(regex, string):
+    regex_match(regex, string)
+    return best_time(lambda: regex_match(regex, string))
+
+print()
+print(f"{'pattern':>16s}  {'size':>8s}  {'match (us/char)':>16s}  {'rmatch (us/char)':>16s}")
+for name, regex, char in PATTERNS:
+    for size in SIZES:
+        string = (char * (size // len(char))).encode("utf-8")
+        old = time_match(regex, string)
+        new = time_rmatch(regex, string)
+        print(f"{name:>16s}  {size:8d}  {10**6*old/size:16.4f}  {10**6*new/size:16.4f}")
+print()
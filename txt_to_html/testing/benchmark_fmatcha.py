@@ -0,0 +1,37 @@
+# Time finding all matches in a large generated notes file with the
+# serial `fmatcha` (threads=1) and the multi-threaded `pfmatcha`, and
+# check that every thread count finds exactly the same matches.
+import os, time, random, tempfile
+from txt_to_html.txt_to_html import regex_file_match_all
+
+SIZE = 2**26 # Number of bytes in the generated file.
+PATTERNS = [
+    ("references", "[[][[]{]}*]]"),
+    ("math", "[$]{[$]}*[$]"),
+    ("notes", "[(][(]{[)]}*[)][)]"),
+]
+THREADS = [1, 2, 4, 8]
+WORDS = ["the", "of", "notes", "$x^2$", "[[ref]]", "((a note))", "\n", "\n\n", "*bold*"]
+
+# Generate a file of random words (and syntax) with the given size.
+def generate(path, size):
+    random.seed(0)
+    chunk = " ".join(random.choice(WORDS) for _ in range(2**16))
+    with open(path, "w") as f:
+        for _ in range(size // len(chunk) + 1): f.write(chunk)
+
+path = os.path.join(tempfile.gettempdir(), "benchmark_fmatcha.txt")
+if (not os.path.exists(path)) or (os.path.getsize(path) < SIZE): generate(path, SIZE)
+print()
+print(f"File size: {os.path.getsize(path) / 2**20:.0f}MB, CPUs: {os.cpu_count()}")
+print(f"{'pattern':>12s}  {'threads':>7s}  {'matches':>9s}  {'seconds':>8s}  {'speedup':>7s}")
+for name, regex in PATTERNS:
+    serial = None
+    for threads in THREADS:
+        start = time.perf_counter()
+        matches = regex_file_match_all(regex, path, threads=threads)
+        seconds = time.perf_counter() - start
+        if serial is None: serial = (seconds, [list(m) for m in matches])
+        assert [list(m) for m in matches] == serial[1], "Matches differ from serial search."
+        print(f"{name:>12s}  {threads:7d}  {len(matches[0]):9d}  {seconds:8.3f}  {serial[0]/seconds:7.2f}")
+print()
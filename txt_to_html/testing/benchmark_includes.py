@@ -0,0 +1,47 @@
+# Time converting a batch of documents that share a large glossary,
+# with the glossary pasted into every document against included with
+# "{{glossary.txt}}". The included glossary is parsed once and its
+# tree is shared by every document, so the batch should be faster.
+import os, time, tempfile
+from txt_to_html.txt_to_html import parse_string
+import txt_to_html.txt_to_html as txt_to_html
+
+DOCUMENTS = 20 # Number of documents in the batch.
+TERMS = 500    # Number of terms in the shared glossary.
+DOCUMENT = '''Document {i}
+A generated document that uses the shared glossary.
+
+# Section
+Some *italic* and **bold** text with $x^2$ math and a note ((here)).
+
+{glossary}
+'''
+TERM = "- **term {i}** a definition with `code` and a reference [[key{i}]].\n"
+
+folder = tempfile.mkdtemp()
+glossary = "# Glossary\n" + "".join(TERM.format(i=i) for i in range(TERMS))
+with open(os.path.join(folder, "glossary.txt"), "w") as f:
+    f.write(glossary)
+os.chdir(folder)
+
+# Time converting all documents in the batch.
+def time_batch(glossary):
+    start = time.perf_counter()
+    for i in range(DOCUMENTS):
+        parse_string(DOCUMENT.format(i=i, glossary=glossary))
+    return time.perf_counter() - start
+
+pasted = time_batch(glossary)
+included = time_batch("{{glossary.txt}}")
+assert len(txt_to_html.TEXT_INCLUDE_CACHE) == 1, "Expected one cached text include."
+# Touching the file (same contents) should not parse it again.
+body = txt_to_html.TEXT_INCLUDE_CACHE[os.path.abspath("glossary.txt")][3]
+os.utime("glossary.txt")
+time_batch("{{glossary.txt}}")
+assert txt_to_html.TEXT_INCLUDE_CACHE[os.path.abspath("glossary.txt")][3] is body, "Unchanged include parsed again."
+print()
+print(f"Batch of {DOCUMENTS} documents sharing a {len(glossary)} byte glossary")
+print(f"  pasted:   {pasted:9.5f} seconds")
+print(f"  included: {included:9.5f} seconds")
+print(f"  speedup:  {pasted/included:9.1f}x")
+print()
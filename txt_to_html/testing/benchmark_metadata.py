@@ -0,0 +1,54 @@
+# Time extracting the metadata of a generated document with
+# `extract_metadata` against a full conversion with `parse_txt`, and
+# check that the metadata is found at least 10 times faster.
+import os, time, tempfile
+from txt_to_html.txt_to_html import parse_txt, extract_metadata
+import txt_to_html.txt_to_html as txt_to_html
+
+txt_to_html.UPDATE_FREQ_SEC = float('inf') # Hide progress updates.
+
+SECTIONS = 50 # Number of sections in the generated document.
+REPEATS = 3
+FRONT_MATTER = '''Benchmark Document
+A generated document for timing metadata extraction.
+:: Ann Author :: ann@example.com :: https://example.com
+
+'''
+SECTION = '''# Section {i}
+Some *italic* and **bold** text with $x^2$ math and a note ((here)).
+Another line with `code`, a link @{{text}}{{https://example.com}}@ and more.
+
+## Subsection {i}
+- first item
+- second item with *emphasis*
+
+1. ordered
+2. list
+
+'''
+
+# Time the best of a few runs of a function.
+def best_time(function):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+folder = tempfile.mkdtemp()
+path = os.path.join(folder, "benchmark_metadata.txt")
+with open(path, "w") as f:
+    f.write(FRONT_MATTER + "".join(SECTION.format(i=i) for i in range(SECTIONS)))
+
+metadata = extract_metadata(path)
+assert len(metadata["headers"]) == 2*SECTIONS, "Missing headers in metadata."
+full = best_time(lambda: parse_txt(path, folder, verbose=0, show=False))
+fast = best_time(lambda: extract_metadata(path))
+print()
+print(f"Document size: {os.path.getsize(path)} bytes, {len(metadata['headers'])} headers")
+print(f"  parse_txt:        {full:9.5f} seconds")
+print(f"  extract_metadata: {fast:9.5f} seconds")
+print(f"  speedup:          {full/fast:9.1f}x")
+print()
+assert (full / fast) >= 10, "Expected metadata extraction to be at least 10x faster."
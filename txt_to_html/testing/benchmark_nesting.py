@@ -0,0 +1,38 @@
+# Time parsing and rendering deeply nested syntax (notes inside notes,
+# emphasis inside colors) at growing depths. The parser and renderer
+# keep explicit stacks, so depths beyond the Python recursion limit
+# are handled and the time per level should stay roughly flat.
+import sys, time
+import txt_to_html.txt_to_html as txt_to_html
+from txt_to_html.txt_to_html import parse_section, Body
+
+txt_to_html.UPDATE_FREQ_SEC = float('inf') # Hide progress updates.
+
+DEPTHS = [10, 100, 1000, 10000]
+REPEATS = 3
+NESTINGS = [
+    ("notes", "((", "x", "))"),
+    ("emphasis", "*{", "x", "}*"),
+]
+
+# Return the best seconds taken to parse and to render a text.
+def time_text(text):
+    parse = render = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        body, _ = parse_section(text)
+        parsed = time.perf_counter()
+        Body().render(body)
+        rendered = time.perf_counter()
+        parse = min(parse, parsed - start)
+        render = min(render, rendered - parsed)
+    return parse, render
+
+print()
+print(f"Recursion limit: {sys.getrecursionlimit()}")
+print(f"{'nesting':>10s}  {'depth':>6s}  {'parse (us/level)':>16s}  {'render (us/level)':>17s}")
+for name, begin, middle, end in NESTINGS:
+    for depth in DEPTHS:
+        parse, render = time_text(begin*depth + middle + end*depth)
+        print(f"{name:>10s}  {depth:6d}  {10**6*parse/depth:16.2f}  {10**6*render/depth:17.2f}")
+print()
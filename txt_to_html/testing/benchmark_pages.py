@@ -0,0 +1,54 @@
+# Convert a large generated notebook into a single HTML document and
+# into pages (at titles, and by size at headers), and compare the
+# bytes (and time) of the page a reader opens first. Every jump to a
+# header on another page must link to the file of that page.
+import time
+from txt_to_html.txt_to_html import parse_string, page_file
+
+CHAPTERS = 40 # Number of top-level titles in the notebook.
+SECTIONS = 10 # Number of headers in every chapter.
+PAGE_SIZE = 64 * 2**10 # Bytes of HTML per page (for pages by size).
+SECTION = '''# Entry {i}-{j}
+Notes for entry {j} with *italic* text, $x_{j}^2$ math, a note ((about entry {j})), and
+a jump back to @@Entry {i}-0@@ and to the next chapter @@Entry {k}-0@@.
+
+| step | value |
+| {j} | {i} |
+
+'''
+
+# Generate the notebook, every chapter is a top-level title.
+text = "Benchmark Pages\n\n" + "".join(
+    f"! Chapter {i}\n\n" + "".join(SECTION.format(i=i, j=j, k=(i+1) % CHAPTERS)
+                                   for j in range(SECTIONS))
+    for i in range(CHAPTERS))
+
+# Check that every jump on every page links to an anchor on that page
+# or to the file of the page that has it. Returns the number of jumps
+# to other pages.
+def check_jumps(pages):
+    files = {page_file("notebook", k):page for (k, page) in enumerate(pages)}
+    across = 0
+    for name, page in files.items():
+        for part in page.split('<a class="jump" href="')[1:]:
+            target, _, anchor_id = part[:part.find('"')].partition("#")
+            linked = files.get(target or name, "")
+            assert (f'id="{anchor_id}"' in linked) or (f"id='{anchor_id}'" in linked), \
+                f"Broken jump to '{target}#{anchor_id}' on '{name}'."
+            across += (len(target) > 0)
+    return across
+
+start = time.perf_counter()
+single = parse_string(text)
+single_time = time.perf_counter() - start
+print()
+print(f"Notebook size: {len(text)} bytes, {CHAPTERS} chapters of {SECTIONS} entries")
+print(f"{'':16s}  {'pages':>6s}  {'first (KB)':>10s}  {'largest (KB)':>12s}  {'jumps across':>12s}  {'time (s)':>9s}")
+print(f"{'single':16s}  {1:6d}  {len(single.encode())/2**10:10.1f}  {len(single.encode())/2**10:12.1f}  {0:12d}  {single_time:9.5f}")
+for name, page_size in [("pages by title", None), ("pages by size", PAGE_SIZE)]:
+    start = time.perf_counter()
+    pages = parse_string(text, pages=True, page_size=page_size, page_name="notebook")
+    seconds = time.perf_counter() - start
+    sizes = [len(page.encode()) / 2**10 for page in pages]
+    print(f"{name:16s}  {len(pages):6d}  {sizes[0]:10.1f}  {max(sizes):12.1f}  {check_jumps(pages):12d}  {seconds:9.5f}")
+print()
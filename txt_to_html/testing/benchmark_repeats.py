@@ -0,0 +1,53 @@
+# Time parsing and rendering a generated report that repeats the same
+# formulas, colored text, links, and table cells many times, and
+# measure the memory held by its parsed tree. Identical small syntaxes
+# are shared by the tree and rendered once, compared here against
+# building and rendering every copy (SHARE_MAX_LENGTH = 0).
+import time, tracemalloc
+import txt_to_html.txt_to_html as txt_to_html
+
+SECTIONS = 500 # Number of (repetitive) sections in the report.
+REPEATS = 3
+SECTION = '''## Result {i}
+The loss $\\mathcal{{L}}(\\theta) = \\sum_i (y_i - f(x_i))^2$ was {{green}}within bounds{{green}}
+for the model @{{docs}}{{https://example.com/model}}@, see $\\mathcal{{L}}(\\theta) = \\sum_i (y_i - f(x_i))^2$.
+
+| **metric** | **value** | **status** |
+| accuracy | 0.95 | {{green}}ok{{green}} |
+| recall | 0.95 | {{green}}ok{{green}} |
+
+'''
+text = "Benchmark Repeats\n\n" + "".join(SECTION.format(i=i % 50) for i in range(SECTIONS))
+
+# Return the bytes held by the parsed tree, the best parse time, and
+# the best render time of the report.
+def measure():
+    tracemalloc.start()
+    body, _ = txt_to_html.parse_section(text, progress=False)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    parse = render = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        body, _ = txt_to_html.parse_section(text, progress=False)
+        parse = min(parse, time.perf_counter() - start)
+        start = time.perf_counter()
+        html, _ = txt_to_html.Body().render(body)
+        render = min(render, time.perf_counter() - start)
+    return size, parse, render, html
+
+# Fill the caches of the parser before measuring memory.
+txt_to_html.parse_section(text, progress=False)
+share_max_length = txt_to_html.SHARE_MAX_LENGTH
+txt_to_html.SHARE_MAX_LENGTH = 0
+copies = measure()
+txt_to_html.SHARE_MAX_LENGTH = share_max_length
+shared = measure()
+assert copies[-1] == shared[-1], "Sharing repeated syntax changed the HTML."
+print()
+print(f"Report size: {len(text)} bytes, {SECTIONS} sections")
+print(f"{'':10s}  {'tree (KB)':>10s}  {'parse (s)':>10s}  {'render (s)':>10s}")
+for name, (size, parse, render, _) in [("copies", copies), ("shared", shared)]:
+    print(f"{name:10s}  {size/2**10:10.1f}  {parse:10.5f}  {render:10.5f}")
+print(f"{'ratio':10s}  {copies[0]/shared[0]:10.1f}  {copies[1]/shared[1]:10.1f}  {copies[2]/shared[2]:10.1f}")
+print()
@@ -0,0 +1,30 @@
+# Time converting documents with large tables, written in the text
+# (with and without markup in some entries) and included from a CSV
+# file with "{{table.csv}}". Table rows are split without checking the
+# grammar at every character, so the time per row should stay flat.
+import os, time, tempfile
+from txt_to_html.txt_to_html import parse_string
+
+ROWS = [1000, 10000, 50000]
+PLAIN_ROW = "| {i} | name {i} | value | 3.14 |\n"
+MARKUP_ROW = "| {i} | name {i} | *value* | $3.14$ |\n"
+
+folder = tempfile.mkdtemp()
+os.chdir(folder)
+
+# Return the seconds taken to convert a document with the given body.
+def time_document(body):
+    start = time.perf_counter()
+    parse_string("Benchmark Tables\n\n" + body + "\nAfter the table.\n")
+    return time.perf_counter() - start
+
+print()
+print(f"{'rows':>6s}  {'plain (us/row)':>14s}  {'markup (us/row)':>15s}  {'csv (us/row)':>12s}")
+for rows in ROWS:
+    plain = time_document("".join(PLAIN_ROW.format(i=i) for i in range(rows)))
+    markup = time_document("".join(MARKUP_ROW.format(i=i) for i in range(rows)))
+    with open("table.csv", "w") as f:
+        for i in range(rows): f.write(f"{i},name {i},value,3.14\n")
+    csv = time_document("{{table.csv}}\n")
+    print(f"{rows:6d}  {10**6*plain/rows:14.2f}  {10**6*markup/rows:15.2f}  {10**6*csv/rows:12.2f}")
+print()
@@ -0,0 +1,46 @@
+# Time converting a generated document to HTML, plain text, and a JSON
+# tree with one conversion per target against one conversion for all
+# targets. The document is parsed once and its body is rendered for
+# every target in one pass, so all targets together should cost about
+# the same as one.
+import time
+from txt_to_html.txt_to_html import parse_string
+
+SECTIONS = 200 # Number of sections in the generated document.
+REPEATS = 3
+TARGETS = ["html", "text", "json"]
+SECTION = '''# Section {i}
+Some *italic* and **bold** text with $x^2$ math and a note ((here)).
+Another line with `code`, a link @{{text}}{{https://example.com}}@ and @@Section {i}@@.
+
+- first item
+- second item with *emphasis*
+
+| a | b | *c* |
+| 1 | 2 | 3 |
+
+'''
+
+# Time the best of a few runs of a function.
+def best_time(function):
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+text = "Benchmark Targets\n\n" + "".join(SECTION.format(i=i) for i in range(SECTIONS))
+separate = {target:parse_string(text, targets=[target])[target] for target in TARGETS}
+together = parse_string(text, targets=TARGETS)
+assert together == separate, "Rendering targets together changed their output."
+assert together["html"] == parse_string(text), "HTML target differs from the HTML document."
+
+one = best_time(lambda: [parse_string(text, targets=[target]) for target in TARGETS])
+all_targets = best_time(lambda: parse_string(text, targets=TARGETS))
+print()
+print(f"Document size: {len(text)} bytes, targets {', '.join(TARGETS)}")
+print(f"  one conversion per target: {one:9.5f} seconds")
+print(f"  one conversion in total:   {all_targets:9.5f} seconds")
+print(f"  speedup:                   {one/all_targets:9.1f}x")
+print()
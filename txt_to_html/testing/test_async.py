@@ -0,0 +1,83 @@
+# Check the asyncio conversion API against the synchronous one, and the
+# concurrency, errors, and cancellation of `convert_many`.
+import json, asyncio
+import pytest
+from txt_to_html import txt_to_html
+from txt_to_html.txt_to_html import parse_string, parse_txt_async, convert_many, INLINE_OPTIONS
+
+OPTIONS = dict(use_local=False, resource_folder="resources")
+TEXT = "Title\n\n# Header\nSome *text* with $x$ and ((a note)).\n"
+
+# Return a list of all the (path name, output) pairs from `convert_many`.
+def convert_all(*args, **kwargs):
+    async def collect():
+        return [result async for result in convert_many(*args, **kwargs)]
+    return asyncio.run(collect())
+
+def test_file_equals_string(tmp_path):
+    path = tmp_path / "s.txt"
+    path.write_text(TEXT)
+    html = asyncio.run(parse_txt_async(str(path), str(tmp_path), verbose=0, show=False, **OPTIONS))
+    assert html == parse_string(TEXT, **OPTIONS)
+    assert (tmp_path / "s.txt.html").read_text() == html + "\n"
+
+def test_targets_are_saved(tmp_path):
+    path = tmp_path / "s.txt"
+    path.write_text(TEXT)
+    targets = ["html", "text", "json"]
+    outputs = asyncio.run(parse_txt_async(str(path), str(tmp_path), verbose=0, show=False,
+                                          compress_level=6, targets=targets, **OPTIONS))
+    assert outputs == parse_string(TEXT, targets=targets, **OPTIONS)
+    assert (tmp_path / "s.txt.html").read_text() == outputs["html"] + "\n"
+    assert (tmp_path / "s.txt.html.gz").exists()
+    assert (tmp_path / "s.txt.text").read_text() == outputs["text"]
+    assert json.loads((tmp_path / "s.txt.json").read_text()) == json.loads(outputs["json"])
+
+def test_convert_many_equals_serial(tmp_path):
+    paths = []
+    for k in range(6):
+        paths.append(str(tmp_path / f"{k}.txt"))
+        with open(paths[-1], "w") as f: f.write(TEXT + f"Document {k}.\n")
+    results = dict(convert_all(paths, str(tmp_path), concurrency=2, **OPTIONS))
+    assert sorted(results) == sorted(paths)
+    for path in paths:
+        with open(path) as f: assert results[path] == parse_string(f.read(), **OPTIONS)
+
+def test_convert_many_bounds_concurrency(monkeypatch):
+    running = []
+    most = []
+    async def convert(path_name, output_folder, **kwargs):
+        running.append(path_name)
+        most.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(path_name)
+        return path_name
+    monkeypatch.setattr(txt_to_html, "parse_txt_async", convert)
+    results = convert_all([f"{k}.txt" for k in range(10)], concurrency=3)
+    assert sorted(results) == sorted((f"{k}.txt", f"{k}.txt") for k in range(10))
+    assert max(most) == 3
+
+def test_convert_many_errors(tmp_path, monkeypatch):
+    path = tmp_path / "s.txt"
+    path.write_text(TEXT)
+    missing = str(tmp_path / "missing.txt")
+    results = dict(convert_all([str(path), missing], str(tmp_path), return_exceptions=True, **OPTIONS))
+    assert type(results[missing]) == FileNotFoundError
+    assert results[str(path)] == parse_string(TEXT, **OPTIONS)
+    # Without "return_exceptions" the error is raised and the pending
+    # conversions are cancelled.
+    cancelled = []
+    async def convert(path_name, output_folder, **kwargs):
+        if (path_name == "bad.txt"): raise(ValueError(path_name))
+        try: await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(path_name)
+            raise
+    monkeypatch.setattr(txt_to_html, "parse_txt_async", convert)
+    with pytest.raises(ValueError):
+        convert_all(["bad.txt", "a.txt", "b.txt"], concurrency=3)
+    assert sorted(cancelled) == ["a.txt", "b.txt"]
+
+def test_inline_options_are_reset():
+    parse_string(TEXT, inline_limit=1000, inline_html=True)
+    assert INLINE_OPTIONS.get() == (0, False)
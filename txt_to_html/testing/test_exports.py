@@ -0,0 +1,9 @@
+# Check that the names exported by the package can be star-imported.
+import txt_to_html, txt_to_html.txt_to_html
+
+def test_star_imports():
+    for module in [txt_to_html, txt_to_html.txt_to_html]:
+        assert all(type(name) == str for name in module.__all__)
+        names = {}
+        exec(f"from {module.__name__} import *", names)
+        assert all(name in names for name in module.__all__)
@@ -0,0 +1,70 @@
+# Check the metadata of included files: image sizes, the include
+# metadata cache, inlining of small files, and the paths of files that
+# are included by included text files.
+import os, tempfile
+from txt_to_html import txt_to_html
+from txt_to_html.txt_to_html import (
+    image_size, include_metadata, data_uri, html_fragment, INCLUDE_CACHE, parse_string)
+
+# Write "data" to a temporary file with the given name, return its path.
+def temporary_file(data, name):
+    path = os.path.join(tempfile.gettempdir(), name)
+    with open(path, "wb") as f: f.write(data)
+    return path
+
+def test_svg_sizes():
+    sizes = {
+        b"<svg width='10' height='20px'></svg>": (10, 20),
+        b"<svg viewBox='0 0 30 40'></svg>": (30, 40),
+        b"<svg width=\"\" height=\"\"></svg>": None,
+        b"<svg width=\"\" height=\"\" viewBox=\"0,0,5,6\">": (5, 6),
+        b"<svg width=": None,
+        b"<svg width='10": None,
+        b"<svg width=10 height=20>": None,
+    }
+    for data, size in sizes.items():
+        assert image_size(temporary_file(data, "test_includes.svg"), "svg") == size, data
+
+def test_cache_entries_without_dimensions_are_probed():
+    path = temporary_file(b"<svg width='10' height='20'></svg>", "test_includes_cache.svg")
+    stat = os.stat(path)
+    # An entry saved before images were probed (no "dimensions").
+    INCLUDE_CACHE[os.path.abspath(path)] = dict(
+        mtime=stat.st_mtime_ns, size=stat.st_size,
+        meta=dict(exists=True, extension="svg", size=stat.st_size, height=None, width=None))
+    assert include_metadata(path)["dimensions"] == (10, 20)
+
+def test_inline_limit_zero_never_inlines(monkeypatch):
+    monkeypatch.chdir(tempfile.gettempdir())
+    temporary_file(b"", "test_includes_empty.svg")
+    text = "Title\n\n{{test_includes_empty.svg}}\n"
+    assert "data:" not in parse_string(text, inline_limit=0)
+    assert "data:" in parse_string(text, inline_limit=100)
+
+def test_paths_in_included_text_are_relative_to_it(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "pic.svg").write_bytes(b"<svg width='10' height='20'></svg>")
+    (tmp_path / "sub" / "frame.html").write_text("<p>fragment</p>")
+    (tmp_path / "sub" / "part.txt").write_text("{{pic.svg}}\n{{frame.html}}\n")
+    text = "Title\n\n{{sub/part.txt}}\n"
+    html = parse_string(text)
+    assert "src='sub/pic.svg' width='10' height='20'" in html
+    assert "src='sub/frame.html'" in html
+    html = parse_string(text, inline_limit=1000, inline_html=True)
+    assert "src='data:image/svg+xml;base64," in html
+    assert "<div><p>fragment</p></div>" in html
+
+def test_data_uri_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(txt_to_html, "DATA_URI_CACHE_SIZE", 4)
+    for k in range(10):
+        path = temporary_file(b"<svg width='%d'></svg>" % k, "test_includes_cached.svg")
+        assert data_uri(path, "svg").startswith("data:image/svg+xml;base64,")
+        assert len(txt_to_html.DATA_URI_CACHE) <= 4
+
+def test_non_utf8_fragments_stay_in_iframes(monkeypatch):
+    monkeypatch.chdir(tempfile.gettempdir())
+    temporary_file("<p>caf\xe9</p>".encode("latin-1"), "test_includes_latin.html")
+    assert html_fragment("test_includes_latin.html") is None
+    html = parse_string("Title\n\n{{test_includes_latin.html}}\n", inline_limit=1000, inline_html=True)
+    assert "<iframe src='test_includes_latin.html'" in html
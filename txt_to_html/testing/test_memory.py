@@ -0,0 +1,10 @@
+# Check that the memory report shows the allocations of each call site.
+from txt_to_html import parse_string, MemoryReport
+
+def test_call_sites_in_kilobytes():
+    memory = MemoryReport()
+    parse_string("Title\n\n# Header\nSome *text* with $x$ and ((a note)).\n" * 50, memory=memory)
+    sites = [line for line in memory.table().split("\n") if line.endswith(tuple("0123456789")) and "blocks" in line]
+    assert len(sites) > 0
+    assert all(line.split()[1] == "KB" for line in sites)
+    assert any(float(line.split()[0]) >= 1 for line in sites)
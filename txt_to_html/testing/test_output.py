@@ -0,0 +1,147 @@
+# Check that every way of converting a document gives the same output
+# as the original (recursive, pure Python) parser. "sample.html" is the
+# output of that parser for "sample.txt", and the options that do not
+# change the document (processes, caching, asyncio, tracing, sharing,
+# targets, pages) are compared with a plain conversion.
+import os, asyncio, tempfile
+from txt_to_html import txt_to_html
+from txt_to_html.txt_to_html import (
+    parse_string, parse_txt, parse_string_async, parse_section, minify_html,
+    extract_metadata, index_bibliography, RenderCache, Trace, MemoryReport,
+    parse_header, LineIndex, Syntax, Document, Body, ALL_GRAMMAR, EOF)
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+OPTIONS = dict(use_local=False, resource_folder="resources")
+
+with open(os.path.join(FOLDER, "sample.txt")) as f: SAMPLE = f.read()
+with open(os.path.join(FOLDER, "sample.html")) as f: BASELINE = f.read()
+
+# Return the contents of the article in an HTML document.
+def article(html):
+    return html[html.index("<dt-byline></dt-byline>"):html.index("</dt-article>")]
+
+# Write "text" to a temporary file with the given name, return its path.
+def temporary_file(text, name):
+    path = os.path.join(tempfile.gettempdir(), name)
+    with open(path, "w") as f: f.write(text)
+    return path
+
+def test_sample_equals_baseline():
+    assert parse_string(SAMPLE, **OPTIONS) == BASELINE
+
+def test_parallel_equals_baseline():
+    assert parse_string(SAMPLE, processes=2, **OPTIONS) == BASELINE
+
+def test_file_equals_string(tmp_path):
+    path = temporary_file(SAMPLE, "test_output_sample.txt")
+    html = parse_txt(path, str(tmp_path), verbose=0, show=False, compress_level=6, **OPTIONS)
+    assert html == BASELINE
+    with open(tmp_path / "test_output_sample.txt.html") as f: assert f.read() == html + "\n"
+    import gzip
+    with gzip.open(tmp_path / "test_output_sample.txt.html.gz", "rt") as f: assert f.read() == html + "\n"
+
+def test_cached_equals_uncached():
+    cache = RenderCache()
+    assert parse_string(SAMPLE, cache=cache, **OPTIONS) == BASELINE
+    assert parse_string(SAMPLE, cache=cache, **OPTIONS) == BASELINE
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Options that change the output are part of the key.
+    assert parse_string(SAMPLE, cache=cache, minify=True, **OPTIONS) == minify_html(BASELINE)
+
+def test_async_equals_serial():
+    cache = RenderCache()
+    async def convert():
+        return [await parse_string_async(SAMPLE, cache=cache, **OPTIONS) for _ in range(2)]
+    assert asyncio.run(convert()) == [BASELINE, BASELINE]
+
+def test_trace_and_memory_do_not_change_output():
+    assert parse_string(SAMPLE, trace=Trace(), **OPTIONS) == BASELINE
+    assert parse_string(SAMPLE, memory=MemoryReport(), **OPTIONS) == BASELINE
+    errors = []
+    assert parse_string(SAMPLE, errors=errors, **OPTIONS) == BASELINE
+    assert errors == []
+
+def test_sharing_equals_unshared(monkeypatch):
+    text = "\n" + "Some *text*, $x$, and ((a *note*)).\n# Header\n" * 200
+    shared = parse_string(text, **OPTIONS)
+    monkeypatch.setattr(txt_to_html, "SHARE_MAX_LENGTH", 0)
+    monkeypatch.setattr(txt_to_html, "RENDER_MEMO_SIZE", 0)
+    assert parse_string(text, **OPTIONS) == shared
+
+def test_targets_html_equals_html():
+    outputs = parse_string(SAMPLE, targets=["html", "text", "json"], **OPTIONS)
+    assert outputs["html"] == BASELINE
+    assert ("The Title" in outputs["text"]) and ("<h1" not in outputs["text"])
+
+def test_toc_only_adds_contents():
+    html = parse_string(SAMPLE, toc=True, **OPTIONS)
+    toc = html[html.index("\n<nav class='toc'>"):html.index("</nav>")+len("</nav>")]
+    assert html.replace(toc, "", 1) == BASELINE
+    for anchor in ["The Title", "A Header", "Sub Header", "Third Level"]:
+        assert f"#{anchor}" in toc
+
+def test_single_page_equals_document():
+    # Without its new page, the sample fits on one page.
+    text = SAMPLE.replace("^^^^\n", "")
+    assert parse_string(text, pages=True, page_size=10**6, **OPTIONS) == [parse_string(text, **OPTIONS)]
+
+def test_pages_hold_every_section():
+    text = "\n" + "".join(f"! Title {k}\nText {k} with ((a note)).\n" for k in range(5))
+    pages = parse_string(text, pages=True, **OPTIONS)
+    assert len(pages) == 5
+    whole = article(parse_string(text, **OPTIONS))
+    for k, page in enumerate(pages):
+        assert f"Text {k}" in article(page)
+        assert article(page).count("<h1") == 1
+    assert sum(article(page).count("<dt-fn>") for page in pages) == whole.count("<dt-fn>")
+
+def test_included_text_equals_pasted_text():
+    part = "# Included header\nSome *text* and $x$ with ((a note)).\n"
+    path = temporary_file(part, "test_output_part.txt")
+    included = article(parse_string(f"\n{{{{{path}}}}}\n", **OPTIONS))
+    pasted = article(parse_string("\n" + part, **OPTIONS))
+    body = pasted[pasted.index("<span"):].strip()
+    assert f"{body}</div>" in included
+
+def test_table_rows_equal_entries():
+    text = "\n| a | $1$ | b |\n| *c* | ((d)) | e\n\nText.\n| f |\n"
+    fast, _ = parse_section(text, on_new_line=True, progress=False)
+    # A grammar that is not ALL_GRAMMAR parses every entry on its own.
+    processor = Syntax()
+    processor.closed = False
+    processor.grammar = list(ALL_GRAMMAR)
+    slow, _, _ = processor.process(Document(text + EOF), 0, start="\n", progress=False)
+    assert Body().render(fast)[0] == Body().render(slow)[0]
+
+def test_csv_include_rows():
+    path = temporary_file("a,b\n1,<2>\n", "test_output_table.csv")
+    html = article(parse_string(f"\n{{{{{path}}}}}\n", **OPTIONS))
+    assert "<tr><td>a</td><td>b</td></tr>" in html
+    assert "<tr><td>1</td><td>&lt;2&gt;</td></tr>" in html
+
+def test_bibliography_keeps_cited_entries():
+    entries = "@book{a, title={A}}\n@book{b, title={B}}\n@string{s = {S}}\n"
+    html = parse_string(f"\nCites [[b]].\n\n====\n{entries}", **OPTIONS)
+    script = html[html.index('<script type="text/bibliography">'):]
+    script = script[:script.index("</script>")]
+    kept, others = index_bibliography(script)
+    assert list(kept) == ["b"]
+    assert kept["b"] == index_bibliography(entries)[0]["b"]
+    assert others == ["@string{s = {S}}"]
+
+def test_metadata_equals_parsed_headers():
+    path = temporary_file(SAMPLE, "test_output_metadata.txt")
+    metadata = extract_metadata(path)
+    assert metadata["title"] == "Sample Document: Syntax"
+    # Headers inside other syntax (the note) are included by the light scan.
+    headers = [(h["level"], h["text"]) for h in metadata["headers"] if not h["text"].startswith("that spans")]
+    assert headers == [(1, "The Title"), (2, "A Header"), (3, "Sub Header"), (4, "Third Level")]
+
+def test_front_matter_index_equals_full_index():
+    texts = ["T\nD\n:: a :: b :: c\n\nbody\n", "T\n:: a :: b :: c\nD\n:: x :: y :: z\nbody\nmore\n",
+             "T\nD\nbody\nmore\n", "T\n", "T"]
+    for text in texts:
+        lines = text.splitlines(keepends=True)
+        full = list(lines)
+        assert parse_header(lines) == parse_header(full, LineIndex(text))
+        assert lines == full
@@ -0,0 +1,80 @@
+# Check that parsing the sections of a document in parallel gives the
+# same output as parsing it serially, including documents whose math,
+# notes, code, and emphasis span the lines of titles and headers, and
+# that syntax which is never closed is reported without scanning.
+import random, pytest
+from txt_to_html.txt_to_html import (
+    parse_string, parse_body, parse_from, section_starts, literal_prefix,
+    Document, Ref, EOF, IncompleteSyntax)
+
+# Pieces of documents, some of which open syntax across header lines.
+PIECES = ["# Header\n", "## Sub header\n", "! Title\n", "Some text.\n", "\n",
+          "Inline $x + y$ math.\n", "Display\n$$\n# not a header\n$$\nmath.\n",
+          "((a note\n# inside the note\n))\n", "`code\n# in code`\n",
+          "**bold\n# in bold**\n", "{red}colored\n# in color\n{red}\n",
+          "- item\n", "| a | b |\n", "[[ref]]\n", "@@Header@@\n"]
+# Pieces that open (or close) syntax on their own.
+UNBALANCED = ["$ opens math\n", "((\n", "))\n", "*\n", "`\n"]
+
+# Return a random document built from "n" pieces (with no front matter).
+def document(n):
+    return "\n" + "".join(random.choice(UNBALANCED if (random.random() < 0.005) else PIECES)
+                          for _ in range(n))
+
+# Return the output of parsing "text" (or the type of error raised).
+def output(text, processes):
+    try: return parse_string(text, processes=processes)
+    except IncompleteSyntax: return IncompleteSyntax
+
+def test_boundaries_are_headers():
+    lines = document(200).splitlines(keepends=True)
+    starts = section_starts(lines, 4)
+    assert len(starts) > 1
+    text = "".join(lines)
+    assert all(text[s-1] == "\n" and text[s] in "#!" for s in starts)
+
+def test_sections_stop_outside_of_syntax():
+    text = "Text.\n$$\n# not a header\n$$\n((\n# in a note\n))\n# Header\nEnd.\n"
+    candidates = [text.index("# not"), text.index("# in"), text.index("# Header")]
+    body, outline, stop, error = parse_from(text, 0, candidates, progress=False)
+    assert (stop, error) == (text.index("# Header"), None)
+    _, _, stop, _ = parse_from(text, stop, [], progress=False)
+    assert stop is None
+
+def test_parallel_equals_serial():
+    random.seed(0)
+    tried = 0
+    for _ in range(60):
+        text = document(random.randint(10, 120))
+        serial = output(text, 1)
+        tried += (serial is not IncompleteSyntax)
+        for processes in [2, 3]:
+            assert output(text, processes) == serial, text
+    # Most documents should parse (so that outputs are compared).
+    assert tried > 20
+
+def test_syntax_across_headers():
+    text = "\n" + "Text.\n# One\n$$\n" + "# not a header\n"*50 + "$$\n# Two\n((note\n" + \
+           "## in a note\n"*50 + "))\n# Three\nEnd.\n"
+    lines = text.splitlines(keepends=True)
+    serial_body, serial_outline = parse_body(lines, 1, progress=False)
+    for processes in [2, 4, 8]:
+        body, outline = parse_body(lines, processes, progress=False)
+        assert [str(el) for el in body] == [str(el) for el in serial_body]
+        assert outline.anchors == serial_outline.anchors
+        assert output(text, processes) == output(text, 1)
+
+def test_errors_match_serial():
+    # The math opened in the first section is never closed.
+    text = "\n" + "Text $ and more.\n" + "# Header\nText.\n"*50
+    with pytest.raises(IncompleteSyntax): parse_string(text, processes=1)
+    with pytest.raises(IncompleteSyntax): parse_string(text, processes=4)
+
+def test_unclosed_refs_fail_fast():
+    assert literal_prefix(Ref.end) == "]]"
+    text = "\n[[ stray\n" + "Text with $x$ and ((a note)).\n" * 100
+    assert not Ref().closable(Document(text + EOF), 2)
+    with pytest.raises(IncompleteSyntax, match="never closed"): parse_string(text)
+    errors = []
+    parse_string("\n" + "[[ stray\nText.\n" * 10, errors=errors)
+    assert len(errors) == 10
@@ -0,0 +1,110 @@
+# Check that all matches found by `regex_match_all` (matcha) are the
+# leftmost-longest nonoverlapping matches found by repeatedly calling the
+# single match function (`regex_match`), and that `regex_file_match_all`
+# finds the same matches in a file for every number of threads and overlap.
+import os, re, gc, random, weakref, tempfile
+from txt_to_html import txt_to_html
+from txt_to_html.txt_to_html import regex_match, regex_match_all, regex_file_match_all, Document
+
+# Patterns (that never match an empty string) checked against the single match.
+PATTERNS = ["aa*", "[0123456789][0123456789]*", "[\n][\n]*", "[$]{[$]}*[$]",
+            "a(ba)*", "[(][(]{[)]}*[)][)]", "ab?c", "(ab)|(a)", "é[é ]*"]
+ALPHABET = "aabbc1 2\n\n$$()é"
+
+# Return the leftmost-longest nonoverlapping matches of "pattern" in
+# "text" by checking every substring with `regex_match`.
+def reference_matches(pattern, text):
+    full = "^(" + pattern + ")$"
+    matches = []
+    p = 0
+    while (p < len(text)):
+        for e in range(len(text), p, -1):
+            if (regex_match(full, text[p:e]) is not None):
+                matches.append((p, e, text[:e].count("\n") + 1))
+                p = e
+                break
+        else: p += 1
+    return matches
+
+def found(matches): return [tuple(int(v) for v in m) for m in zip(*matches)]
+
+# Write "text" to a temporary file and return its path.
+def temporary_file(text, name):
+    path = os.path.join(tempfile.gettempdir(), name)
+    with open(path, "wb") as f: f.write(text.encode("utf-8"))
+    return path
+
+def test_runs_are_single_matches():
+    assert found(regex_match_all("aa*", "aaaa")) == [(0, 4, 1)]
+    assert found(regex_match_all("[0123456789][0123456789]*", "a12 345")) == [(1, 3, 1), (4, 7, 1)]
+    assert found(regex_match_all("[\n][\n]*", "a\n\nb")) == [(1, 3, 3)]
+
+def test_empty_matches():
+    for text in ["baab", "b", "aa", ""]:
+        expected = [(m.start(), m.end()) for m in re.finditer("a*", text)] if text else []
+        assert [m[:2] for m in found(regex_match_all("a*", text))] == expected
+
+def test_matches_equal_reference():
+    random.seed(0)
+    for _ in range(300):
+        text = "".join(random.choice(ALPHABET) for _ in range(random.randint(1, 25)))
+        for pattern in PATTERNS:
+            assert found(regex_match_all(pattern, text)) == reference_matches(pattern, text), (pattern, text)
+
+def test_file_matches_equal_string_matches():
+    random.seed(1)
+    text = "".join(random.choice(ALPHABET) for _ in range(5000))
+    path = temporary_file(text, "test_regex_file.txt")
+    encoded = text.encode("utf-8")
+    for pattern in PATTERNS:
+        assert found(regex_file_match_all(pattern, path)) == found(regex_match_all(pattern, encoded))
+
+def test_document_offsets():
+    text = "aé€😀b $é$ ((ü)) a\n"
+    document = Document(text)
+    assert list(document.byte_offsets) == [len(text[:k].encode("utf-8")) for k in range(len(text)+1)]
+    for i in range(len(text)):
+        for j in range(i+1, len(text)+1):
+            for pattern in ["[$]{[$]}*[$]", "b", "ü", "[(][(]"]:
+                match = regex_match(pattern, text[i:j])
+                # `regex_match` gives byte offsets, the document gives characters.
+                if (match is not None):
+                    encoded = text[i:j].encode("utf-8")
+                    match = tuple(len(encoded[:b].decode("utf-8")) for b in match)
+                assert document.match(pattern, i, j) == match
+
+def test_parallel_matches_equal_serial():
+    random.seed(2)
+    words = ["\n", "\n\n", "\n\n\n", "a", "word", "$x$", "$", "((a note", "))", " ", "[[ref]]"]
+    text = "".join(random.choice(words) for _ in range(400000))
+    # A match that spans most of the file (and so crosses every chunk).
+    text = text[:1000] + "$" + text[1000:].replace("$", "") + "$"
+    path = temporary_file(text, "test_regex_parallel.txt")
+    for pattern in ["[\n][\n]*", "[$]{[$]}*[$]", "[(][(]{[)]}*[)][)]", "[[][[]{]}*]]", "a*", "{ }*"]:
+        serial = found(regex_file_match_all(pattern, path, threads=1))
+        for threads in [2, 3, 5, 8]:
+            for overlap in [0, 1, 4096]:
+                assert found(regex_file_match_all(pattern, path, threads=threads, overlap=overlap)) == serial, \
+                    (pattern, threads, overlap)
+
+def test_parallel_ascii_ratio_equals_serial():
+    random.seed(3)
+    text = "".join(random.choice("abc\n") for _ in range(600000)) + "é" * 200000
+    path = temporary_file(text, "test_regex_ascii.txt")
+    for ratio in [0.5, 0.75, 0.8, 0.9]:
+        serial = regex_file_match_all("[\n][\n]*", path, min_ascii_ratio=ratio)
+        for threads in [2, 5, 8]:
+            parallel = regex_file_match_all("[\n][\n]*", path, min_ascii_ratio=ratio, threads=threads)
+            assert (serial is None) == (parallel is None), (ratio, threads)
+            if (serial is not None): assert found(parallel) == found(serial)
+
+def test_regex_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(txt_to_html, "REGEX_CACHE_SIZE", 8)
+    first = weakref.ref(txt_to_html.regex_compile("^a0")[1])
+    for k in range(50):
+        assert regex_match(f"^a{k}", f"a{k}") == (0, len(f"a{k}"))
+        assert len(txt_to_html.REGEX_CACHE) <= 8
+    # Evicted expressions are freed, and are compiled again when needed.
+    gc.collect()
+    assert first() is None
+    assert regex_match("^a0", "a0") == (0, 2)
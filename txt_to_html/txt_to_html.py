@@ -17,7 +17,7 @@ LINE STARTS:
   "====(=)*" --------> marks the rest of the document as a bibtex bibliography
   "^^^^(^)*" --------> new page (on print)
   "!+" --------------> new title
-  "{{<path>}}" ------> include external file, supports [.png, .jpeg, .jpg, .html]
+  "{{<path>}}" ------> include external file, supports [.png, .jpeg, .jpg, .html, .txt, .csv]
   "%%+" -------------> ignore rest of line (comments in file)
 
 ANYWHERE:
@@ -49,7 +49,8 @@ USAGE:
 
 '''
 
-import os, time
+import os, time, json, base64, bisect, hashlib, itertools, threading, contextlib, contextvars, warnings
+from array import array
 
 # A mutable string class that prevents copying when passed as an 
 # argument. It is not perfectly efficient, as copies of pointers are
@@ -107,7 +108,11 @@ AUTHORS_AND_AFFILIATION = [
 RESOURCE_FOLDER = os.path.join(
     os.path.dirname(os.path.abspath(__file__)),"resources")
 USE_LOCAL = True
-FOUND_NOTE = False
+# The (inline_limit, inline_html) options of the current conversion,
+# kept per thread (and asyncio task) so that conversions can run
+# concurrently. Included files up to "inline_limit" bytes are inlined,
+# and if "inline_html" is True small HTML fragments replace iframes.
+INLINE_OPTIONS = contextvars.ContextVar("INLINE_OPTIONS", default=(0, False))
 
 # Format the author and affiliation block appropriately, return in
 # dictionary to be used as the **kwargs of formatting HTML.
@@ -138,8 +143,8 @@ JUSTIFY_CSS = '''
 '''
 
 
-def HTML(use_local=USE_LOCAL, resource_folder=RESOURCE_FOLDER):
-    print(f"Formatting HTML {'' if use_local else 'not '}using local files and resources.")
+def HTML(use_local=USE_LOCAL, resource_folder=RESOURCE_FOLDER, verbose=True):
+    if verbose: print(f"Formatting HTML {'' if use_local else 'not '}using local files and resources.")
 
     # Decide which HTML sources to use based on "local" or "not local".
     source_format = dict(
@@ -439,9 +444,11 @@ NOTES = r'''
 #                       regex C library
 # 
 # A fast regular expression matching code for Python, built on top of
-# the 'regex.c' library. The main function provided here is:
+# the 'regex.c' library. The main functions provided here are:
 # 
 #   regex_match(regex, string) -> (start, end) or None or RegexError.
+#   regex_match_all(regex, string) -> (starts, ends, lines) or RegexError.
+#   regex_file_match_all(regex, path) -> (starts, ends, lines) or None or RegexError.
 # 
 # Regex language can be found in 'regex.c' file.
 
@@ -452,21 +459,76 @@ import ctypes
 #                 Darwin (macOS) / Linux (Ubuntu) import
 clib_bin = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regex.so")
 clib_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regex.c")
-# Import or compile the C file.
+# Import or compile the C file (recompiling when the source is newer).
 try:
+    if (os.path.exists(clib_source) and (os.path.getmtime(clib_source) >
+                                         os.path.getmtime(clib_bin))):
+        raise(OSError("Stale compiled regex library."))
     REGEX_CLIB = ctypes.CDLL(clib_bin)
 except:
     # Configure for the compilation for the C code.
     c_compiler = "cc"
-    compile_command = f"{c_compiler} -O3 -fPIC -shared -o '{clib_bin}' '{clib_source}'"
+    compile_command = f"{c_compiler} -O3 -fPIC -shared -pthread -o '{clib_bin}' '{clib_source}'"
     # Compile and import.
     os.system(compile_command)
     REGEX_CLIB = ctypes.CDLL(clib_bin)
     # Clean up "global" variables.
     del(c_compiler, compile_command)
 del(clib_bin, clib_source)
+# Declare the types for the compiled regular expression functions.
+REGEX_CLIB.rcompile.restype = ctypes.c_void_p
+REGEX_CLIB.rcompile.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_int),
+                                ctypes.POINTER(ctypes.c_int)]
+REGEX_CLIB.rmatch.restype = None
+REGEX_CLIB.rmatch.argtypes = [ctypes.c_void_p, ctypes.c_char_p,
+                              ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)]
+REGEX_CLIB.rmatchn.restype = None
+REGEX_CLIB.rmatchn.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_long, ctypes.c_int,
+                               ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int)]
+REGEX_CLIB.rfree.restype = None
+REGEX_CLIB.rfree.argtypes = [ctypes.c_void_p]
+# Declare the types for the functions that find all matches.
+REGEX_CLIB.matcha.restype = None
+REGEX_CLIB.matcha.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_long)] + (
+    3 * [ctypes.POINTER(ctypes.POINTER(ctypes.c_long))])
+REGEX_CLIB.fmatcha.restype = None
+REGEX_CLIB.fmatcha.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_long)] + (
+    3 * [ctypes.POINTER(ctypes.POINTER(ctypes.c_long))] + [ctypes.c_float])
+REGEX_CLIB.pfmatcha.restype = None
+REGEX_CLIB.pfmatcha.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.POINTER(ctypes.c_long)] + (
+    3 * [ctypes.POINTER(ctypes.POINTER(ctypes.c_long))] + [ctypes.c_float, ctypes.c_int, ctypes.c_long])
+REGEX_CLIB.free_matches.restype = None
+REGEX_CLIB.free_matches.argtypes = [ctypes.POINTER(ctypes.c_long)]
+# Declare the types for the UTF-8 byte and character offset conversions.
+REGEX_CLIB.utf8_char_offsets.restype = None
+REGEX_CLIB.utf8_char_offsets.argtypes = [ctypes.c_char_p, ctypes.c_long, ctypes.POINTER(ctypes.c_long)]
+REGEX_CLIB.utf8_char_map.restype = None
+REGEX_CLIB.utf8_char_map.argtypes = [ctypes.c_char_p, ctypes.c_long, ctypes.c_void_p]
+REGEX_CLIB.utf8_byte_map.restype = None
+REGEX_CLIB.utf8_byte_map.argtypes = [ctypes.c_char_p, ctypes.c_long, ctypes.c_void_p]
 # --------------------------------------------------------------------
 
+# Compiled regular expressions (each holding a lazily built DFA), keyed
+# by the untranslated regex and its translation keyword arguments. At
+# most REGEX_CACHE_SIZE are kept, the least recently compiled (or
+# requested through `regex_compile`) are evicted first.
+from collections import OrderedDict
+REGEX_CACHE = OrderedDict()
+REGEX_CACHE_SIZE = 512
+
+# A regular expression compiled by `rcompile` (passed to the C library
+# as its pointer), freed with `rfree` once it is no longer referenced.
+# Evicting it from REGEX_CACHE while a match is running in another
+# thread is safe, that match holds its own reference.
+class CompiledRegex:
+    rfree = REGEX_CLIB.rfree
+
+    def __init__(self, pointer):
+        self._as_parameter_ = pointer
+
+    def __del__(self):
+        self.rfree(self._as_parameter_)
+
 # Exception to raise when errors are reported by the regex library.
 class RegexError(Exception): pass
 
@@ -545,6 +607,31 @@ def translate_return_values(regex, start, end):
             else: err += "."
             raise(RegexError(err))
 
+# Get the translated regular expression (as bytes) and its compiled
+# form, a CompiledRegex (None if the expression is invalid), compiling
+# and caching it in REGEX_CACHE the first time it is requested.
+def regex_compile(regex, **translate_kwargs):
+    key = (regex, tuple(sorted(translate_kwargs.items()))) if translate_kwargs else regex
+    entry = REGEX_CACHE.get(key)
+    if (entry is not None):
+        try:    REGEX_CACHE.move_to_end(key)
+        except KeyError: pass # Evicted by another thread.
+        return entry
+    # Translate the regular expression to expected syntax.
+    regex = translate_regex(regex, **translate_kwargs)
+    if (type(regex) == str): regex = regex.encode("utf-8")
+    # Compile the regular expression (NULL for invalid expressions).
+    start = ctypes.c_int()
+    end = ctypes.c_int()
+    compiled = REGEX_CLIB.rcompile(regex, ctypes.byref(start), ctypes.byref(end))
+    if (compiled is not None): compiled = CompiledRegex(compiled)
+    entry = REGEX_CACHE[key] = (regex, compiled)
+    # Evict the oldest compiled expressions (freed when unreferenced).
+    while (len(REGEX_CACHE) > REGEX_CACHE_SIZE):
+        try:    REGEX_CACHE.popitem(last=False)
+        except KeyError: break
+    return entry
+
 # Find a match for the given regex in string.
 # 
 #   match(regex, string) -> (start, end) or None or RegexError,
@@ -567,24 +654,736 @@ def translate_return_values(regex, start, end):
 #    regular expression libraries.
 #  - If "$" is the last character of "regex", it will be substituted
 #    with "{.}", the appropriate pattern for end-of-string matches.
+#
+# Each regular expression is compiled once (see `rcompile` in 'regex.c')
+# and cached in REGEX_CACHE, the DFA transitions are built as they are
+# first used so that later matches take time linear in the string.
+# Expressions that begin with a repetition, which includes every one
+# without a leading "^" (".*" is added), are still matched by `match`.
 # 
 def regex_match(regex, string, **translate_kwargs):
-    # Translate the regular expression to expected syntax.
-    regex = translate_regex(regex, **translate_kwargs)
+    regex, compiled = regex_compile(regex, **translate_kwargs)
     # Call the C utillity.
     #   initialize memory storage for the start and end of a match
     start = ctypes.c_int()
     end = ctypes.c_int()
     #   convert strings into character arrays
-    if (type(regex) == str): regex = regex.encode("utf-8")
     if (type(string) == str): string = string.encode("utf-8")
-    c_regex = ctypes.c_char_p(regex);
     c_string = ctypes.c_char_p(string);
-    #   execute the C function
-    REGEX_CLIB.match(c_regex, c_string, ctypes.byref(start), ctypes.byref(end))
-    del(c_regex, c_string, string)
+    #   execute the C function (invalid expressions report their errors)
+    if (compiled is not None):
+        REGEX_CLIB.rmatch(compiled, c_string, ctypes.byref(start), ctypes.byref(end))
+    else:
+        c_regex = ctypes.c_char_p(regex);
+        REGEX_CLIB.match(c_regex, c_string, ctypes.byref(start), ctypes.byref(end))
+        del(c_regex)
+    del(c_string, string)
     # Return the values from the C library (translating them appropriately)
     return translate_return_values(regex, start.value, end.value)
+
+# Fill an array of "n" offsets with one of the UTF-8 offset maps of
+# 'regex.c' ("utf8_byte_map" or "utf8_char_map") for "buffer".
+def offset_map(function, buffer, n):
+    offsets = array("l", bytes(n * array("l").itemsize))
+    function(buffer, len(buffer), offsets.buffer_info()[0])
+    return offsets
+
+# A document that is encoded (as UTF-8) once into a single buffer that
+# is shared with the C matcher, so that matching a window of the text
+#
+#   document.match(regex, i, j) -> (start, end) or None or RegexError,
+#
+# behaves like `regex_match(regex, document.text[i:j])` without slicing
+# or encoding anything. Byte offsets reported by the C library are
+# converted back to character offsets with a precomputed map (only
+# needed for text that is not pure ASCII).
+class Document:
+    def __init__(self, text):
+        self.text = text
+        self.buffer = text.encode("utf-8")
+        self.length = len(text)
+        self.ascii = (len(self.buffer) == self.length)
+        # Character index -> byte offset of that character.
+        self.byte_offsets = None
+        # Byte offset -> number of characters that start before it
+        # (a byte inside a character maps to the end of that character).
+        self.char_offsets = None
+        if (not self.ascii):
+            self.byte_offsets = offset_map(REGEX_CLIB.utf8_byte_map, self.buffer, self.length+1)
+            self.char_offsets = offset_map(REGEX_CLIB.utf8_char_map, self.buffer, len(self.buffer)+1)
+        # Storage for the start and end of a match.
+        self.start = ctypes.c_int()
+        self.end = ctypes.c_int()
+        self.start_ref = ctypes.byref(self.start)
+        self.end_ref = ctypes.byref(self.end)
+        # Literal text -> index of its last occurrence (-1 if absent).
+        self.last_indices = {}
+        # The LineIndex of the text (built when needed).
+        self.lines = None
+        # The number of lines (of a file) that come before the text.
+        self.line_offset = 0
+        # The notes, headers, captions, and jumps processed in the text.
+        self.outline = Outline()
+        # (type, match, contents) -> shared syntax (see `share`).
+        self.shared = {}
+
+    def __len__(self): return self.length
+
+    # Return the shared copy of a completed syntax. Identical syntaxes
+    # (same type, match, and contents) whose text is at most
+    # SHARE_MAX_LENGTH characters are kept once in the tree. Nested
+    # syntaxes are shared first, so they are compared by identity.
+    # Returns "syntax" itself when it is the first of its kind or when
+    # it cannot be shared.
+    def share(self, syntax):
+        if (not syntax.shareable): return syntax
+        key = [type(syntax), syntax.match]
+        length = len(syntax.match)
+        for el in syntax:
+            if (type(el) == str):
+                length += len(el)
+                key.append(el)
+            elif el.shared:
+                length += 1
+                key.append(id(el))
+            else: return syntax
+            if (length > SHARE_MAX_LENGTH): return syntax
+        key = tuple(key)
+        shared = self.shared.get(key)
+        if (shared is None):
+            syntax.shared = True
+            self.shared[key] = syntax
+            return syntax
+        shared.repeated = True
+        return shared
+
+    # Return the index of the last occurrence of "literal" in the text,
+    # searching the whole text only the first time it is requested.
+    def last_index(self, literal):
+        index = self.last_indices.get(literal)
+        if (index is None):
+            index = self.last_indices[literal] = self.text.rfind(literal)
+        return index
+
+    # Return the (1-indexed) line and column of character "i".
+    def line_column(self, i):
+        if (self.lines is None): self.lines = LineIndex(self.text)
+        line, column = self.lines.line_column(i)
+        return line + self.line_offset, column
+
+    # Find a match for "regex" in the text from character "i" up to
+    # (but not including) character "j".
+    def match(self, regex, i, j):
+        if (j > self.length): j = self.length
+        translated, compiled = REGEX_CACHE.get(regex) or regex_compile(regex)
+        # Let `regex_match` report the errors for invalid expressions.
+        if (compiled is None): return regex_match(regex, self.text[i:j])
+        if self.ascii: offset, limit = i, j-i
+        else:
+            offset = self.byte_offsets[i]
+            limit = self.byte_offsets[j] - offset
+        REGEX_CLIB.rmatchn(compiled, self.buffer, offset, limit,
+                           self.start_ref, self.end_ref)
+        start = self.start.value
+        if (start < 0):
+            return translate_return_values(translated, start, self.end.value)
+        elif self.ascii: return (start, self.end.value)
+        return (self.char_offsets[offset+start] - i,
+                self.char_offsets[offset+self.end.value] - i)
+
+# An index of the lines of a text, built in one pass. Holds the offset
+# of the first character of every line and the "marker" every line
+# starts with (its first character, or "\n" for an empty line).
+class LineIndex:
+    def __init__(self, text):
+        lines = text.split("\n")
+        self.text = text
+        self.starts = array("q", itertools.accumulate(
+            (len(line)+1 for line in lines), initial=0))
+        self.starts.pop(-1)
+        self.markers = "".join(line[:1] or "\n" for line in lines)
+
+    def __len__(self): return len(self.starts)
+
+    # Return the text of line "k" (0-indexed, without its new line).
+    def line(self, k):
+        end = self.starts[k+1]-1 if (k+1 < len(self.starts)) else len(self.text)
+        return self.text[self.starts[k]:end]
+
+    # Return the (1-indexed) line and column of character "i".
+    def line_column(self, i):
+        line = bisect.bisect_right(self.starts, i)
+        return line, i - self.starts[line-1] + 1
+
+# The notes, anchors (headers and captions that can be jumped to), and
+# jumps found while processing a document. Anchors are (level, id,
+# offset, text), where "level" is 1 for a "Title", n+1 for a "Header"
+# that starts with n "#", and None for a "Caption", "offset" is the
+# position in the document, and "text" is the rendered contents.
+# Jumps are (id, offset). Anchor ids are kept in a dictionary, so that
+# every jump is resolved without searching.
+class Outline:
+    def __init__(self):
+        self.found_note = False
+        self.anchors = []
+        self.jumps = []
+        # Anchor id -> index of the first anchor with that id.
+        self.ids = {}
+
+    # Record a syntax that was processed starting at "offset".
+    def add(self, syntax, offset):
+        kind = type(syntax)
+        if (kind == Note): self.found_note = True
+        elif (kind in {Title, Header, Caption, Jump}):
+            text = syntax.contents()
+            if (kind == Jump): self.jumps.append((syntax.anchor(text), offset))
+            else:              self.add_anchor(syntax.level(), syntax.anchor(text), offset, text)
+
+    # Record an anchor (ignoring those without an id).
+    def add_anchor(self, level, anchor_id, offset, text):
+        if (len(anchor_id) == 0): return
+        self.ids.setdefault(anchor_id, len(self.anchors))
+        self.anchors.append((level, anchor_id, offset, text))
+
+    # Add everything in an outline of text that starts at "offset".
+    def update(self, outline, offset=0):
+        self.found_note = self.found_note or outline.found_note
+        for (level, anchor_id, start, text) in outline.anchors:
+            self.add_anchor(level, anchor_id, start + offset, text)
+        self.jumps += [(anchor_id, start + offset) for (anchor_id, start) in outline.jumps]
+
+    # Return the headers (anchors with a level) as a nested list of
+    # links (the table of contents).
+    def table_of_contents(self):
+        html = []
+        levels = []
+        for (level, anchor_id, _, text) in self.anchors:
+            if (level is None): continue
+            # Start a nested list inside the open item of a lower level.
+            if (len(levels) > 0) and (level > levels[-1]):
+                html.append("\n<ul>")
+                levels.append(level)
+            else:
+                while (len(levels) > 0) and (level < levels[-1]):
+                    html.append("</li></ul>")
+                    levels.pop()
+                if (len(levels) > 0): html.append("</li>")
+                if (len(levels) == 0) or (level > levels[-1]):
+                    html.append("\n<ul>")
+                    levels.append(level)
+            html.append(f'\n<li><a class="jump" href="#{anchor_id}">{text.strip()}</a>')
+        html.append("</li></ul>" * len(levels))
+        return "\n<nav class='toc'>" + "".join(html) + "</nav>" if (len(html) > 1) else ""
+
+# Copy "n" integers from an array returned by the C library.
+def match_array(pointer, n):
+    values = array("l")
+    if (n > 0): values.frombytes(ctypes.string_at(pointer, n*values.itemsize))
+    return values
+
+# View arrays of match results as numpy arrays when numpy is installed.
+def match_views(*arrays):
+    try:    import numpy
+    except ImportError: return arrays
+    return tuple(numpy.frombuffer(a, dtype=a.typecode) for a in arrays)
+
+# Collect the arrays of matches produced by `matcha` or `fmatcha` and
+# free the C memory that held them. Returns None when the C library
+# reported "n" as -2 or -3, raises a RegexError for invalid regexes.
+# Byte offsets are converted to character offsets of "buffer" (in C)
+# when it is given.
+def match_arrays(regex, n, starts, ends, lines, buffer=None):
+    try:
+        if (n.value == -1):
+            translate_return_values(regex, starts[0], ends[0])
+            # An empty regular expression matches at the beginning.
+            return array("l",[0]), array("l",[0]), array("l",[1])
+        elif (n.value < 0): return None
+        if (buffer is not None):
+            REGEX_CLIB.utf8_char_offsets(buffer, n.value, starts)
+            REGEX_CLIB.utf8_char_offsets(buffer, n.value, ends)
+        return (match_array(starts, n.value), match_array(ends, n.value),
+                match_array(lines, n.value))
+    finally:
+        REGEX_CLIB.free_matches(starts)
+
+# Find all nonoverlapping matches for the given regex in string.
+#
+#   regex_match_all(regex, string) -> (starts, ends, lines) or RegexError,
+#
+# where "starts" and "ends" hold the (inclusive, exclusive) indices of
+# every match and "lines" holds the (1-indexed) line that each match
+# ends on. Matches are found leftmost first, and then longest (so "a*"
+# matches a whole run of "a"), and the search continues at the end of
+# each match. Indices are character offsets for a string (byte offsets
+# for bytes). The same substitutions as `regex_match` are made to "regex".
+def regex_match_all(regex, string, **translate_kwargs):
+    regex = translate_regex(regex, **translate_kwargs).encode("utf-8")
+    buffer = None
+    if (type(string) == str):
+        encoded = string.encode("utf-8")
+        if (len(encoded) != len(string)): buffer = encoded
+        string = encoded
+    n = ctypes.c_long()
+    starts = ctypes.POINTER(ctypes.c_long)()
+    ends = ctypes.POINTER(ctypes.c_long)()
+    lines = ctypes.POINTER(ctypes.c_long)()
+    REGEX_CLIB.matcha(regex, string, ctypes.byref(n), ctypes.byref(starts),
+                      ctypes.byref(ends), ctypes.byref(lines))
+    matches = match_arrays(regex, n, starts, ends, lines, buffer)
+    # An empty string has no matches.
+    if (matches is None): return match_views(array("l"), array("l"), array("l"))
+    return match_views(*matches)
+
+# Find all nonoverlapping matches for the given regex in the file at
+# "path", reading it in chunks from C (never loading it in Python).
+#
+#   regex_file_match_all(regex, path) -> (starts, ends, lines) or None,
+#
+# with byte offsets in "starts" and "ends" (the same matches as
+# `regex_match_all`). Returns None for files with a ratio of ASCII
+# characters below "min_ascii_ratio" (binary files), raises an OSError
+# if the file cannot be read. With more than one of "threads" the file
+# is split into chunks that are searched in parallel (each reading at
+# least "overlap" bytes past its end), and the results are the same as
+# searching the whole file at once.
+def regex_file_match_all(regex, path, min_ascii_ratio=0.0, threads=1,
+                         overlap=2**12, **translate_kwargs):
+    regex = translate_regex(regex, **translate_kwargs).encode("utf-8")
+    n = ctypes.c_long()
+    starts = ctypes.POINTER(ctypes.c_long)()
+    ends = ctypes.POINTER(ctypes.c_long)()
+    lines = ctypes.POINTER(ctypes.c_long)()
+    REGEX_CLIB.pfmatcha(regex, os.fsencode(path), ctypes.byref(n), ctypes.byref(starts),
+                        ctypes.byref(ends), ctypes.byref(lines), min_ascii_ratio,
+                        threads, overlap)
+    if (n.value == -2): raise(OSError(f"Could not read file '{path}'."))
+    matches = match_arrays(regex, n, starts, ends, lines)
+    if (matches is None): return None
+    return match_views(*matches)
+# ====================================================================
+
+
+# ====================================================================
+#                   External File Metadata Cache
+#
+# Metadata about files included with "{{<path>}}" (existence,
+# extension, declared size) is stored in memory by absolute path and
+# reused for as long as the (mtime, size) of the file is unchanged.
+# The cache can be saved to (and loaded from) a JSON file so that it
+# persists across runs over a batch of documents.
+#
+# Included text files ("{{<path>.txt}}") are parsed once and their
+# syntax trees are kept in memory by absolute path, reused while the
+# (mtime, size) of the file is unchanged or its contents hash the same.
+# The trees are never modified, so every document in a batch (or a
+# long running session) that includes a file shares one parsed copy.
+
+SNIFF_CHUNK = 2**16  # Number of bytes read at a time when sniffing a file.
+SNIFF_LIMIT = 2**24  # Maximum number of bytes searched for the first "<div".
+SNIFF_WINDOW = 2**12 # Number of bytes after "<div" searched for its style.
+INCLUDE_CACHE = {}   # Absolute path -> {"mtime":, "size":, "meta":}
+DATA_URI_CACHE = OrderedDict() # Hash of file contents -> encoded contents
+DATA_URI_CACHE_SIZE = 256      # Most encoded contents kept (least recently used are evicted).
+MIME_TYPES = {"png":"image/png", "jpg":"image/jpeg",
+              "jpeg":"image/jpeg", "svg":"image/svg+xml"}
+TEXT_INCLUDE_CACHE = {} # Absolute path -> (mtime, size, content hash, body, outline)
+TEXT_INCLUDE_LOCK = threading.Lock()
+# Absolute paths of the text files being rendered into the document.
+INCLUDE_STACK = contextvars.ContextVar("include_stack", default=())
+
+# Read the declared height and width of the first "<div" in an HTML
+# file. Only a bounded prefix of the file is read (in chunks), since
+# files produced by plotting libraries can be very large. Returns
+# (height, width) padded for display in an iframe, where each is None
+# if it was not declared in pixels.
+def sniff_html_size(path):
+    height = width = None
+    with open(path, "rb") as f:
+        window = b""
+        bytes_read = 0
+        index = -1
+        # Read chunks until the first div is found (keep an overlap so
+        # that "<div" is found even when split across two chunks).
+        while (index < 0) and (bytes_read < SNIFF_LIMIT):
+            chunk = f.read(SNIFF_CHUNK)
+            if (len(chunk) == 0): break
+            bytes_read += len(chunk)
+            window = window[-3:] + chunk
+            index = window.find(b"<div")
+        if (index < 0): return height, width
+        # Extend the window to contain the opening tag of the div.
+        window = window[index:]
+        if (len(window) < SNIFF_WINDOW):
+            window += f.read(SNIFF_WINDOW - len(window))
+    contents = window[:SNIFF_WINDOW].decode("utf-8", errors="replace")
+    # Get the 'style' declaration of the first div
+    contents = contents[contents.find("style="):]
+    # Strip everything after the style declaration
+    contents = contents[:contents.find("class=")]
+    # Get the contents of the style declaration
+    contents = contents[contents.find('"')+1:]
+    contents = contents[:contents.find('"')]
+    # Check for a declared height and width.
+    if ("height" in contents):
+        # Retreive the height from the style
+        new_height = contents[contents.index("height:") + len("height:"):]
+        new_height = new_height[:new_height.index(";")]
+        # If it's in pixels, add a 20 pixel pad
+        if ("px" in new_height):
+            new_height = new_height.replace("px","")
+            height = str(float(new_height.strip()) + 20) + "px"
+    if ("width" in contents):
+        # Retreive the width from the style
+        new_width = contents[contents.index("width:") + len("width:"):]
+        new_width = new_width[:new_width.index(";")]
+        # If it's in pixels, add a 10 pixel pad
+        if ("px" in new_width):
+            new_width = new_width.replace("px","")
+            width = str(float(new_width.strip()) + 10) + "px"
+    return height, width
+
+# Read the intrinsic (width, height) in pixels of a PNG, JPEG, or SVG
+# image from the header of the file. Returns None if the size cannot
+# be determined from the first SNIFF_CHUNK bytes of the file.
+def image_size(path, extension):
+    with open(path, "rb") as f:
+        header = f.read(SNIFF_CHUNK)
+    if (extension == "png"):
+        # Signature (8 bytes), IHDR length and type (8), width, height.
+        if (header[:8] == b"\x89PNG\r\n\x1a\n") and (header[12:16] == b"IHDR"):
+            return (int.from_bytes(header[16:20], "big"),
+                    int.from_bytes(header[20:24], "big"))
+    elif (extension in {"jpg","jpeg"}):
+        # Walk the segments until a "start of frame" marker is found.
+        i = 2
+        while (i+9 <= len(header)) and (header[i] == 0xFF):
+            marker = header[i+1]
+            if (marker in {0xD8, 0x01}) or (0xD0 <= marker <= 0xD7):
+                i += 2
+                continue
+            if (0xC0 <= marker <= 0xCF) and (marker not in {0xC4, 0xC8, 0xCC}):
+                return (int.from_bytes(header[i+7:i+9], "big"),
+                        int.from_bytes(header[i+5:i+7], "big"))
+            i += 2 + int.from_bytes(header[i+2:i+4], "big")
+    elif (extension == "svg"):
+        text = header.decode("utf-8", errors="replace")
+        tag = text[text.find("<svg"):]
+        tag = tag[:tag.find(">")]
+        # Read the (quoted) value of an attribute of the svg tag, None
+        # when it is missing, empty, or not terminated.
+        def attribute(name):
+            index = tag.find(f" {name}=")
+            if (index < 0): return None
+            value = tag[index+len(name)+2:].lstrip()
+            if (len(value) == 0) or (value[0] not in "'\""): return None
+            end = value.find(value[0],1)
+            if (end < 0): return None
+            return value[1:end].strip() or None
+        # Use the width and height (in pixels), or the view box.
+        size = [attribute("width"), attribute("height")]
+        if not all((s is not None) and s.replace("px","").replace(".","",1).isdigit() for s in size):
+            view_box = attribute("viewBox")
+            if (view_box is None): return None
+            size = view_box.replace(","," ").split()[2:]
+        try:
+            width, height = (float(s.replace("px","")) for s in size)
+            return (round(width), round(height))
+        except ValueError: pass
+    return None
+
+# Get the metadata for an included file at "path" (relative to the
+# current working directory), using the cache when the file has not
+# changed since it was last read. Returns a dictionary with keys
+# "exists", "extension", "size", "height", "width" (declared iframe
+# size of HTML files), and "dimensions" (intrinsic size of images).
+def include_metadata(path):
+    extension = path[-path[::-1].find("."):]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return dict(exists=False, extension=extension, size=0,
+                    height=None, width=None, dimensions=None)
+    key = os.path.abspath(path)
+    entry = INCLUDE_CACHE.get(key, {})
+    # Entries saved before images were probed have no "dimensions".
+    if ((entry.get("mtime") != stat.st_mtime_ns) or (entry.get("size") != stat.st_size)
+        or ("dimensions" not in entry.get("meta", {}))):
+        meta = dict(exists=True, extension=extension, size=stat.st_size,
+                    height=None, width=None, dimensions=None)
+        if (extension == "html"):
+            meta["height"], meta["width"] = sniff_html_size(path)
+        elif (extension in {"png","jpg","jpeg","svg"}):
+            meta["dimensions"] = image_size(path, extension)
+        entry = dict(mtime=stat.st_mtime_ns, size=stat.st_size, meta=meta)
+        INCLUDE_CACHE[key] = entry
+    return entry["meta"]
+
+# Load a saved include metadata cache from a JSON file (if it exists).
+def load_include_cache(cache_path):
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            INCLUDE_CACHE.update(json.load(f))
+
+# Save the include metadata cache to a JSON file.
+def save_include_cache(cache_path):
+    with open(cache_path, "w") as f:
+        json.dump(INCLUDE_CACHE, f)
+
+# Return the value in DATA_URI_CACHE for "key", computing it with
+# "encode" when it is not there. At most DATA_URI_CACHE_SIZE values are
+# kept, the least recently used are evicted first.
+def cached_encoding(key, encode):
+    if (key in DATA_URI_CACHE):
+        try:
+            DATA_URI_CACHE.move_to_end(key)
+            return DATA_URI_CACHE[key]
+        except KeyError: pass # Evicted by another thread.
+    value = DATA_URI_CACHE[key] = encode()
+    while (len(DATA_URI_CACHE) > DATA_URI_CACHE_SIZE):
+        try:    DATA_URI_CACHE.popitem(last=False)
+        except KeyError: break
+    return value
+
+# Read the contents of a (small) included file, returning the cached
+# "data:" URI for those contents. The cache is keyed by a hash of the
+# contents, so an asset shared by many documents is only encoded once.
+def data_uri(path, extension):
+    with open(path, "rb") as f:
+        contents = f.read()
+    def encode():
+        encoded = base64.b64encode(contents).decode("ascii")
+        return f"data:{MIME_TYPES[extension]};base64,{encoded}"
+    return cached_encoding(hashlib.sha1(contents).hexdigest() + extension, encode)
+
+# Read the contents of a (small) included HTML fragment, returning
+# None if the file is a full document or is not UTF-8 encoded text
+# (and must stay in an iframe).
+def html_fragment(path):
+    with open(path, "rb") as f:
+        contents = f.read()
+    def encode():
+        try: text = contents.decode("utf-8")
+        except UnicodeDecodeError: return None
+        return None if ("<html" in text.lower()) else text
+    return cached_encoding(hashlib.sha1(contents).hexdigest() + "html", encode)
+
+# Yield the rows (lists of cells) of the CSV file at "path" one at a time.
+def csv_rows(path):
+    import csv
+    if (not os.path.exists(path)):
+        raise(MissingFile(f"\n\n  Included CSV file '{path}' does not exist."))
+    with open(path, newline="") as f:
+        yield from csv.reader(f)
+
+# Return the rows of the CSV file at "path" as an HTML table (one
+# string). The file is parsed one row at a time, so the parsed cells
+# are never all held in memory, but the HTML of the whole table is.
+def csv_table(path):
+    escapes = str.maketrans(SPECIAL_HTML_CHARS)
+    rows = ("\n<tr>" + "".join("<td>" + cell.translate(escapes) + "</td>" for cell in row) + "</tr>"
+            for row in csv_rows(path))
+    return "\n<table>" + "".join(rows) + "</table>"
+
+# Return the absolute path of an included text file. A relative path
+# is relative to the directory of the text file that includes it, or
+# to the current working directory for the document being converted.
+def include_path(path, including=()):
+    if (len(including) > 0): path = os.path.join(os.path.dirname(including[-1]), path)
+    return os.path.abspath(path)
+
+# Return the parsed body of the text file at (absolute) "path" and its
+# Outline, parsing it only when it has changed.
+def parse_include(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise(MissingFile(f"\n\n  Included text file '{path}' does not exist."))
+    with TEXT_INCLUDE_LOCK:
+        entry = TEXT_INCLUDE_CACHE.get(path)
+    if (entry is not None) and (entry[:2] == (stat.st_mtime_ns, stat.st_size)):
+        return entry[3], entry[4]
+    with open(path, "rb") as f:
+        contents = f.read()
+    digest = hashlib.sha256(contents).hexdigest()
+    if (entry is not None) and (entry[2] == digest):
+        body, outline = entry[3], entry[4]
+    else:
+        # Read new lines the same way as reading a file (universal new lines).
+        text = contents.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        body, outline = parse_section(text, on_new_line=True, progress=False)
+    with TEXT_INCLUDE_LOCK:
+        TEXT_INCLUDE_CACHE[path] = (stat.st_mtime_ns, stat.st_size, digest, body, outline)
+    return body, outline
+
+# Walk a parsed body and return {absolute path: (body, outline)}
+# for every text file it includes (directly, or through other included
+# files). Raises an IncludeCycle if a file (eventually) includes itself.
+def text_includes(body):
+    includes = {}
+    # Stack of (iterator over elements, paths of the including files).
+    stack = [(iter(body), ())]
+    while (len(stack) > 0):
+        elements, including = stack[-1]
+        for el in elements:
+            if (type(el) == External) and (el.extension() == "txt"):
+                path = include_path(el.path(), including)
+                if (path in including):
+                    chain = " -> ".join(including + (path,))
+                    raise(IncludeCycle(f"\n\n  Text file includes itself, {chain}"))
+                if (path in includes): continue
+                includes[path] = parse_include(path)
+                stack.append((iter(includes[path][0]), including + (path,)))
+                break
+            elif (type(el) != str):
+                stack.append((iter(el), including))
+                break
+        else:
+            stack.pop()
+    return includes
+# ====================================================================
+
+
+# ====================================================================
+#                    Conversion Timeline Tracing
+#
+# A Trace records the phases of a conversion (reading the header,
+# parsing, rendering, formatting HTML) and the processing and the
+# rendering of every syntax and block as "complete" events in the
+# Chrome Trace Event format, which can be loaded into Perfetto or
+# "chrome://tracing". Syntax events hold the source offsets (start,
+# end) and the nesting depth. If "sample" is less than one, only that
+# fraction of syntax events is recorded (evenly spaced, so results
+# are repeatable). Nothing is recorded unless a Trace is given.
+
+class Trace:
+    def __init__(self, sample=1.0):
+        self.sample = sample
+        self.credit = 0.0
+        self.events = []
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.start = time.perf_counter()
+
+    # Return the current time (microseconds since the trace started) if
+    # the next syntax event should be recorded, otherwise None.
+    def begin(self):
+        self.credit += self.sample
+        if (self.credit < 1): return None
+        self.credit -= 1
+        return (time.perf_counter() - self.start) * 10**6
+
+    # Record an event that began at time "began" (from `begin`).
+    def end(self, name, category, began, **args):
+        if (began is None): return
+        self.events.append({"name":name, "cat":category, "ph":"X", "ts":began,
+                            "dur":(time.perf_counter() - self.start) * 10**6 - began,
+                            "pid":self.pid, "tid":self.tid, "args":args})
+
+    # Record the phase of a conversion that runs inside this context.
+    @contextlib.contextmanager
+    def phase(self, name):
+        began = (time.perf_counter() - self.start) * 10**6
+        try:     yield
+        finally: self.end(name, "phase", began)
+
+    # Return the trace as a Chrome Trace Event JSON compatible dict.
+    def json(self):
+        return {"traceEvents":self.events, "displayTimeUnit":"ms"}
+
+    # Save the trace to a JSON file at "path".
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.json(), f)
+
+# Return a context that records a phase in "trace" (if there is one).
+def trace_phase(trace, name):
+    return trace.phase(name) if (trace is not None) else contextlib.nullcontext()
+
+# ====================================================================
+#                    Conversion Memory Reporting
+#
+# A MemoryReport measures the memory used by every stage of a
+# conversion (reading the lines, building the Document, parsing,
+# rendering, formatting HTML) with "tracemalloc". A snapshot is taken
+# at each stage boundary, and every stage records the peak traced
+# memory during the stage, the net change in traced memory, and the
+# "top" call sites that allocated the most memory still held at its
+# end. Memory is only traced while a report is open ("with report:"),
+# conversions given a MemoryReport open it when it is not open yet.
+
+class MemoryReport:
+    def __init__(self, top=5):
+        self.top = top
+        self.stages = []
+        self.tracing = False
+        self.snapshot = None
+        self.current = 0
+        # True if tracing was started by this report (and must be stopped).
+        self.started = False
+
+    def __enter__(self):
+        import tracemalloc
+        self.started = not tracemalloc.is_tracing()
+        if self.started: tracemalloc.start()
+        self.tracing = True
+        self.snapshot = tracemalloc.take_snapshot()
+        self.current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exception):
+        import tracemalloc
+        self.tracing = False
+        self.snapshot = None
+        if self.started: tracemalloc.stop()
+
+    # Record the stage of a conversion that ended now (and began at the
+    # end of the last stage, or when the report was opened).
+    def stage(self, name):
+        import tracemalloc
+        if (not self.tracing): return
+        current, peak = tracemalloc.get_traced_memory()
+        previous, self.snapshot = self.snapshot, tracemalloc.take_snapshot()
+        top = []
+        for stat in self.snapshot.compare_to(previous, "lineno"):
+            if (len(top) >= self.top) or (stat.size_diff <= 0): break
+            frame = stat.traceback[0]
+            if (frame.filename == tracemalloc.__file__): continue
+            top.append({"site":f"{frame.filename}:{frame.lineno}",
+                        "size":stat.size_diff, "count":stat.count_diff})
+        self.stages.append({"stage":name, "peak":peak, "net":current - self.current,
+                            "current":current, "top":top})
+        del previous
+        self.current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+    # Return the report as a table (sizes of stages in megabytes, and
+    # of the call sites that allocated the most in kilobytes).
+    def table(self):
+        lines = [f"{'stage':>10s}  {'peak (MB)':>10s}  {'net (MB)':>9s}  {'current (MB)':>12s}"]
+        for stage in self.stages:
+            lines.append(f"{stage['stage']:>10s}  {stage['peak']/2**20:10.2f}  "
+                         f"{stage['net']/2**20:+9.2f}  {stage['current']/2**20:12.2f}")
+            for site in stage["top"]:
+                filename, lineno = site["site"].rsplit(":", 1)
+                lines.append(f"{'':10s}  {site['size']/2**10:+7.1f} KB  {site['count']:+9d} blocks  "
+                             f"{os.path.basename(filename)}:{lineno}")
+        return "\n".join(lines)
+
+    # Return the report as a JSON compatible dict (sizes in bytes).
+    def json(self):
+        return {"stages":self.stages}
+
+    # Save the report to a JSON file at "path".
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.json(), f, indent=2)
+
+# Record the end of a stage in "memory" (if there is a MemoryReport).
+def memory_stage(memory, name):
+    if (memory is not None): memory.stage(name)
+
 # ====================================================================
 
 
@@ -596,14 +1395,122 @@ def regex_match(regex, string, **translate_kwargs):
 
 NEWLINE = "((\r\n)|\r|\n)"
 ON_NEW_LINE = f"^{NEWLINE}"
+NEWLINE_CHARS = ("\r", "\n") # A string starting with one matches ON_NEW_LINE.
 ESCAPE_CHAR = "^\\"
 EOF = "END_OF_ORIGINAL_FILE"
 SPECIAL_HTML_CHARS = {"<":"&lt;", ">":"&gt;"}
+SHARE_MAX_LENGTH = 256  # Longest text of a syntax that identical copies share (0 for none).
+RENDER_MEMO_SIZE = 4096 # Most outputs of repeated syntaxes kept while rendering (0 for none).
 class UnsupportedExtension(Exception): pass
 class IncompleteSyntax(Exception): pass
 class MissingFile(Exception): pass
+class IncludeCycle(Exception): pass
 class SyntaxError(Exception): pass
 class AuthorError(Exception): pass
+class CitationWarning(UserWarning): pass
+class JumpWarning(UserWarning): pass
+
+# Special characters of the regex language (see 'regex.c').
+REGEX_SPECIAL = set(".*?|()[]{}")
+# Anchored regular expression -> literal text that starts every match.
+LITERAL_PREFIXES = {}
+
+# Return the literal text that every match of an anchored ("^") regex
+# must start with (e.g., "))" for "^[)][)]" and "]]" for "^(]])"), or
+# "" if it has none.
+def literal_prefix(regex):
+    prefix = LITERAL_PREFIXES.get(regex)
+    if (prefix is not None): return prefix
+    prefix = read_literals(regex, 1)[0] if regex.startswith("^") else ""
+    LITERAL_PREFIXES[regex] = prefix
+    return prefix
+
+# Read the tokens of a regex from position "i" up to "end" that always
+# match one literal character (a character, a set of one character, or
+# a group of such tokens with one alternative). Returns the literal
+# text and the position of the first token that was not read.
+def read_literals(regex, i, end=None):
+    if (end is None): end = len(regex)
+    literals = []
+    while (i < end):
+        start = i
+        # Read the next token, a "]" only has meaning when closing a set.
+        if (regex[i] not in REGEX_SPECIAL) or (regex[i] == "]"):
+            chars, i = regex[i], i+1
+        elif (regex[i] == "[") and (regex[i+1:i+2] != "]") and (regex[i+2:i+3] == "]"):
+            chars, i = regex[i+1], i+3
+        elif (regex[i] == "(") and (")" in regex[i+1:end]):
+            j = regex.index(")", i+1)
+            if ("(" in regex[i+1:j]) or ("|" in regex[i+1:j]): break
+            chars, k = read_literals(regex, i+1, j)
+            # Keep the start of a group that is not all literal (and
+            # that may not be skipped).
+            if (k < j):
+                if (regex[j+1:j+2] not in {"*", "?", "|"}): literals.append(chars)
+                return "".join(literals), start
+            i = j+1
+        else: break
+        # Stop at a token that may be skipped or replaced.
+        if (regex[i:i+1] in {"*", "?", "|"}): return "".join(literals), start
+        literals.append(chars)
+    return "".join(literals), i
+
+# Anchored regular expression -> set of characters that can start a
+# match (None when that is not known).
+FIRST_CHARACTERS = {}
+
+# Return the set of characters that can start a match of an anchored
+# ("^") regex, e.g., the digits for "^[0123456789][0123456789]*[.]".
+def first_characters(regex):
+    if (regex in FIRST_CHARACTERS): return FIRST_CHARACTERS[regex]
+    chars = None
+    if (regex[:1] == "^") and (len(regex) > 1):
+        i = 1
+        # Read the first token (a character, a set, or a group).
+        if (regex[i] not in REGEX_SPECIAL):
+            chars, i = {regex[i]}, i+1
+        elif (regex[i] == "[") and ("]" in regex[i+2:]):
+            j = regex.index("]", i+2)
+            chars, i = set(regex[i+1:j]), j+1
+        elif (regex[i] == "("):
+            depth, j = 1, i+1
+            while (j < len(regex)) and (depth > 0):
+                if   (regex[j] == "["): j = regex.find("]", j+2)
+                elif (regex[j] == "("): depth += 1
+                elif (regex[j] == ")"): depth -= 1
+                j = j+1 if (j >= 0) else len(regex)
+            group = regex[i+1:j-1]
+            if (depth == 0) and ("|" not in group):
+                chars, i = first_characters("^" + group), j
+        # The first token does not have to start a match that may skip it.
+        if (regex[i:i+1] in {"*", "?", "|"}): chars = None
+    FIRST_CHARACTERS[regex] = chars
+    return chars
+
+# Grammar (by id) -> (grammar, size, syntaxes to check inline, syntaxes
+# to check on a new line), where the syntaxes to check are a dictionary
+# {character: syntaxes} and the syntaxes to check for other characters.
+GRAMMAR_CANDIDATES = {}
+
+# Return the syntaxes of a grammar to check (in order) at a position of
+# a document, given whether it is on a new line and the character at
+# that position. Syntaxes are only checked where that character can
+# start them, and syntaxes that must start on a new line are only
+# checked at the first character of a line (its marker).
+def grammar_candidates(grammar, new_line, char):
+    candidates = GRAMMAR_CANDIDATES.get(id(grammar))
+    if (candidates is None) or (candidates[0] is not grammar) or (candidates[1] != len(grammar)):
+        # The characters that can start each syntax (None for any).
+        markers = [first_characters(s.start) for s in grammar]
+        chars = set().union(*(m for m in markers if (m is not None)))
+        def select(new_line):
+            syntaxes = [(s,m) for (s,m) in zip(grammar, markers) if (new_line or (not s.line_start))]
+            on_char = {c: tuple(s for (s,m) in syntaxes if (m is None) or (c in m)) for c in chars}
+            return on_char, tuple(s for (s,m) in syntaxes if (m is None))
+        candidates = GRAMMAR_CANDIDATES[id(grammar)] = (
+            grammar, len(grammar), select(False), select(True))
+    on_char, other = candidates[3 if new_line else 2]
+    return on_char.get(char, other)
 
 # Base class for defining a syntax in text.
 class Syntax(list):
@@ -620,51 +1527,125 @@ class Syntax(list):
     allow_escape = True # True if escape characters are allowed in this syntax
     return_end = True   # True if the "end" regular expression should be returned
     modifiable = True   # True if "Modifier" class content is allowed to update "pack"
+    raw = False         # True if the body is all text up to the (literal) "end"
+    shareable = True    # True if identical copies can share one object (see `Document.share`)
+    shared = False      # True if this object is shared by identical copies
+    repeated = False    # True if this shared object was found more than once
     
     # Function for handling unprocessed strings. If this syntax is
     # supposed to be closed then an error is raised, otherwise the
-    # body is returned.
-    def not_closed(self, body):
+    # body is returned. "i" is the position where this syntax started.
+    def not_closed(self, body, document, i=None):
         if self.closed:
-            raise(IncompleteSyntax(f"\n\n  {str(type(self))} {str(body)}"))
+            raise(self.incomplete(document, i, f"{str(body)}"))
         else:
-            return body, "", ""
+            return body, "", len(document)
+
+    # Return the error for this syntax not being closed after it was
+    # started at position "i" in a document (when that is known).
+    def incomplete(self, document, i, description):
+        position = ""
+        if (i is not None): position = "line {}, column {}: ".format(*document.line_column(i))
+        return IncompleteSyntax(f"\n\n  {position}{str(type(self))} {description}")
+
+    # Returns True if the end of this syntax could be found at or after
+    # position "i" of a document. Checks the literal text that starts
+    # every match of "end" against the last place it occurs, so that a
+    # syntax that can never be closed is rejected without scanning.
+    def closable(self, document, i):
+        return document.last_index(literal_prefix(self.end)) >= i
 
     # Function for packing text into HTML (to be overwritten by subclasses)
     def pack(self, text):
         return text
 
-    # Recursive function for rendering output text from nested strings
-    # and Syntax objects to produce final processed output text.
-    def render(self, spacing="", verbose=False):
-        if verbose: print(spacing, "Rendering", TYPE(self), INLINE(self.match))
-        text = ""
-        modifier = ""
-        for el in self:
-            if type(el) == str:        text += el
-            elif type(el) == Modifier: modifier += el.render(spacing+"  ", verbose)
-            else:                      text += el.render(spacing+"  ", verbose)
-        # Pack the output, modify if that is allowed
-        output = self.pack(text)
-        if (self.modifiable and (len(modifier) > 0)):
-            # Add the modifier to the element
-            output = output.replace(">",f" {modifier}>",1)
-            if verbose: print(INLINE(output))
-        return output
+    # Return the rendered contents of this syntax (the text given to "pack").
+    def contents(self):
+        return "".join(el if (type(el) == str) else el.render()
+                       for el in self if (type(el) != Modifier))
 
-    # Returns the length of the match at the beginning of a string
-    # that fits the "start" regular expression for this syntax.
-    def starts(self, string):
-        match = regex_match(self.start, str(string))
-        if (match is not None): return True, string[match[0]:match[1]-self.extra_s]
+    # Function for packing text into plain text (for the "text" target)
+    def pack_text(self, text):
+        return text
+
+    # Function for packing the (JSON) nodes of the contents of this
+    # syntax into a node (for the "json" target).
+    def pack_json(self, children):
+        return self.node(children)
+
+    # Return a JSON node for this syntax with the given attributes.
+    def node(self, children, **attributes):
+        return dict(type=type(self).__name__, **attributes, children=children)
+
+    # Function for rendering output text from nested strings and Syntax
+    # objects to produce final processed output text (HTML, unless
+    # another Renderer is given). Nested syntaxes are rendered in the
+    # same loop with an explicit stack of frames [syntax, index of next
+    # element, text, modifier, spacing, began].
+    # If "trace" is a Trace, an event is recorded for every syntax.
+    # If "memo" is a dictionary, the outputs of repeated syntaxes are
+    # kept in it (by id) and reused (see `Document.share`).
+    def render(self, spacing="", verbose=False, trace=None, renderer=None, memo=None):
+        if (renderer is None): renderer = RENDERERS["html"]
+        if (memo is not None) and self.repeated and (id(self) in memo): return memo[id(self)]
+        if verbose: print(spacing, "Rendering", TYPE(self), INLINE(self.match))
+        stack = [[self, 0, [], [], spacing, trace.begin() if (trace is not None) else None]]
+        while True:
+            frame = stack[-1]
+            syntax, i, text, modifier, spacing, began = frame
+            # Add strings and descend into the next nested syntax
+            while (i < len(syntax)):
+                el = syntax[i]
+                i += 1
+                if type(el) == str: text.append(el)
+                else: break
+            else:
+                el = None
+            frame[1] = i
+            if (el is not None):
+                # Reuse the output of a repeated syntax
+                if (memo is not None) and el.repeated and (id(el) in memo):
+                    frame[3 if (type(el) == Modifier) else 2].append(memo[id(el)])
+                    continue
+                # Indent verbose output (only) for nested syntax
+                if verbose:
+                    spacing += "  "
+                    print(spacing, "Rendering", TYPE(el), INLINE(el.match))
+                stack.append([el, 0, [], [], spacing,
+                              trace.begin() if (trace is not None) else None])
+                continue
+            # Pack the output, modify if that is allowed
+            output = renderer.pack(syntax, renderer.join(text))
+            if (syntax.modifiable and (len(modifier) > 0)):
+                # Add the modifier to the element
+                output = renderer.modify(output, modifier)
+                if verbose: print(INLINE(output))
+            # Remember the output of a repeated syntax (dropping the oldest)
+            if (memo is not None) and syntax.repeated:
+                if (len(memo) >= RENDER_MEMO_SIZE): del memo[next(iter(memo))]
+                memo[id(syntax)] = output
+            stack.pop()
+            if (trace is not None):
+                trace.end(type(syntax).__name__, "render", began,
+                          depth=len(stack), length=len(output))
+            if (len(stack) == 0): return output
+            # Add the output to the parent (as a modifier or text)
+            if type(syntax) == Modifier: stack[-1][3].append(output)
+            else:                        stack[-1][2].append(output)
+
+    # Returns the match at position "i" of a document that fits the
+    # "start" regular expression for this syntax.
+    def starts(self, document, i):
+        match = document.match(self.start, i, i+MAX_REGEX_LEN)
+        if (match is not None): return True, document.text[i+match[0]:i+match[1]-self.extra_s]
         else:                   return False, ""
 
-    # Returns the length of the match at the beginning of a string
-    # that fits the "end" regular expression for this syntax.
-    def ends(self, string, start):
-        match = regex_match(self.end, str(string))
+    # Returns the match at position "i" of a document that fits the
+    # "end" regular expression for this syntax.
+    def ends(self, document, i, start):
+        match = document.match(self.end, i, i+MAX_REGEX_LEN)
         if (match is not None):
-            match = string[match[0]:match[1]-self.extra_e]
+            match = document.text[i+match[0]:i+match[1]-self.extra_e]
             if self.symmetric:
                 if (len(start) == len(match)): 
                     return True, (start if self.return_end else "")
@@ -675,90 +1656,180 @@ class Syntax(list):
         else:
             return False, ""
 
-    # Recursive function for processing a string into a Syntax heirarchy.
-    def process(self, string, i, start="", spacing="", verbose=False):
-        # Get the global variable for the last print time.
+    # Function for processing a Document (from position "i") into a
+    # Syntax heirarchy, returns the body, the string this syntax ended
+    # on, and the position in the document after that end. Nested
+    # syntaxes are processed in the same loop, the state of every open
+    # (parent) syntax is kept on an explicit stack instead of recursing.
+    # 
+    # A syntax that must be closed but whose end cannot be found later
+    # in the document raises an IncompleteSyntax error when it starts.
+    # If "errors" is a list, then the start of every syntax that is not
+    # closed is treated as literal text and the errors are appended to
+    # "errors" (in order of position) instead of being raised.
+    # The number of characters left is shown if "progress" is True. If
+    # "trace" is a Trace, an event is recorded for every sub-syntax.
+    # If "stops" is a set of positions, processing ends early (with the
+    # body so far) at the first of them that starts a line while no
+    # sub-syntax is open, where the rest of the document could be
+    # processed independently (see `parse_body`). If "until" is given,
+    # processing ends (returning no body) once it passes that position.
+    def process(self, document, i, start="", spacing="", verbose=False,
+                errors=None, progress=True, trace=None, stops=None, until=None):
+        # Get the global variables for the last print time and notes.
         global LAST_PRINT_TIME
-        if verbose: print(spacing,"Begin",TYPE(self),INLINE(start))
-        # Initialize a new copy of this class to hold contents (and keep match)
-        body = type(self)([""])
-        body.match = start
-        new_line = regex_match(ON_NEW_LINE, str(start)) is not None
-        escaped = self.allow_escape and (regex_match(ESCAPE_CHAR, str(start)) is not None)
-        if (escaped): start = start[:-1]
-        # Initialize remaining length of string (>0 to allow matching "")
-        remaining = max(1, len(string)-i)
-        # Search the string for the start and end of this syntax
-        while remaining > 0:
-            # First, check to see if this syntax has ended
-            found, end = self.ends(string[i:i+MAX_REGEX_LEN], start)
-            if found:
-                # If this syntax has completed, return
-                if verbose: print(spacing, " End", TYPE(self), INLINE(body))
-                return body, str(string[i:i+len(end)]), string[i+len(end):]
-            # Check for the beginnings of any sub-syntaxes
-            for g, syntax in enumerate(self.grammar):
-                # Skip syntax that requires being at the start of a new line
-                if (syntax.line_start and (not new_line)): continue
-                if (syntax.escapable  and (escaped)): continue
-                # Search for the syntax at this part of the string
-                found, syntax_start = syntax.starts(string[i:i+MAX_REGEX_LEN])
+        string = document.text
+        stack = []
+        syntax = self
+        # Position where the current syntax started (unknown for this one).
+        opened = None
+        # Time when the current syntax started (if it is being traced).
+        began = None
+        # Characters before this position are not checked for syntax.
+        literal_until = i
+        # Begin processing a syntax that started with the string "start".
+        def begin(syntax, start, spacing):
+            if verbose: print(spacing,"Begin",TYPE(syntax),INLINE(start))
+            # Initialize a new copy of this class to hold contents (and keep match)
+            body = type(syntax)([""])
+            body.match = start
+            new_line = start[:1] in NEWLINE_CHARS
+            escaped = syntax.allow_escape and (regex_match(ESCAPE_CHAR, str(start)) is not None)
+            if (escaped): start = start[:-1]
+            # Always look at least once (to allow matching "" at the end)
+            first = True
+            return [body, start, new_line, escaped, first]
+        body, start, new_line, escaped, first = begin(syntax, start, spacing)
+        # Search the string for the start and end of each syntax
+        while True:
+            result = None
+            # Stop at a line that starts outside of every sub-syntax
+            if (stops is not None) and (len(stack) == 0) and new_line and (
+                    not escaped) and (i in stops):
+                return body, "", i
+            if (until is not None) and (i > until): return None, "", i
+            # Take all the text up to the end of a raw syntax at once
+            if syntax.raw and (i < len(string)):
+                j = string.find(literal_prefix(syntax.end), i)
+                if (j < 0): j = len(string)
+                body[-1] += string[i:j]
+                i, first = j, False
+            if (first or (i < len(string))):
+                first = False
+                # First, check to see if this syntax has ended
+                found, end = syntax.ends(document, i, start)
                 if found:
-                    assert len(syntax_start) > 0, (
-                        "Expected nonzero length 'syntax_start'.\n\n"
-                        f" {g} - {type(syntax)}\n"
-                        f" Start: {repr(syntax.start)}\n"
-                        f" End:   {repr(syntax.end)}\n"
-                        f" Extra: {(syntax.extra_s, syntax.extra_e)}\n"
-                        f" Match:  {repr(syntax_start)}\n"
-                        f" String: {repr(string[i:i+MAX_REGEX_LEN])}"
-                    )
-                    # Update the global variable if a note was found.
-                    if (type(syntax) == Note):
-                        global FOUND_NOTE; FOUND_NOTE = True
-                    contents, ends_on, string = syntax.process(
-                        string[i+len(syntax_start):], 0, syntax_start, 
-                        spacing+"  ", verbose)
-                    i = 0
-                    body.append(contents)
-                    # Record whether or not we are currently on a new line
-                    new_line = regex_match(ON_NEW_LINE, ends_on) is not None
-                    new_line = new_line or (type(body[-1]) == NewLine)
-                    # Record whether or not trailing character was ESCAPE_CHAR
-                    escaped = self.allow_escape and (
-                        regex_match(ESCAPE_CHAR, str(ends_on)) is not None)
-                    break
-            else:
-                # Add string contents appropriately
-                if (len(body) == 0) or (type(body[-1]) != str):
-                    body.append(string[i])
+                    # If this syntax has completed, return to its parent
+                    if verbose: print(spacing, " End", TYPE(syntax), INLINE(body))
+                    result = (body, string[i:i+len(end)], i+len(end))
                 else:
-                    body[-1] += string[i]
+                    # Check for the beginnings of any sub-syntaxes (that
+                    # could start here given the marker of a new line)
+                    candidates = grammar_candidates(syntax.grammar, new_line, string[i:i+1])
+                    for sub_syntax in (candidates if (i >= literal_until) else ()):
+                        if (sub_syntax.escapable  and (escaped)): continue
+                        # Search for the syntax at this part of the string
+                        found, syntax_start = sub_syntax.starts(document, i)
+                        if found: break
+                    # Reject a syntax that can never be closed
+                    if found and sub_syntax.closed and (
+                            not sub_syntax.closable(document, i+len(syntax_start))):
+                        error = sub_syntax.incomplete(
+                            document, i, f"started with {repr(syntax_start)} is never closed.")
+                        if (errors is None): raise(error)
+                        # Treat the start of the syntax as literal text
+                        errors.append(error)
+                        literal_until = i + len(syntax_start)
+                        found = False
+                    # Split the rest of a table row at once, a body parsed
+                    # with the full grammar starts an entry at every "|"
+                    if found and (type(sub_syntax) == TableEntry) and (syntax.grammar is ALL_GRAMMAR):
+                        entries, j = sub_syntax.row(document, i, errors=errors, trace=trace)
+                        if (len(entries) > 0):
+                            body.extend(entries)
+                            i, new_line, escaped = j, False, False
+                            continue
+                    if found:
+                        assert len(syntax_start) > 0, (
+                            "Expected nonzero length 'syntax_start'.\n\n"
+                            f" {syntax.grammar.index(sub_syntax)} - {type(sub_syntax)}\n"
+                            f" Start: {repr(sub_syntax.start)}\n"
+                            f" End:   {repr(sub_syntax.end)}\n"
+                            f" Extra: {(sub_syntax.extra_s, sub_syntax.extra_e)}\n"
+                            f" Match:  {repr(syntax_start)}\n"
+                            f" String: {repr(string[i:i+MAX_REGEX_LEN])}"
+                        )
+                        # Save this syntax and begin processing the sub-syntax
+                        stack.append((syntax, body, start, new_line, escaped, spacing,
+                                      opened, len(errors) if (errors is not None) else 0, began))
+                        syntax = sub_syntax
+                        if verbose: spacing += "  "
+                        opened = i
+                        if (trace is not None): began = trace.begin()
+                        i += len(syntax_start)
+                        body, start, new_line, escaped, first = begin(syntax, syntax_start, spacing)
+                        continue
+                    else:
+                        # Add string contents appropriately
+                        if (len(body) == 0) or (type(body[-1]) != str):
+                            body.append(string[i])
+                        else:
+                            body[-1] += string[i]
+                        # Record whether or not we are currently on a new line
+                        new_line = string[i] in NEWLINE_CHARS
+                        # Allow for the escaping of the escape character
+                        if not escaped:
+                            # Record whether or not we are currently escaping
+                            escaped = syntax.allow_escape and (document.match(ESCAPE_CHAR, i, i+1) is not None)
+                            if (escaped): body[-1] = body[-1][:-1]
+                        else: 
+                            # Otherwise, reset the current escaped status
+                            escaped = False
+                            # Check for special HTML characters that need to be
+                            # automatically escaped (if escaping is allowed)
+                            if (string[i] in SPECIAL_HTML_CHARS):
+                                body[-1] = body[-1][:-1] + SPECIAL_HTML_CHARS[string[i]]
+                        # Transition string forward by one character
+                        i += 1
+            else:
+                if verbose:
+                    print(spacing," End", TYPE(syntax), INLINE(body))
+                # "string" completed without closing this syntax, handle appropraitely
+                if (syntax.closed and (errors is not None) and (len(stack) > 0)):
+                    # Return to the parent and treat the start of this
+                    # syntax as literal text, forgetting the errors that
+                    # were found after it (they will be found again).
+                    if (trace is not None):
+                        trace.end(type(syntax).__name__, "process", began, start=opened,
+                                  end=i, depth=len(stack), recovered=True)
+                    i, literal_until = opened, opened + len(body.match)
+                    error = syntax.incomplete(
+                        document, i, f"started with {repr(body.match)} is never closed.")
+                    syntax, body, start, new_line, escaped, spacing, opened, n_errors, began = stack.pop()
+                    errors[n_errors:] = [error]
+                    continue
+                result = syntax.not_closed(body, document, opened)
+            # Return the result of a completed syntax to its parent.
+            if (result is not None):
+                if (len(stack) == 0): return result
+                contents, ends_on, i = result
+                if (trace is not None):
+                    trace.end(type(syntax).__name__, "process", began,
+                              start=opened, end=i, depth=len(stack))
+                document.outline.add(contents, opened)
+                contents = document.share(contents)
+                syntax, body, start, _, escaped, spacing, opened, _, began = stack.pop()
+                body.append(contents)
                 # Record whether or not we are currently on a new line
-                new_line = regex_match(ON_NEW_LINE, string[i]) is not None
-                # Allow for the escaping of the escape character
-                if not escaped:
-                    # Record whether or not we are currently escaping
-                    escaped = self.allow_escape and (regex_match(ESCAPE_CHAR, string[i]) is not None)
-                    if (escaped): body[-1] = body[-1][:-1]
-                else: 
-                    # Otherwise, reset the current escaped status
-                    escaped = False
-                    # Check for special HTML characters that need to be
-                    # automatically escaped (if escaping is allowed)
-                    if (string[i] in SPECIAL_HTML_CHARS):
-                        body[-1] = body[-1][:-1] + SPECIAL_HTML_CHARS[string[i]]
-                # Transition string forward by one character
-                i += 1
-            # Update the stopping condition check
-            remaining = len(string) - i
-            if ((time.time() - LAST_PRINT_TIME) > UPDATE_FREQ_SEC):
-                print(f"{remaining:9d}",end="\r")
+                new_line = ends_on[:1] in NEWLINE_CHARS
+                new_line = new_line or (type(body[-1]) == NewLine)
+                # Record whether or not trailing character was ESCAPE_CHAR
+                escaped = syntax.allow_escape and (
+                    regex_match(ESCAPE_CHAR, str(ends_on)) is not None)
+            # Update the progress display
+            if progress and ((time.time() - LAST_PRINT_TIME) > UPDATE_FREQ_SEC):
+                print(f"{len(string) - i:9d}",end="\r")
                 LAST_PRINT_TIME = time.time()
-        if verbose:
-            print(spacing," End", TYPE(self), INLINE(body))
-        # "string" completed without closing this syntax, handle appropraitely
-        return self.not_closed(body)
      
 # Generic class for containing groups of of syntaxes (body, lists, etc.)
 class Block:
@@ -773,44 +1844,83 @@ class Block:
     def pack(self, text):
         return self.before + text + self.after
 
-    # Recursive function for rendering output text from nested Syntaxes
-    def render(self, body, spacing="", verbose=False):
+    # Function for packing plain text (for the "text" target), blocks
+    # are separated from the text around them by new lines
+    def pack_text(self, text):
+        return "\n" + text + "\n"
+
+    # Function for packing JSON nodes (for the "json" target)
+    def pack_json(self, children):
+        return dict(type=type(self).__name__, children=children)
+
+    # Function for rendering output text from nested Syntaxes (HTML,
+    # unless another Renderer is given), returns the text and the
+    # remaining (not rendered) part of the body. Nested blocks are
+    # rendered in the same loop with an explicit stack of frames
+    # [block, text, spacing, began], advancing one index through
+    # "body". If "trace" is a Trace, events are recorded for every block
+    # and syntax. Repeated (shared) syntaxes are rendered once, unless
+    # rendering is "verbose" or traced.
+    def render(self, body, spacing="", verbose=False, trace=None, renderer=None):
+        if (renderer is None): renderer = RENDERERS["html"]
+        # Outputs of repeated syntaxes by id (see `Document.share`)
+        memo = {} if ((RENDER_MEMO_SIZE > 0) and (not verbose) and (trace is None)) else None
         if verbose: print(spacing, "Begin", TYPE(self))
-        text = ""
-        while len(body) > 0:
-            next_el = body[0]
-            # First try and identify any sub-blocks in the body
-            for b in self.blocks:
-                if type(next_el) in b.start:
-                    rendered_text, body = b().render(body, spacing+"  ", verbose)
-                    text += rendered_text
-                    break
-            else:
+        stack = [[self, [], spacing, trace.begin() if (trace is not None) else None]]
+        i = 0
+        while True:
+            block, text, spacing, began = stack[-1]
+            sub_block = None
+            while (i < len(body)):
+                next_el = body[i]
+                # First try and identify any sub-blocks in the body
+                for b in block.blocks:
+                    if type(next_el) in b.start:
+                        sub_block = b()
+                        break
+                if (sub_block is not None): break
                 next_el_type = str(type(next_el))
-                recognized_syntax = (type(next_el) in self.syntax)
-                no_requirement_exists = (next_el_type not in self.requirements)
-                requirement_met = no_requirement_exists or self.requirements[next_el_type](next_el)
+                recognized_syntax = (type(next_el) in block.syntax)
+                no_requirement_exists = (next_el_type not in block.requirements)
+                requirement_met = no_requirement_exists or block.requirements[next_el_type](next_el)
                 # If (this syntax is recognized) AND
                 #     (there is not a requirement for the syntax) OR
                 #     (the requirement for this syntax is met)
                 if recognized_syntax and requirement_met:
                     # Check to see if this is just a string
                     if type(next_el) == str:
-                        text += body.pop(0)
+                        text.append(next_el)
                     else:
                         # This syntax is accepted by this block
-                        text += (body.pop(0)).render()
+                        text.append(next_el.render(trace=trace, renderer=renderer, memo=memo))
+                    i += 1
                 else:
                     # This syntax is not accepted by this block
                     if verbose: 
-                        print(spacing, " End (unfinished)", TYPE(self),
+                        print(spacing, " End (unfinished)", TYPE(block),
                               TYPE(next_el),
                               INLINE(next_el.match if not requirement_met else ""),
-                              INLINE([text]))
-                    # There was no recognized block nor syntax, return body
-                    return self.pack(text), body
-        if verbose: print(spacing, " End (finished)", TYPE(self), INLINE(text))
-        return self.pack(text), body
+                              INLINE([renderer.join(text)]))
+                    # There was no recognized block nor syntax, finish
+                    break
+            else:
+                if verbose: print(spacing, " End (finished)", TYPE(block), INLINE(renderer.join(text)))
+            # Begin rendering a sub-block
+            if (sub_block is not None):
+                if verbose:
+                    spacing += "  "
+                    print(spacing, "Begin", TYPE(sub_block))
+                stack.append([sub_block, [], spacing,
+                              trace.begin() if (trace is not None) else None])
+                continue
+            # This block is complete, add its output to the parent block
+            output = renderer.pack(block, renderer.join(text))
+            stack.pop()
+            if (trace is not None):
+                trace.end(type(block).__name__, "render", began,
+                          depth=len(stack), length=len(output))
+            if (len(stack) == 0): return output, body[i:]
+            stack[-1][1].append(output)
 
 # ====================================================================
 #                        Grammar Definition     
@@ -825,6 +1935,8 @@ class Modifier(Syntax):
     end   = "^>>" # >>
     escapable = True
 
+    def pack_json(self, children): return "".join(children)
+
 class Math(Syntax):
     start = "^$$*{$}" # $, $$, ...
     end   = "^$$*{$}" # $, $$, ...
@@ -841,43 +1953,78 @@ class Math(Syntax):
         elif len(self.match) == 2:
             return "\n$$" + text + "$$"
 
+    def pack_text(self, text):
+        return ("\n" + text.strip()) if (len(self.match) == 2) else text
+
+    def pack_json(self, children):
+        return self.node(children, display=(len(self.match) == 2))
+
 class Ref(Syntax):
     start = "^[[][[]" # [[
-    end   = "^]]"     # ]]
+    end   = "^(]])"   # ]] (grouped, a regex cannot start with "]")
     symmetric = True
 
+    # Return the (comma separated) keys cited by this reference.
+    def keys(self):
+        text = "".join(el for el in self if (type(el) == str))
+        return [key.strip() for key in text.split(",") if (len(key.strip()) > 0)]
+
     def pack(self, text):
         if len(self.match) == 2:
             return "<dt-cite key=\"" + text + "\"></dt-cite>"
         else:
             return text
 
+    def pack_text(self, text):
+        return ("[" + text + "]") if (len(self.match) == 2) else text
+
+    def pack_json(self, children):
+        return self.node(children, keys=self.keys())
+
 class Jump(Syntax):
     start = "^@@" # @@
     end   = "^@@" # @@
     grammar = BASE_GRAMMAR
     escapable = True
 
+    # Return the id of the header (or caption) jumped to.
+    def anchor(self, text):
+        return text.replace('"','\\"').replace(">","")
+
     def pack(self, text):
-        text = text.replace('"','\\"')
-        return f'<a class="jump" href="#{text.replace(">","")}">{text}</a>'
+        label = text.replace('"','\\"')
+        return f'<a class="jump" href="#{self.anchor(text)}">{label}</a>'
         # return f'<a href="#{text}">Section \'<i>{text}</i>\'</a>'
 
+    def pack_json(self, children):
+        return self.node(children, id=self.anchor(self.contents()))
+
 class Link(Syntax):
     start = "^@[{]" # @{
     end   = "^[}]@" # }@
     escapable = True
     allow_escape = True
 
-    def pack(self, contents):
+    # Return the text and the address of the link in its contents.
+    def split(self, contents):
         if "}" not in contents:
             raise(SyntaxError("\n\n  Expected format '@{<text>}{<link>}@', but missing inner '}'."))
         text = contents[:-contents[::-1].index("}")-1]
         if "{" not in contents:
             raise(SyntaxError("\n\n  Expected format '@{<text>}{<link>}@', but missing inner '{'."))
         link = contents[-contents[::-1].index("}")+1:]
+        return text, link
+
+    def pack(self, contents):
+        text, link = self.split(contents)
         return f"<a href='{link}'>{text}</a>"
 
+    def pack_text(self, contents): return self.split(contents)[0]
+
+    def pack_json(self, children):
+        text, link = self.split("".join(children))
+        return self.node([text], href=link)
+
 class Caption(Syntax):
     start = "^::"               # ::
     end   = f"^::{NEWLINE}" # :: followed by "\r\n", "\r", or "\n"
@@ -885,10 +2032,16 @@ class Caption(Syntax):
     line_start = True
     grammar = BASE_GRAMMAR
 
-    def pack(self, contents):
+    # Return the id of this caption (its label, if it has one).
+    def anchor(self, contents):
         values = contents.split("::")
-        caption = values[0].strip()
-        label = values[1].strip() if len(values) > 1 else ""
+        return values[1].strip() if len(values) > 1 else ""
+
+    def level(self): return None
+
+    def pack(self, contents):
+        caption = contents.split("::")[0].strip()
+        label = self.anchor(contents)
         # Determine additional attributes based on usage.
         id_str = jump_str = label_str = ""
         if (len(label) > 0):
@@ -897,53 +2050,121 @@ class Caption(Syntax):
             label_str = f"<b>{label}:</b> "
         return f"{jump_str}<p class='caption'{id_str}>{label_str}{caption}</p>"
 
+    def pack_text(self, contents):
+        caption = contents.split("::")[0].strip()
+        label = self.anchor(contents)
+        return f"{label}: {caption}" if (len(label) > 0) else caption
+
+    def pack_json(self, children):
+        return self.node(children, id=self.anchor(self.contents()))
+
 class External(Syntax):
     start = "^[{][{]" # {{
     end   = "^[}][}]" # }}
     line_start = True
     symmetric = True
-    
+    shareable = False # The output depends on the included file
+
+    # Return the path of the included file (without the size options).
+    def path(self):
+        return "".join(el for el in self if (type(el) == str)).split("|")[0]
+
+    # Return the extension of the included file.
+    def extension(self):
+        path = self.path()
+        return path[-path[::-1].find("."):]
+
+    # Return the absolute path of an included file and the path to it
+    # from the output document. Paths in the document being converted
+    # are written as they are (relative to the working directory), paths
+    # in an included text file are relative to that file.
+    def locate(self, path):
+        including = INCLUDE_STACK.get()
+        source = include_path(path, including)
+        if (len(including) == 0) or os.path.isabs(path): return source, path
+        return source, os.path.relpath(source)
+
     def pack(self, path):
         path, height, width = (path.split("|") + ["420px", "100%"])[:3]
-        extension = path[-path[::-1].find("."):]
+        source, path = self.locate(path)
+        info = include_metadata(source)
+        extension = info["extension"]
+        inline_limit, inline_html = INLINE_OPTIONS.get()
+        inline = (inline_limit > 0) and info["exists"] and (info["size"] <= inline_limit)
         if extension in {"png","jpg","jpeg","svg"}:
-            return f"<p style='margin-top:0; margin-bottom:0;'><img src='{path}' width='{width}' style='margin: 0px 20px 0px 20px; display: inline-block;'></p>"
+            src = data_uri(source, extension) if inline else path
+            # Declare the intrinsic size (when known) so that the browser
+            # reserves space for the image before it is loaded.
+            if (info.get("dimensions") is not None):
+                size = "width='{}' height='{}'".format(*info["dimensions"])
+                style = f"width: {width}; height: auto; "
+            else:
+                size = f"width='{width}'"
+                style = ""
+            return f"<p style='margin-top:0; margin-bottom:0;'><img src='{src}' {size} loading='lazy' decoding='async' style='{style}margin: 0px 20px 0px 20px; display: inline-block;'></p>"
         elif extension in {"html"}:
-            # Try and read the best size for the iframe from the file.
-            if os.path.exists(path):
-                with open(path) as f:
-                    contents = f.read()
-                    # Get the 'style' declaration of the first div
-                    contents = contents[contents.find("<div"):]
-                    contents = contents[contents.find("style="):]
-                    # Strip everything after the style declaration
-                    contents = contents[:contents.find("class=")]
-                    # Get the contents of the style declaration
-                    contents = contents[contents.find('"')+1:]
-                    contents = contents[:contents.find('"')]
-                    # Set the default width and height, but check for declared
-                    if ("height" in contents):
-                        # Retreive the height from the style
-                        new_height = contents[contents.index("height:") + len("height:"):]
-                        new_height = new_height[:new_height.index(";")]
-                        # If it's in pixels, add a 20 pixel pad
-                        if ("px" in new_height):
-                            new_height = new_height.replace("px","")
-                            height = str(float(new_height.strip()) + 20) + "px"
-                        # Otherwise, use the default height
-                    if ("width" in contents):
-                        # Retreive the width from the style
-                        new_width = contents[contents.index("width:") + len("width:"):]
-                        new_width = new_width[:new_width.index(";")]
-                        # If it's in pixels, add a 10 pixel pad
-                        if ("px" in new_width):
-                            new_width = new_width.replace("px","")
-                            width = str(float(new_width.strip()) + 10) + "px"
+            # Place small HTML fragments directly into the document.
+            if (inline and inline_html):
+                fragment = html_fragment(source)
+                if (fragment is not None): return f"<div>{fragment}</div>"
+            # Use the best size for the iframe declared in the file.
+            if (info["height"] is not None): height = info["height"]
+            if (info["width"] is not None):  width = info["width"]
             iframe_style = f"left: 0; top: 0; position: absolute; height: 100%; width: {width};"
-            return f"<p style='position: relative; height: {height};'><iframe src='{path}' frameBorder='0' style='{iframe_style}'></iframe></p>"
+            return f"<p style='position: relative; height: {height};'><iframe src='{path}' frameBorder='0' loading='lazy' style='{iframe_style}'></iframe></p>"
+        elif extension in {"txt"}:
+            return f"<div>{self.render_include(source, RENDERERS['html'])}</div>"
+        elif extension in {"csv"}:
+            return csv_table(source)
         else:
             raise(UnsupportedExtension(f"\n\n  External files with extension '{extension}' are not supported."))
 
+    # Included text files and CSV tables are kept in plain text.
+    def pack_text(self, path):
+        extension = self.supported()
+        source, _ = self.locate(self.path())
+        if extension in {"txt"}:
+            return "\n" + self.render_include(source, RENDERERS["text"]) + "\n"
+        elif extension in {"csv"}:
+            rows = csv_rows(source)
+            return "".join("\n| " + " | ".join(row) + " |" for row in rows) + "\n"
+        return ""
+
+    # Included text files and CSV tables are children of the node.
+    def pack_json(self, children):
+        extension = self.supported()
+        source, path = self.locate(self.path())
+        children = []
+        if extension in {"txt"}:
+            children = self.render_include(source, RENDERERS["json"])
+        elif extension in {"csv"}:
+            children = list(csv_rows(source))
+        return self.node(children, path=path)
+
+    # Return the extension of the included file, raise an error if it
+    # is not supported.
+    def supported(self):
+        extension = self.extension()
+        if extension not in {"png","jpg","jpeg","svg","html","txt","csv"}:
+            raise(UnsupportedExtension(f"\n\n  External files with extension '{extension}' are not supported."))
+        return extension
+
+    # Render the (shared) parsed body of the text file at "path" in
+    # place with a Renderer.
+    def render_include(self, path, renderer):
+        including = INCLUDE_STACK.get()
+        path = include_path(path, including)
+        if (path in including):
+            chain = " -> ".join(including + (path,))
+            raise(IncludeCycle(f"\n\n  Text file includes itself, {chain}"))
+        body, _ = parse_include(path)
+        token = INCLUDE_STACK.set(including + (path,))
+        try:
+            output, _ = Body().render(body, renderer=renderer)
+        finally:
+            INCLUDE_STACK.reset(token)
+        return output
+
 class Spacer(Syntax):
     start = "^<[0123456789][0123456789]*>" # <1 or more digits>
     end   = "" # Matches everything and gives back ""
@@ -953,6 +2174,11 @@ class Spacer(Syntax):
         space_size = self.match[1:-1]
         return f"<div style='width: {space_size}px;'>"
 
+    def pack_text(self, text): return ""
+
+    def pack_json(self, children):
+        return self.node(children, width=int(self.match[1:-1]))
+
 class NewLine(Syntax):
     start = f"^{NEWLINE}{NEWLINE}*{{[\r\n]}}" 
     #        one or more new line followed by a non-(new line)
@@ -962,6 +2188,10 @@ class NewLine(Syntax):
     def pack(self, text):
         return "\n" + text
 
+    def pack_text(self, text): return "\n" + text
+
+    def pack_json(self, children): return "\n"
+
 class Ignore(Syntax):
     start = "^%%" # %%
     end   = f"^{NEWLINE}" # new line
@@ -971,6 +2201,10 @@ class Ignore(Syntax):
 
     def pack(self, text): return ""
 
+    def pack_text(self, text): return ""
+
+    def pack_json(self, children): return ""
+
 class Divider(Syntax):
     start = "^(----)-*{-}" # at least 4 * '-'
     end   = f"^{NEWLINE}" # new line
@@ -982,6 +2216,8 @@ class Divider(Syntax):
     def pack(self, text):
         return "\n<hr>"+text+"\n"
 
+    def pack_text(self, text): return "\n"
+
 class NewPage(Syntax):
     start = "^(^^^^)^*{^}" # at least 4 * '^'
     end   = f"^{NEWLINE}" # new line
@@ -993,17 +2229,31 @@ class NewPage(Syntax):
     def pack(self, text):
         return '\n<p style="page-break-after: always;"></p>\n'
 
+    def pack_text(self, text): return "\n"
+
 class Bibliography(Syntax):
     start = "^(====)=*{=}" # at least 4 * '='
-    end   = "" # anything
+    end   = "^"+EOF # the rest of the document
     extra_s = 1
     line_start = True
+    raw = True
+    shareable = False
+    cited = None # The cited keys (when given, only these entries are kept)
 
     def pack(self, text):
+        if (self.cited is not None):
+            entries, others = index_bibliography(text)
+            for key in self.cited:
+                if (key not in entries):
+                    warnings.warn(f"No bibliography entry for cited key '{key}'.", CitationWarning)
+            cited = set(self.cited)
+            text = "\n".join(others + [entry for (key, entry) in entries.items() if (key in cited)])
         begin = '<script type="text/bibliography">\n'
         end = '\n</script>'
         return begin + text + end
 
+    def pack_text(self, text): return ""
+
 class Note(Syntax):
     start = "^[(][(]" # ((
     end   = "^[)][)]" # ))
@@ -1016,6 +2266,12 @@ class Note(Syntax):
         elif len(self.match) == 3:
             return "("*len(self.match) + text + ")"*len(self.match)
 
+    def pack_text(self, text):
+        if len(self.match) == 2:
+            return "(" + text + ")"
+        elif len(self.match) == 3:
+            return "("*len(self.match) + text + ")"*len(self.match)
+
 class Emphasis(Syntax):
     start = "^[*][*]*{[*]}" # one or more * followed by (not *)
     end   = "^[*][*]*{[*]}" # one or more * followed by (not *)
@@ -1037,6 +2293,11 @@ class Emphasis(Syntax):
         else:
             return text
 
+    def pack_json(self, children):
+        styles = ["italic", "bold", "underline", "monospace"]
+        style = styles[len(self.match)-1] if (len(self.match) <= len(styles)) else None
+        return self.node(children, style=style)
+
 class InlineCode(Syntax):
     start = "^`"
     end   = "^`"
@@ -1057,6 +2318,9 @@ class Color(Syntax):
     def pack(self, text):
         return "<font color='"+self.match[1:-1]+"'> " + text + " </font>"
 
+    def pack_json(self, children):
+        return self.node(children, color=self.match[1:-1])
+
 class Title(Syntax):
     start = "^!!*{!}" # One or more !, followed by (not !)
     end   = f"^{NEWLINE}" # new line
@@ -1067,12 +2331,22 @@ class Title(Syntax):
     line_start = True
     return_end = False
 
+    # Return the id of this title (to jump to).
+    def anchor(self, text):
+        return text.strip().replace('"','\\"').replace(">","")
+
+    def level(self): return 1
+
     def pack(self, text):
-        title_id = text.strip().replace('"','\\"').replace(">","")
-        begin = f'<h1 id="{title_id}">'
+        begin = f'<h1 id="{self.anchor(text)}">'
         end   = "</h1>"
         return begin + text + end
 
+    def pack_text(self, text): return "\n" + text.strip() + "\n"
+
+    def pack_json(self, children):
+        return self.node(children, level=self.level(), id=self.anchor(self.contents()))
+
 class Header(Syntax):
     start = "^##*{#}" # One or more #, followed by (not #)
     end   = f"^{NEWLINE}" # new line
@@ -1082,13 +2356,23 @@ class Header(Syntax):
     escapable = True
     line_start = True
 
+    # Return the id of this header (to jump to).
+    def anchor(self, text):
+        return text.strip().replace('"','\\"').replace(">","")
+
+    def level(self): return len(self.match) + 1
+
     def pack(self, text):
-        header_id = text.strip().replace('"','\\"').replace(">","")
-        link = f"<span class='header' id='{header_id}'></span>"
+        link = f"<span class='header' id='{self.anchor(text)}'></span>"
         begin = f'<h{len(self.match)+1}>'
         end   = f"</h{len(self.match)+1}>"
         return link + begin + text + end
 
+    def pack_text(self, text): return "\n" + text.strip() + "\n"
+
+    def pack_json(self, children):
+        return self.node(children, level=self.level(), id=self.anchor(self.contents()))
+
 class Subtext(Syntax):
     start = "^  *{ }" # one or more spaces followed by a non-space
     end   = f"^{NEWLINE}" # new line
@@ -1103,6 +2387,11 @@ class Subtext(Syntax):
         end   = "</p>"
         return begin + text + end
 
+    def pack_text(self, text): return self.match + text
+
+    def pack_json(self, children):
+        return self.node(children, indent=len(self.match))
+
 class UnorderedElement(Syntax):
     start = "^-  *{ }" # '-' followed by one or more spaces followed by a non-space
     end   = f"^{NEWLINE}" # new line
@@ -1116,6 +2405,8 @@ class UnorderedElement(Syntax):
         count = len(self.match) - 2
         return "<li>"+ text +"</li>"
 
+    def pack_text(self, text): return "- " + text
+
 class OrderedElement(Syntax):
     start = "^[0123456789][0123456789]*([)]|[.])"
     #       one or more digits followed by '.' or ')'
@@ -1128,9 +2419,11 @@ class OrderedElement(Syntax):
     def pack(self, text):
         return "<li>"+ text +"</li>"
 
+    def pack_text(self, text): return self.match + text
+
 class TableEntry(Syntax):
     start = "^[|]" # |
-    end   = "^([|]|\n|\r|(\r\n))" # | or new line
+    end   = "^[|\r\n]" # | or new line
     grammar = TABLE_GRAMMAR
     escapable = True
     return_end = False
@@ -1141,12 +2434,57 @@ class TableEntry(Syntax):
             return "<td>" + text + "</td>"
         else:
             return ""
+
+    def pack_text(self, text):
+        return ("| " + text.strip() + " ") if (len(text) > 0) else "|"
+
+    def pack_json(self, children):
+        return self.node(children) if (len(children) > 0) else ""
+
+    # Return the entries of the table row that starts with the "|" at
+    # position "i" of a document and the position of the new line that
+    # ends it. Entries without any characters in TABLE_MARKUP are split
+    # directly, others are processed with the table grammar. The row
+    # stops before an entry that is never closed (or does not end with
+    # a new line), leaving that entry to be processed (and reported) by
+    # the parent syntax.
+    def row(self, document, i, errors=None, trace=None):
+        string = document.text
+        entries = []
+        line_end = -1
+        while (string[i:i+1] == "|"):
+            if (line_end < i):
+                line_end = string.find("\n", i)
+                if (document.last_index("\r") >= i):
+                    r = string.find("\r", i, line_end if (line_end >= 0) else len(string))
+                    if (r >= 0): line_end = r
+                if (line_end < 0): break
+            j = string.find("|", i+1, line_end)
+            if (j < 0): j = line_end
+            text = string[i+1:j]
+            if TABLE_MARKUP.isdisjoint(text):
+                entry = type(self)([text])
+                entry.match = "|"
+                i = j
+            else:
+                n_errors = len(errors) if (errors is not None) else 0
+                try:
+                    entry, _, i = self.process(document, i+1, start="|", errors=errors,
+                                               progress=False, trace=trace)
+                except IncompleteSyntax:
+                    if (errors is not None): errors[n_errors:] = []
+                    break
+            entries.append(document.share(entry))
+        return entries, i
     
 
 BASE_GRAMMAR += [Modifier(), Math(), Emphasis(), InlineCode(),
                  Color(), Note(), Ref(), Jump(), Link(), Subtext(),
                  Ignore(), Spacer()]
 TABLE_GRAMMAR += BASE_GRAMMAR + [Divider(), TableEntry()]
+# Characters that can start a syntax (or escape) inside a table entry.
+TABLE_MARKUP = set(ESCAPE_CHAR[1:]).union(
+    *(first_characters(s.start) for s in TABLE_GRAMMAR if (not s.line_start)))
 ALL_GRAMMAR = [NewLine(), Divider(), NewPage(), Header(), Title(),
                Bibliography(), External(), Caption(), UnorderedElement(),
                OrderedElement(), TableEntry()] + BASE_GRAMMAR
@@ -1161,6 +2499,8 @@ class TableRow(Block):
     start  = [TableEntry]
     syntax = [TableEntry]
 
+    def pack_text(self, text): return text
+
 class Table(Block):
     before = "\n<table>"
     after  = "</table>"
@@ -1195,26 +2535,172 @@ class Body(Block):
     syntax = [type(s) for s in ALL_GRAMMAR]
     blocks = [Paragraph, Table, OrderedList, UnorderedList]
 
+    def pack_text(self, text): return text
+
+    def pack_json(self, children): return children
+
+# ====================================================================
+#                          Rendering Targets
+# 
+# A Renderer produces one output format (target) from a parsed body.
+# Every Syntax and Block has a packing method for each target ("pack"
+# for HTML, "pack_text" for plain text, "pack_json" for a JSON tree).
+# A new target is added by registering a Renderer in RENDERERS, with
+# either a packing method for it on the syntaxes and blocks or a
+# "pack" that handles them all. A body is rendered for many targets
+# in one pass with a Targets renderer.
+
+class UnsupportedTarget(Exception): pass
+
+class Renderer:
+    name = "html"       # The name of this target
+    method = "pack"     # The packing method of Syntax and Block objects
+    extension = ".html" # The extension of saved files for this target
+
+    # Join the (rendered) parts of the contents of a syntax or block.
+    def join(self, parts):
+        return "".join(parts)
+
+    # Pack the joined contents of a syntax or block.
+    def pack(self, el, contents):
+        return getattr(el, self.method)(contents)
+
+    # Apply the rendered "Modifier" syntaxes of a syntax to its output.
+    def modify(self, output, modifiers):
+        modifier = "".join(modifiers)
+        if (len(modifier) > 0): output = output.replace(">",f" {modifier}>",1)
+        return output
+
+    # Return the document for a rendered body, given the "front" matter
+    # {"title", "description", "authors", "outline", "citations"}.
+    # (The HTML document is built by `parse_string`.)
+    def document(self, body, front):
+        return body
+
+class TextRenderer(Renderer):
+    name = "text"
+    method = "pack_text"
+    extension = ".text"
+
+    # Modifiers (HTML attributes) do not apply to plain text.
+    def modify(self, output, modifiers):
+        return output
+
+    # Return the front matter and the text of the body (as displayed,
+    # without HTML escapes), separated by blank lines.
+    def document(self, body, front):
+        import html, re
+        lines = [front["title"], front["description"]]
+        lines += [name for (name, email, web) in front["authors"]]
+        body = re.sub("\n\n\n+", "\n\n", html.unescape(body)).strip()
+        return "\n".join(l for l in lines if (len(l) > 0)) + "\n\n" + body + "\n"
+
+class JSONRenderer(Renderer):
+    name = "json"
+    method = "pack_json"
+    extension = ".json"
+
+    # Return the nodes of the contents, joining adjacent strings and
+    # dropping empty strings.
+    def join(self, parts):
+        children = []
+        for part in parts:
+            if (type(part) == str):
+                if (len(part) == 0): continue
+                if (len(children) > 0) and (type(children[-1]) == str):
+                    children[-1] += part
+                    continue
+            children.append(part)
+        return children
+
+    # Record the (rendered) modifiers as an attribute of the node.
+    def modify(self, output, modifiers):
+        modifier = "".join(modifiers)
+        if (len(modifier) > 0) and (type(output) == dict): output["modifier"] = modifier
+        return output
+
+    # Return the front matter, headers (for navigation), cited keys,
+    # and the tree of the body as a JSON string.
+    def document(self, body, front):
+        headers = [{"level":level, "id":anchor_id, "text":text.strip()}
+                   for (level, anchor_id, _, text) in front["outline"].anchors
+                   if (level is not None)]
+        authors = [{"name":name, "email":email, "web":web}
+                   for (name, email, web) in front["authors"]]
+        return json.dumps({"title":front["title"], "description":front["description"],
+                           "authors":authors, "headers":headers,
+                           "citations":front["citations"], "body":body}, indent=1)
+
+# A Renderer for many targets at once, its outputs are tuples (one
+# output per target). Strings in the contents are shared by all
+# targets, so the parts are only separated when they are packed.
+class Targets(Renderer):
+    def __init__(self, renderers):
+        self.renderers = tuple(renderers)
+
+    def join(self, parts): return parts
+
+    def pack(self, el, parts):
+        return tuple(r.pack(el, r.join([p[k] if (type(p) == tuple) else p for p in parts]))
+                     for (k, r) in enumerate(self.renderers))
+
+    def modify(self, outputs, modifiers):
+        return tuple(r.modify(output, [m[k] for m in modifiers])
+                     for (k, (r, output)) in enumerate(zip(self.renderers, outputs)))
+
+# Target name -> Renderer
+RENDERERS = {r.name:r for r in (Renderer(), TextRenderer(), JSONRenderer())}
+
+# Return the Renderer for a list of target names (a Targets renderer,
+# unless there is only one target).
+def target_renderer(targets):
+    for target in targets:
+        if (target not in RENDERERS):
+            raise(UnsupportedTarget(f"\n\n  Unknown target '{target}', expected one of {sorted(RENDERERS)}."))
+    if (len(targets) == 1): return RENDERERS[targets[0]]
+    return Targets(RENDERERS[target] for target in targets)
+
 # ====================================================================
 #                        Text Parsing Function     
 # ====================================================================
 
+# Given an author line ":: <name> :: <email> :: <web address>", return
+# the name, email, and web address of the author.
+def parse_author(line):
+    auth_line_split = [s.strip() for s in line[2:].split("::")]
+    if len(auth_line_split) != 3:
+        raise(AuthorError("\n\n  Expected author format ':: <name> :: <email> :: <web address>'."))
+    return tuple(auth_line_split)
+
+# Return the number of lines at the start of "raw_lines" that can be
+# front matter (see `parse_header`), those before the first empty line
+# that are author lines or are one of the first three other lines.
+def front_matter_size(raw_lines):
+    others = 0
+    for k, line in enumerate(raw_lines):
+        if (len(line[:-1]) == 0): return k
+        if (line[:2] != "::"): others += 1
+        if (others == 3): return k+1
+    return len(raw_lines)
+
 # Given a list of raw lines, parse out a title, description, and
-# authors form the top of a text file (if given).
-def parse_header(raw_lines):
+# authors form the top of a text file (if given). Author lines are
+# found by their marker in the LineIndex "lines" of (at least) the
+# front matter lines (built when not given). Front matter lines are
+# popped.
+def parse_header(raw_lines, lines=None):
+    if (lines is None): lines = LineIndex("".join(raw_lines[:front_matter_size(raw_lines)]))
     html_kwargs = {}
     found = []
     authors = ""
     affiliations = ""
     # Loop through until done processing frontmatter
-    while (len(raw_lines) > 0) and (len(raw_lines[0][:-1]) > 0):
-        if raw_lines[0][:2] == "::":
+    for k in range(len(lines)):
+        if (len(raw_lines) == 0) or (len(raw_lines[0][:-1]) == 0): break
+        if (lines.markers[k] == ":") and (lines.line(k)[1:2] == ":"):
             # Process an author
             found.append("author")
-            auth_line_split = [s.strip() for s in raw_lines.pop(0)[2:].split("::")]
-            if len(auth_line_split) != 3:
-                raise(AuthorError("\n\n  Expected author format ':: <name> :: <email> :: <web address>'."))
-            name, email, web = auth_line_split
+            name, email, web = parse_author(raw_lines.pop(0))
             authors += f"{AA_BEGIN}{name}: {web}\n"
             affiliations += f"{AA_BEGIN}{email}\n"
             continue
@@ -1239,19 +2725,573 @@ def parse_header(raw_lines):
         html_kwargs["affiliations"] = affiliations
     return html_kwargs
 
-# Given a path to a text file, process that text file into an HTML
-# document format. Arguments should be self-explanatory.
+# Given the (body) lines of a document, return the character offsets
+# of "Title" and "Header" lines (those that start with "!" or "#") that
+# could begin top-level sections, about "4 * processes" of them spread
+# evenly through the text. No sections begin after the start of the
+# "Bibliography". These are only candidates, a section begins at one
+# of them only when the parser reaches it with no syntax open (see
+# `parse_body`).
+def section_starts(raw_lines, processes):
+    target_size = sum(map(len, raw_lines)) // (4 * processes) + 1
+    starts = []
+    size = offset = 0
+    for line in raw_lines:
+        if (line[:4] == "===="): break
+        if (line[:1] in {"#","!"}) and (size >= target_size):
+            starts.append(offset)
+            size = 0
+        size += len(line)
+        offset += len(line)
+    return starts
+
+# Process one section of a document (a string) into a heirarchical
+# syntax format, return the body and its Outline. Errors report lines
+# after the "line_offset" lines that come before the section.
+def parse_section(text, on_new_line=False, verbose=False, errors=None, progress=True,
+                  trace=None, memory=None, line_offset=0):
+    processor = Syntax()
+    processor.closed = False
+    processor.grammar = ALL_GRAMMAR
+    # A section that follows another starts at the beginning of a line,
+    # which is signaled to the processor by a starting new line.
+    start = "\n" if on_new_line else ""
+    document = Document(text + EOF)
+    document.line_offset = line_offset
+    memory_stage(memory, "document")
+    body, _, _ = processor.process(document, 0, start=start, verbose=verbose,
+                                   errors=errors, progress=progress, trace=trace)
+    memory_stage(memory, "parse")
+    return body, document.outline
+
+# Process a document (a string) from character "begin" into a
+# heirarchical syntax format, stopping at the first of the "stops"
+# (character offsets after "begin") that is reached with no syntax
+# open. Returns the body, its Outline, the stop (None at the end of
+# the document), and the error that was raised (or None). The body is
+# None if processing passed "until" before stopping. Errors are
+# returned instead of raised, so that they are only reported if the
+# serial parse of the document would have reached them.
+def parse_from(text, begin, stops, until=None, verbose=False, progress=True, line_offset=0):
+    processor = Syntax()
+    processor.closed = False
+    processor.grammar = ALL_GRAMMAR
+    document = Document(text + EOF)
+    document.line_offset = line_offset
+    # A section that follows another starts at the beginning of a line,
+    # which is signaled to the processor by a starting new line.
+    start = "\n" if (begin > 0) else ""
+    try:
+        body, _, stop = processor.process(document, begin, start=start, verbose=verbose,
+                                          progress=progress, stops=set(stops), until=until)
+    except Exception as error:
+        return None, None, None, error
+    if (stop not in stops): stop = None
+    return body, document.outline, stop, None
+
+# Process the lines of a document into a heirarchical syntax format,
+# parsing top-level sections in parallel when there is more than one
+# process. Every section is parsed from a candidate start (see
+# `section_starts`) up to the first following candidate that the
+# parser reaches with no syntax open. The parser is in the same state
+# at such a start as it would be in a serial parse, so the sections
+# are joined by following the stops from the start of the document,
+# and sections whose start was passed inside a syntax are not used.
+# A section that is still inside a syntax at the end of the section
+# after it is given up, and parsed again (in this process) if it is
+# used. The output is identical to a serial parse. Returns the body
+# and its Outline.
+# When collecting "errors" (see `Syntax.process`), recording a "trace",
+# or reporting "memory", the document is always parsed serially (in
+# this process).
+def parse_body(raw_lines, processes=1, verbose=False, errors=None, progress=True,
+               trace=None, memory=None, line_offset=0):
+    starts = section_starts(raw_lines, processes) if (processes > 1) else []
+    if (len(starts) == 0) or (errors is not None) or (trace is not None) or (memory is not None):
+        return parse_section("".join(raw_lines), verbose=verbose, errors=errors,
+                             progress=progress, trace=trace, memory=memory,
+                             line_offset=line_offset)
+    text = "".join(raw_lines)
+    begins = [0] + starts
+    stops = [starts[k:] for k in range(len(begins))]
+    untils = starts[1:] + [None, None]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes) as pool:
+        results = dict(zip(begins, pool.map(
+            parse_from, [text]*len(begins), begins, stops, untils,
+            [verbose]*len(begins), [progress]*len(begins), [line_offset]*len(begins))))
+    # Join the sections that follow each other from the start, skipping
+    # the empty string that starts every section and joining adjacent
+    # strings (offsets in every outline are already in the document).
+    body, outline = None, Outline()
+    begin = 0
+    while (begin is not None):
+        section, section_outline, stop, error = results[begin]
+        if (section is None) and (error is None):
+            section, section_outline, stop, error = parse_from(
+                text, begin, stops[begins.index(begin)], verbose=verbose,
+                progress=progress, line_offset=line_offset)
+        if (error is not None): raise(error)
+        outline.update(section_outline)
+        begin = stop
+        if (body is None):
+            body = section
+            continue
+        for el in section[1:] if (section[0] == "") else section:
+            if (type(el) == str) and (type(body[-1]) == str): body[-1] += el
+            else:                                              body.append(el)
+    return body, outline
+
+# Given a path to a text file, return its metadata without parsing or
+# rendering the body (for indexing documents quickly):
 # 
-#  (verbose = 1) -> status updates only
-#  (verbose = 2) -> internal parsing updates included as well
+#   {"title": str, "description": str,
+#    "authors": [{"name": str, "email": str, "web": str}, ...],
+#    "headers": [{"level": int, "text": str}, ...],
+#    "citations": [str, ...]}
 # 
-def parse_txt(path_name, output_folder='.', verbose=1,
-              appendix=True, justify=False, use_local=USE_LOCAL,
-              resource_folder=RESOURCE_FOLDER, show=True):
-    if (verbose > 0): print(f"Processing '{path_name}'...")
+# The front matter is read with `parse_header`. Headers are the lines
+# of the body that start with "!" (level 1, a "Title") or "#" (level
+# 2 and up, a "Header"), found by their marker in a LineIndex, and
+# citations are the unique keys of "[[key]]" references in order of
+# first use. This is a light scan, so headers and references that are
+# inside other syntax (e.g., a note) are included as well.
+def extract_metadata(path_name):
     with open(path_name) as f:
         raw_lines = f.readlines()
-    if len(raw_lines) == 0: return ""
+    text = "".join(raw_lines)
+    lines = LineIndex(text)
+    metadata = {"title":TITLE, "description":DESCRIPTION, "authors":[],
+                "headers":[], "citations":[]}
+    # Read the front matter (the same way as `parse_txt`)
+    n_lines = len(raw_lines)
+    if (len(raw_lines) > 0) and (len(raw_lines[0][:-1]) > 0):
+        header = parse_header(raw_lines, lines)
+        metadata["title"] = header.get("title", TITLE)
+        metadata["description"] = header.get("description", DESCRIPTION)
+    first = n_lines - len(raw_lines)
+    for k in range(first):
+        if (lines.markers[k] == ":") and (lines.line(k)[1:2] == ":"):
+            name, email, web = parse_author(lines.line(k))
+            metadata["authors"].append({"name":name, "email":email, "web":web})
+    # Find the "Title" and "Header" lines of the body
+    for k in range(first, len(lines)):
+        marker = lines.markers[k]
+        if (marker not in {"!", "#"}): continue
+        line = lines.line(k)
+        run = len(line) - len(line.lstrip(marker))
+        # A title is always level 1, a header with "n" "#" is level "n+1"
+        level = (run + 1) if (marker == "#") else 1
+        metadata["headers"].append({"level":level, "text":line[run:].strip()})
+    # Find the keys of all references in the body
+    keys = {}
+    i = text.find("[[", lines.starts[first] if (first < len(lines)) else len(text))
+    while (i >= 0):
+        j = text.find("]]", i+2)
+        if (j < 0): break
+        for key in text[i+2:j].split(","):
+            if (len(key.strip()) > 0): keys[key.strip()] = None
+        i = text.find("[[", j+2)
+    metadata["citations"] = list(keys)
+    return metadata
+
+# Given the text of a (BibTeX) bibliography, scan it once and return
+# an index of its entries by key (in order) and a list of the other
+# entries that must always be kept ("@string" and "@preamble").
+# Comments and text outside of entries are dropped.
+def index_bibliography(text):
+    entries = {}
+    others = []
+    i = text.find("@")
+    while (i >= 0):
+        j = text.find("{", i)
+        if (j < 0): break
+        kind = text[i+1:j].strip().lower()
+        # Find the brace that closes this entry
+        depth, k = 1, j
+        while (depth > 0) and (k >= 0):
+            close = text.find("}", k+1)
+            k = text.find("{", k+1)
+            if (close < 0): k = -1
+            elif (k < 0) or (close < k): depth, k = depth-1, close
+            else: depth += 1
+        if (k < 0): k = len(text)-1
+        entry = text[i:k+1]
+        if (kind in {"string", "preamble"}): others.append(entry)
+        elif (kind != "comment"):
+            comma = text.find(",", j, k)
+            key = text[j+1:comma if (comma >= 0) else k].strip()
+            entries[key] = entry
+        i = text.find("@", k+1)
+    return entries, others
+
+# Return the keys cited by "Ref" syntax anywhere in a parsed body, in
+# the order they are first cited.
+def cited_keys(body):
+    keys = {}
+    stack = [iter(body)]
+    while (len(stack) > 0):
+        for el in stack[-1]:
+            if (type(el) == Ref):
+                for key in el.keys(): keys[key] = None
+            elif (type(el) != str):
+                stack.append(iter(el))
+                break
+        else:
+            stack.pop()
+    return list(keys)
+
+# Yield every syntax in a parsed body (nested syntaxes included).
+def syntaxes(body):
+    stack = [iter(body)]
+    while (len(stack) > 0):
+        for el in stack[-1]:
+            if (type(el) != str):
+                yield el
+                stack.append(iter(el))
+                break
+        else:
+            stack.pop()
+
+# Warn (with a JumpWarning) about every jump in a document (with the
+# given outline and body text, after "line_offset" lines) or in its
+# included text files to an id that no header or caption has. Returns
+# the number of broken jumps.
+def check_jumps(outline, includes, text, line_offset=0):
+    ids = set(outline.ids).union(*(o.ids for (_, o) in includes.values()))
+    outlines = [(None, outline)] + [(path, o) for (path, (_, o)) in includes.items()]
+    lines = None
+    broken = 0
+    for path, o in outlines:
+        for (anchor_id, offset) in o.jumps:
+            if (anchor_id in ids): continue
+            if (path is None):
+                if (lines is None): lines = LineIndex(text)
+                line, column = lines.line_column(offset)
+                where = f"line {line + line_offset}, column {column}"
+            else: where = f"'{path}'"
+            warnings.warn(f"{where}: no header or caption with id '{anchor_id}' to jump to.",
+                          JumpWarning)
+            broken += 1
+    return broken
+
+# Return the name of the file for page "k" (from 0) of a paginated
+# document, the first page is the usual "<name>.html".
+def page_file(name, k):
+    return f"{name}.html" if (k == 0) else f"{name}.{k+1}.html"
+
+# Split a parsed body into sections at its top-level titles and new
+# pages (and headers, when there is a "page_size"), render every
+# section to HTML, and group the sections into pages. A new page
+# begins at every new page and, when there is no "page_size", at every
+# title. Otherwise sections are added to a page while it has at most
+# "page_size" bytes. A "NewPage" (page break) at the start of a page is
+# dropped. Returns a list of pages [(parsed body, HTML body)].
+def page_sections(body, page_size=None, trace=None):
+    breaks = {Title, NewPage} if (page_size is None) else {Title, Header, NewPage}
+    sections = []
+    # The elements of the current section, whether it must begin a new
+    # page, and whether it has any content (not only blank lines).
+    elements, forced, content = [], True, False
+    for el in body:
+        kind = type(el)
+        if (kind in breaks) and content:
+            sections.append((elements, forced))
+            elements, forced, content = [], (page_size is None) or (kind == NewPage), False
+        if (kind == NewPage) and (not content):
+            forced = True
+            continue
+        elements.append(el)
+        content = content or not ((kind == NewLine) or ((kind == str) and (len(el.strip()) == 0)))
+    sections.append((elements, forced))
+    # Render the sections and group them into pages.
+    pages = []
+    for (elements, forced) in sections:
+        html, _ = Body().render(elements, trace=trace)
+        size = len(html.encode("utf-8"))
+        if ((len(pages) == 0) or forced or
+            ((page_size is not None) and (pages[-1][2] + size > page_size))):
+            pages.append([[], [], 0])
+        pages[-1][0].extend(elements)
+        pages[-1][1].append(html)
+        pages[-1][2] += size
+    return [(elements, "".join(html)) for (elements, html, _) in pages]
+
+# Markers for the parts of the HTML document that differ by page.
+PAGE_BODY = "\0page body\0"
+PAGE_APPENDIX = "\0page appendix\0"
+PAGE_BIBLIOGRAPHY = "\0page bibliography\0"
+
+# Given the pages [(parsed body, HTML body)] of a document (see
+# `page_sections`) and its HTML "head" (the formatted document with
+# the PAGE_* markers), return the HTML document of every page. Each
+# page links to the previous and next pages, keeps the "appendix" only
+# when it has notes or citations, and keeps the entries of the
+# "bibliography" (a Bibliography or None) that it cites. Jumps (and
+# the table of contents "toc" on the first page) to headers and
+# captions on other pages link to the files of those pages (see
+# `page_file` with "name").
+def paginate(pages, head, name, appendix, bibliography=None, toc=""):
+    n = len(pages)
+    page_of = {} # Anchor id -> index of the first page it is on.
+    details = []
+    for k, (body, html) in enumerate(pages):
+        outline = Outline()
+        for syntax in syntaxes(body): outline.add(syntax, 0)
+        includes = text_includes(body)
+        for (_, included) in includes.values(): outline.update(included)
+        for anchor_id in outline.ids: page_of.setdefault(anchor_id, k)
+        details.append((outline.found_note, cited_keys([body] + [b for (b, _) in includes.values()])))
+    jump = '<a class="jump" href="'
+    documents = []
+    for k, ((body, html), (found_note, cited)) in enumerate(zip(pages, details)):
+        # Link jumps to anchors on other pages to the file of that page.
+        if (k == 0): html = toc + html
+        parts = html.split(jump)
+        for i in range(1, len(parts)):
+            target = page_of.get(parts[i][1:parts[i].find('"')], k)
+            if (target != k): parts[i] = page_file(name, target) + parts[i]
+        html = jump.join(parts)
+        # Add links to the previous and next pages.
+        links = []
+        if (k > 0): links.append(f"<a href='{page_file(name, k-1)}'>&larr; Previous</a>")
+        links.append(f"<span>Page {k+1} of {n}</span>")
+        if (k < n-1): links.append(f"<a href='{page_file(name, k+1)}'>Next &rarr;</a>")
+        links = ("\n<nav class='pages'>" + " | ".join(links) + "</nav>\n") if (n > 1) else ""
+        # Keep the bibliography entries cited on this page.
+        page_bibliography = BIBLIOGRAPHY
+        if (bibliography is not None) and (len(cited) > 0):
+            bibliography.cited = cited
+            page_bibliography = bibliography.render()
+        page_appendix = appendix if (found_note or (page_bibliography != BIBLIOGRAPHY)) else ""
+        documents.append(head.replace(PAGE_BIBLIOGRAPHY, page_bibliography)
+                             .replace(PAGE_APPENDIX, page_appendix)
+                             .replace(PAGE_BODY, links + html + links))
+    return documents
+
+# Spans of an HTML document that are kept intact by `minify_html`,
+# (start, end) where whitespace matters (preformatted text, scripts
+# such as the front matter and the bibliography, and math).
+MINIFY_KEEP = [("<pre", "</pre>"), ("<textarea", "</textarea>"),
+               ("<script", "</script>"), ("$$", "$$"), ("\\(", "\\)")]
+
+# Return a copy of "text" where every run of whitespace that contains
+# a new line is replaced by a single new line.
+def collapse_whitespace(text):
+    lines = text.split("\n")
+    if (len(lines) == 1): return text
+    middle = (line.strip(" \t\r") for line in lines[1:-1])
+    return "\n".join([lines[0].rstrip(" \t\r")] + [line for line in middle if (len(line) > 0)]
+                     + [lines[-1].lstrip(" \t\r")])
+
+# Return a minified copy of an HTML document. Comments are removed and
+# runs of whitespace that contain a new line (indentation and blank
+# lines) are collapsed, except within the spans in MINIFY_KEEP. Other
+# whitespace is kept, since it can be significant (e.g., in strings).
+def minify_html(html):
+    spans = MINIFY_KEEP + [("<!--", "-->")]
+    starts = [html.find(start) for (start, _) in spans]
+    # The output, and the text (without comments) since the last span.
+    output = []
+    text = []
+    i = 0
+    while (i < len(html)):
+        # Find the next span to keep (or comment to remove).
+        for k, (start, _) in enumerate(spans):
+            if (0 <= starts[k] < i): starts[k] = html.find(start, i)
+        j, k = min(((s,k) for (k,s) in enumerate(starts) if (s >= 0)),
+                   default=(len(html), None))
+        text.append(html[i:j])
+        if (k is None): break
+        start, end = spans[k]
+        i = html.find(end, j+len(start))
+        i = len(html) if (i < 0) else i + len(end)
+        if (end != "-->"):
+            output.append(collapse_whitespace("".join(text)))
+            output.append(html[j:i])
+            text = []
+    output.append(collapse_whitespace("".join(text)))
+    return "".join(output)
+
+# A bounded cache of rendered HTML documents that evicts the least
+# recently used documents first, keyed by a hash of the source text
+# and every option that changes the output (see `RenderCache.key`).
+# Holds at most "max_entries" documents totaling at most "max_bytes"
+# (UTF-8) bytes, and counts hits, misses, and evictions. Documents
+# that include external files are cached too, so entries should be
+# invalidated when those files change.
+class RenderCache:
+    def __init__(self, max_entries=128, max_bytes=2**26):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # key -> (html, size in bytes)
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self): return len(self.entries)
+
+    # Return the key for a source text and its rendering options.
+    @staticmethod
+    def key(text, use_local=USE_LOCAL, resource_folder=RESOURCE_FOLDER,
+            justify=False, appendix=True, inline_limit=0, inline_html=False,
+            minify=False, toc=False):
+        options = repr((use_local, resource_folder, justify, appendix,
+                        inline_limit, inline_html, minify, toc))
+        return hashlib.sha256((options + "\0" + text).encode("utf-8")).hexdigest()
+
+    # Return the HTML stored for "key" (None if there is none).
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry is None):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    # Store the HTML for "key", evicting the least recently used
+    # documents until the cache is within its limits.
+    def put(self, key, html):
+        size = len(html.encode("utf-8"))
+        if (size > self.max_bytes) or (self.max_entries <= 0): return
+        with self.lock:
+            if (key in self.entries): self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (html, size)
+            self.bytes += size
+            while (len(self.entries) > self.max_entries) or (self.bytes > self.max_bytes):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    # Remove the document for a source text and its rendering options,
+    # or every document when no text is given. Returns the number of
+    # documents removed.
+    def invalidate(self, text=None, **options):
+        with self.lock:
+            if (text is None):
+                removed = len(self.entries)
+                self.entries.clear()
+                self.bytes = 0
+                return removed
+            entry = self.entries.pop(self.key(text, **options), None)
+            if (entry is None): return 0
+            self.bytes -= entry[1]
+            return 1
+
+    # Return the counters and current size of this cache.
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    entries=len(self.entries), bytes=self.bytes)
+
+# Given the text of a document, process it into an HTML document
+# entirely in memory and return the HTML. Nothing is printed (unless
+# "verbose" is positive), no file is written, and no browser is opened.
+# 
+#  (verbose = 1) -> status updates only
+#  (verbose = 2) -> internal parsing updates included as well
+# 
+# If "include_cache" is a path to a JSON file, the metadata of all
+# included external files is loaded from (and saved to) that file, so
+# that unchanged files are not read again on later runs.
+# 
+# Included images of at most "inline_limit" bytes are embedded in the
+# document as base64 "data:" URIs. If "inline_html" is True, included
+# HTML fragments of at most "inline_limit" bytes replace their iframe.
+# 
+# If "processes" is greater than one, independent top-level sections
+# of the document are parsed in parallel by a pool of processes.
+# 
+# If "errors" is a list, syntax that is never closed (e.g., a stray
+# "((") is kept as literal text and every IncompleteSyntax error is
+# appended to "errors" instead of stopping at the first one.
+# 
+# If "cache" is a RenderCache, documents are looked up in (and saved
+# to) it. The cache is not used when collecting "errors".
+# 
+# If "trace" is a Trace, the timeline of the conversion is recorded
+# in it (and the cache is not used).
+# 
+# If "minify" is True, comments and indentation are removed from the
+# HTML document (see `minify_html`).
+# 
+# If "memory" is a MemoryReport, the memory used by every stage of the
+# conversion is recorded in it (and the cache is not used).
+# 
+# If "toc" is True, a table of contents (linking every title and
+# header) is placed at the beginning of the body.
+# 
+# Every jump ("@@<header>@@") to a header or caption that does not
+# exist is reported with a JumpWarning.
+# 
+# If "targets" is a list of target names (see RENDERERS, e.g., "html",
+# "text", and "json"), the document is parsed once and its body is
+# rendered for every target in one pass. A dictionary {target: output}
+# is returned instead of the HTML (and the cache is not used).
+# 
+# If "pages" is True, the HTML document is split into a list of linked
+# pages (see `page_sections` and `paginate`) at every top-level title
+# and new page, or into pages of about "page_size" bytes (when given).
+# Pages link to each other by the file names "<page_name>.html",
+# "<page_name>.2.html", ... (see `page_file`). The list of pages is
+# returned instead of the HTML (and the cache is not used).
+# 
+def parse_string(text, verbose=0, appendix=True, justify=False,
+                 use_local=USE_LOCAL, resource_folder=RESOURCE_FOLDER,
+                 include_cache=None, inline_limit=0, inline_html=False,
+                 processes=1, errors=None, cache=None, trace=None, minify=False,
+                 memory=None, toc=False, targets=None, pages=False, page_size=None,
+                 page_name="document"):
+    # Trace the memory used by the conversion (if that was requested).
+    if (memory is not None) and (not memory.tracing):
+        with memory:
+            return parse_string(text, verbose=verbose, appendix=appendix, justify=justify,
+                                use_local=use_local, resource_folder=resource_folder,
+                                include_cache=include_cache, inline_limit=inline_limit,
+                                inline_html=inline_html, processes=processes, errors=errors,
+                                cache=cache, trace=trace, minify=minify, memory=memory,
+                                toc=toc, targets=targets, pages=pages, page_size=page_size,
+                                page_name=page_name)
+    names = ["html"] if (targets is None) else list(targets)
+    renderer = target_renderer(names)
+    # Return a rendered copy of this document if one was cached.
+    if ((cache is not None) and (errors is None) and (trace is None) and (memory is None)
+        and (targets is None) and (not pages)):
+        key = cache.key(text, use_local=use_local, resource_folder=resource_folder,
+                        justify=justify, appendix=appendix,
+                        inline_limit=inline_limit, inline_html=inline_html,
+                        minify=minify, toc=toc)
+        html = cache.get(key)
+        if (html is None):
+            html = parse_string(text, verbose=verbose, appendix=appendix, justify=justify,
+                                use_local=use_local, resource_folder=resource_folder,
+                                include_cache=include_cache, inline_limit=inline_limit,
+                                inline_html=inline_html, processes=processes, minify=minify,
+                                toc=toc)
+            cache.put(key, html)
+        elif (verbose > 0): print(f"Using the cached HTML document.")
+        return html
+    # Set the inlining options for rendering (only for this conversion).
+    if (INLINE_OPTIONS.get() != (inline_limit, inline_html)):
+        token = INLINE_OPTIONS.set((inline_limit, inline_html))
+        try:
+            return parse_string(text, verbose=verbose, appendix=appendix, justify=justify,
+                                use_local=use_local, resource_folder=resource_folder,
+                                include_cache=include_cache, inline_limit=inline_limit,
+                                inline_html=inline_html, processes=processes, errors=errors,
+                                cache=cache, trace=trace, minify=minify, memory=memory,
+                                toc=toc, targets=targets, pages=pages, page_size=page_size,
+                                page_name=page_name)
+        finally:
+            INLINE_OPTIONS.reset(token)
+    if (include_cache is not None): load_include_cache(include_cache)
+    # Split lines the same way as reading a file (universal new lines).
+    import io
+    raw_lines = io.StringIO(text, newline=None).readlines()
+    if len(raw_lines) == 0:
+        empty = [] if pages else ""
+        return empty if (targets is None) else {t:(empty if (t == "html") else "") for t in targets}
     if (verbose > 0): print(f"Read text with {len(raw_lines)} lines.")
     # Initialize the document build keyword arguments
     html_kwargs = {"frontmatter_title":TITLE, "frontmatter_description":DESCRIPTION,
@@ -1262,55 +3302,304 @@ def parse_txt(path_name, output_folder='.', verbose=1,
     # Add the formatted author block
     html_kwargs.update(FORMAT_AUTHORS())
     # If there is a title on the first line (minus '\n'), parse header
+    n_lines = len(raw_lines)
+    lines = None
     if (len(raw_lines) > 0) and (len(raw_lines[0][:-1]) > 0):
-        html_kwargs.update(parse_header(raw_lines))
+        lines = LineIndex("".join(raw_lines[:front_matter_size(raw_lines)]))
+        with trace_phase(trace, "header"):
+            html_kwargs.update(parse_header(raw_lines, lines))
+    # The number of lines in the header (before the body)
+    line_offset = n_lines - len(raw_lines)
+    memory_stage(memory, "lines")
 
     # ================================================================
-    # Initialize a syntax processor that does not have to close and
-    # captures all parts of the grammar
-    processor = Syntax()
-    processor.closed = False
-    processor.grammar = ALL_GRAMMAR
-    global FOUND_NOTE; FOUND_NOTE = False
     # Process the text into a heirarchical syntax format
     if (verbose > 0): print(f"Processing raw lines of text..")
-    # all_text = bytes(("".join(raw_lines) + EOF).encode("UTF-8"))
-    # all_text = MutableString("".join(raw_lines) + EOF)
-    all_text = "".join(raw_lines) + EOF
-    body, _, _ = processor.process(all_text, 0, verbose=(verbose > 1))
-    # Check for a bibliography at the end of the body
-    if type(body[-1]) == Bibliography:
-        html_kwargs["bibliography"] = body.pop(-1).render()
-    # Pop the appendix if there were no notes or bibliography
-    elif not FOUND_NOTE:
-        html_kwargs["appendix"] = ""
+    with trace_phase(trace, "parse"):
+        body, outline = parse_body(raw_lines, processes, verbose=(verbose > 1),
+                                   errors=errors, progress=(verbose > 0), trace=trace,
+                                   memory=memory, line_offset=line_offset)
+    if (verbose > 0) and errors:
+        print(f"Kept {len(errors)} unclosed syntax as text:")
+        for error in errors: print(" ", str(error).strip())
+    # Parse (or reuse) the text files included in the document
+    with trace_phase(trace, "includes"):
+        includes = text_includes(body)
+    memory_stage(memory, "includes")
+    found_note = outline.found_note or any(o.found_note for (_, o) in includes.values())
+    # Report jumps to headers (or captions) that do not exist
+    check_jumps(outline, includes, "".join(raw_lines), line_offset)
+    # Check for a bibliography at the end of the body, keep only the
+    # entries that are cited in the document (or included text files)
+    bibliography = body.pop(-1) if (type(body[-1]) == Bibliography) else None
+    cited = None
+    if (bibliography is not None) or (names != ["html"]):
+        cited = cited_keys([body] + [b for (b, _) in includes.values()])
+    # Paginated HTML is rendered by section (and the bibliography by page)
+    paged = pages and ("html" in names)
+    if ("html" in names) and (not paged):
+        if (bibliography is not None):
+            bibliography.cited = cited
+            html_kwargs["bibliography"] = bibliography.render(trace=trace)
+        # Pop the appendix if there were no notes or bibliography
+        elif not found_note:
+            html_kwargs["appendix"] = ""
     # Remove justification if it is not desired.
     if not justify: html_kwargs["justify"] = ""
-    if (verbose > 0): print(f"Rendering the HTML document..")
-    # Render the heirarchical syntax into HTML text
-    rendered_body, _ = Body().render(body, verbose=(verbose > 1))
-    html_kwargs.update({"body":rendered_body})
-    # Save the HTML document locally
+    if (verbose > 0): print(f"Rendering the {'HTML' if (targets is None) else ', '.join(names)} document..")
+    # Render the heirarchical syntax for every target (in one pass)
+    documents = {}
+    rendered = [n for n in names if (n != "html")] if paged else names
+    with trace_phase(trace, "render"):
+        if (len(rendered) > 0):
+            output, _ = Body().render(body, verbose=(verbose > 1), trace=trace,
+                                      renderer=target_renderer(rendered))
+            documents.update(zip(rendered, output if (len(rendered) > 1) else [output]))
+        if paged: sections = page_sections(body, page_size, trace=trace)
+    memory_stage(memory, "render")
+    # Build the documents of the targets other than HTML
+    if (names != ["html"]):
+        authors = [parse_author(lines.line(k)) for k in range(line_offset)
+                   if (lines.markers[k] == ":") and (lines.line(k)[1:2] == ":")]
+        front = {"title":html_kwargs["title"], "description":html_kwargs["description"],
+                 "authors":authors, "outline":outline, "citations":cited}
+        for name in names:
+            if (name != "html"): documents[name] = RENDERERS[name].document(documents[name], front)
+    if (include_cache is not None): save_include_cache(include_cache)
+    if paged:
+        # Format the parts of the document shared by all pages once
+        html_kwargs.update(body=PAGE_BODY, appendix=PAGE_APPENDIX, bibliography=PAGE_BIBLIOGRAPHY)
+        with trace_phase(trace, "html"):
+            head = HTML(use_local, resource_folder, verbose=(verbose > 0)).format( **html_kwargs )
+            documents["html"] = paginate(sections, head, page_name, APPENDIX if appendix else "",
+                                         bibliography, outline.table_of_contents() if toc else "")
+        memory_stage(memory, "html")
+        if (verbose > 0): print(f"Split the HTML document into {len(documents['html'])} pages.")
+        if minify:
+            with trace_phase(trace, "minify"):
+                documents["html"] = [minify_html(page) for page in documents["html"]]
+            memory_stage(memory, "minify")
+    elif ("html" in names):
+        rendered_body = documents["html"]
+        # Add the table of contents (of this document's headers)
+        if toc: rendered_body = outline.table_of_contents() + rendered_body
+        html_kwargs.update({"body":rendered_body})
+        # Return the HTML document (using formatted kwargs to insert text)
+        with trace_phase(trace, "html"):
+            html = HTML(use_local, resource_folder, verbose=(verbose > 0)).format( **html_kwargs )
+        memory_stage(memory, "html")
+        if minify:
+            with trace_phase(trace, "minify"):
+                minified = minify_html(html)
+            memory_stage(memory, "minify")
+            if (verbose > 0): print(f"Minified the HTML document from {len(html.encode())} to {len(minified.encode())} bytes.")
+            html = minified
+        documents["html"] = html
+    return documents["html"] if (targets is None) else documents
+
+# Given the (encoded) bytes of a document, return the bytes of its
+# HTML document (see `parse_string` for the keyword arguments).
+def parse_bytes(data, encoding="utf-8", **parse_kwargs):
+    return parse_string(data.decode(encoding), **parse_kwargs).encode(encoding)
+
+# Given a path to a text file, process that text file into an HTML
+# document format, save it as "<file name>.html" in "output_folder",
+# and (if "show" is True) open it in the default web browser. If
+# "compress_level" is given, a gzip compressed copy is saved as well
+# (see `save_html`). See `parse_string` for the other arguments, a
+# "memory" report also records reading and saving the file.
+# Returns the HTML. If "targets" are given, the output of every target
+# is saved as "<file name><extension of the target>" (for example,
+# ".html", ".text", and ".json") and {target: output} is returned.
+# If "pages" is True, the list of HTML pages is saved as
+# "<file name>.html", "<file name>.2.html", ... (see `save_pages`).
+def parse_txt(path_name, output_folder='.', verbose=1,
+              appendix=True, justify=False, use_local=USE_LOCAL,
+              resource_folder=RESOURCE_FOLDER, show=True,
+              include_cache=None, inline_limit=0, inline_html=False,
+              processes=1, errors=None, cache=None, trace=None,
+              minify=False, compress_level=None, memory=None, toc=False,
+              targets=None, pages=False, page_size=None):
+    # Trace the memory used by the conversion (if that was requested).
+    if (memory is not None) and (not memory.tracing):
+        with memory:
+            return parse_txt(path_name, output_folder, verbose=verbose, appendix=appendix,
+                             justify=justify, use_local=use_local,
+                             resource_folder=resource_folder, show=show,
+                             include_cache=include_cache, inline_limit=inline_limit,
+                             inline_html=inline_html, processes=processes, errors=errors,
+                             cache=cache, trace=trace, minify=minify,
+                             compress_level=compress_level, memory=memory, toc=toc,
+                             targets=targets, pages=pages, page_size=page_size)
+    if (verbose > 0): print(f"Processing '{path_name}'...")
+    with open(path_name) as f:
+        text = f.read()
+    memory_stage(memory, "read")
+    output = parse_string(text, verbose=verbose, appendix=appendix, justify=justify,
+                          use_local=use_local, resource_folder=resource_folder,
+                          include_cache=include_cache, inline_limit=inline_limit,
+                          inline_html=inline_html, processes=processes, errors=errors,
+                          cache=cache, trace=trace, minify=minify, memory=memory, toc=toc,
+                          targets=targets, pages=pages, page_size=page_size,
+                          page_name=os.path.basename(path_name))
+    output_file = save_targets(output, path_name, output_folder, verbose,
+                               compress_level, targets, pages)
+    memory_stage(memory, "save")
+    # Show the resulting file in the webbrowser (if appropriate).
+    if show and (output_file is not None): show_html(output_file, verbose)
+    if (verbose > 0) and (targets is None): print(f"Returning raw HTML as output.")
+    return output
+
+# Save the output of `parse_string` for the text file "path_name" in
+# "output_folder", the HTML (or its pages) and the output of every
+# other target (a dictionary {target: output} when "targets" is given).
+# Returns the output path of the HTML document (None if there is none).
+def save_targets(output, path_name, output_folder='.', verbose=1,
+                 compress_level=None, targets=None, pages=False):
+    documents = {"html":output} if (targets is None) else output
+    if all(len(document) == 0 for document in documents.values()): return None
+    output_file = None
+    for target, document in documents.items():
+        if (target == "html") and pages:
+            output_file = save_pages(document, path_name, output_folder, verbose, compress_level)
+        elif (target == "html"):
+            output_file = save_html(document, path_name, output_folder, verbose, compress_level)
+        else:
+            save_output(document, path_name, output_folder, RENDERERS[target].extension, verbose)
+    return output_file
+
+# Save the HTML document for the text file "path_name" as
+# "<file name>.html" in "output_folder", return the output path. If
+# "compress_level" (1 through 9) is given, the same contents are also
+# saved gzip compressed at that level as "<file name>.html.gz" (for
+# serving without compressing again).
+def save_html(html, path_name, output_folder='.', verbose=1, compress_level=None):
     if (verbose > 0): print(f"Saving the HTML document..")
     file_name = os.path.basename(path_name)
     output_file = os.path.join(os.path.abspath(output_folder), 
                                file_name + ".html")
-    html = HTML(use_local, resource_folder).format( **html_kwargs )
     with open(output_file, "w") as f:
         print(html, file=f)
+        encoding = f.encoding
     if (verbose > 0): print(f"Saved output in '{output_file}'.")
-    # Show the resulting file in the webbrowser (if appropriate).
-    if show: 
-        import webbrowser
-        if (verbose > 0): print(f"Opening " + "file://" + output_file + " in default web browser.")
-        webbrowser.open("file://" + output_file)
-    if (verbose > 0): print(f"Returning raw HTML as output.")
-    # Return the HTML document (using formatted kwargs to insert text)
+    if (compress_level is not None):
+        import gzip
+        contents = (html + "\n").encode(encoding)
+        compressed = gzip.compress(contents, compresslevel=compress_level, mtime=0)
+        with open(output_file + ".gz", "wb") as f:
+            f.write(compressed)
+        if (verbose > 0): print(f"Saved compressed output in '{output_file}.gz' ({len(contents)} to {len(compressed)} bytes).")
+    return output_file
+
+# Save the HTML pages of a paginated document for the text file
+# "path_name" as "<file name>.html", "<file name>.2.html", ... (the
+# names used by `page_file`) in "output_folder" (see `save_html`),
+# return the output path of the first page.
+def save_pages(pages, path_name, output_folder='.', verbose=1, compress_level=None):
+    output_files = [save_html(page, path_name + (f".{k+1}" if (k > 0) else ""),
+                              output_folder, verbose, compress_level)
+                    for (k, page) in enumerate(pages)]
+    return output_files[0]
+
+# Save the output of a (non-HTML) target for the text file "path_name"
+# as "<file name><extension>" in "output_folder", return the output path.
+def save_output(output, path_name, output_folder='.', extension=".text", verbose=1):
+    output_file = os.path.join(os.path.abspath(output_folder),
+                               os.path.basename(path_name) + extension)
+    with open(output_file, "w") as f:
+        f.write(output)
+    if (verbose > 0): print(f"Saved output in '{output_file}'.")
+    return output_file
+
+# Open a saved HTML document in the default web browser.
+def show_html(output_file, verbose=1):
+    import webbrowser
+    if (verbose > 0): print(f"Opening " + "file://" + output_file + " in default web browser.")
+    webbrowser.open("file://" + output_file)
+
+# ====================================================================
+#                    Asynchronous Conversion Functions
+# 
+# Versions of `parse_string` and `parse_txt` for use with asyncio.
+# The (CPU bound) conversion runs in "executor", either a thread or
+# a process pool from `concurrent.futures` (None uses the default
+# executor of the event loop). Files are read and written in the
+# default executor, so the event loop is never blocked by them.
+# 
+# A RenderCache ("cache") is used by the event loop itself, so it
+# works with process pools. Recovered "errors" (and a "trace") are
+# only collected when the conversion runs in a thread (not in another
+# process).
+
+# Convert the text of a document into HTML without blocking the loop.
+async def parse_string_async(text, executor=None, cache=None, **parse_kwargs):
+    import asyncio, functools
+    loop = asyncio.get_running_loop()
+    key = None
+    if ((cache is not None) and (parse_kwargs.get("errors") is None)
+        and (parse_kwargs.get("trace") is None) and (parse_kwargs.get("targets") is None)
+        and (not parse_kwargs.get("pages"))):
+        key = cache.key(text, **{k:v for (k,v) in parse_kwargs.items() if k in
+                                 {"use_local","resource_folder","justify","appendix",
+                                  "inline_limit","inline_html","minify","toc"}})
+        html = cache.get(key)
+        if (html is not None): return html
+    html = await loop.run_in_executor(
+        executor, functools.partial(parse_string, text, **parse_kwargs))
+    if (key is not None): cache.put(key, html)
     return html
 
+# Convert a text file into an HTML file (and the outputs of any other
+# "targets", see `save_targets`) without blocking the loop.
+async def parse_txt_async(path_name, output_folder='.', verbose=1, show=True,
+                          executor=None, cache=None, compress_level=None, **parse_kwargs):
+    import asyncio, functools
+    loop = asyncio.get_running_loop()
+    if (verbose > 0): print(f"Processing '{path_name}'...")
+    def read():
+        with open(path_name) as f: return f.read()
+    text = await loop.run_in_executor(None, read)
+    if parse_kwargs.get("pages"): parse_kwargs.setdefault("page_name", os.path.basename(path_name))
+    output = await parse_string_async(text, executor=executor, cache=cache,
+                                      verbose=verbose, **parse_kwargs)
+    output_file = await loop.run_in_executor(None, functools.partial(
+        save_targets, output, path_name, output_folder, verbose, compress_level,
+        parse_kwargs.get("targets"), parse_kwargs.get("pages")))
+    if show and (output_file is not None): show_html(output_file, verbose)
+    return output
+
+# Convert many text files into HTML files, running at most
+# "concurrency" conversions at a time (default is the number of CPUs).
+# Yields (path name, HTML) pairs in the order conversions complete. If
+# "return_exceptions" is True, then a failed conversion yields (path
+# name, exception), otherwise the exception is raised and all pending
+# conversions are cancelled.
+async def convert_many(path_names, output_folder='.', concurrency=None,
+                       executor=None, return_exceptions=False, **parse_kwargs):
+    import asyncio
+    parse_kwargs.setdefault("verbose", 0)
+    parse_kwargs.setdefault("show", False)
+    semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+    async def convert(path_name):
+        async with semaphore:
+            try:
+                return path_name, await parse_txt_async(
+                    path_name, output_folder, executor=executor, **parse_kwargs)
+            except Exception as error:
+                if return_exceptions: return path_name, error
+                raise
+    tasks = [asyncio.ensure_future(convert(path_name)) for path_name in path_names]
+    try:
+        for result in asyncio.as_completed(tasks):
+            yield await result
+    finally:
+        for task in tasks: task.cancel()
+
 
 DOC_STRING = __doc__
 
 # Define "all" the set of things that should be user-accessible 
 # outside this package.
-__all__ = [parse_txt, DOC_STRING]
+__all__ = ["parse_txt", "parse_string", "parse_bytes", "extract_metadata", "RenderCache",
+           "Trace", "MemoryReport", "Renderer", "parse_txt_async", "parse_string_async",
+           "convert_many", "DOC_STRING"]